@@ -0,0 +1,250 @@
+"""
+Cazador archive expansion module.
+
+Archives are opened as streams and their members read one at a time into
+memory, so nothing is extracted to disk. Nested archives are expanded in turn.
+Limits on nesting depth, member count, member size and the overall expansion
+ratio guard against archive bombs.
+
+Supported formats are zip, tar (plain, gzip, bzip2 and xz compressed) and
+single file gzip. Documents stored as zip files, such as Office Open XML,
+OpenDocument, EPUB and Java archives, are left whole for Tika, which extracts
+their text far better than their loose XML and binary members.
+
+Created: 10/19/2026
+"""
+
+import io
+import gzip
+import zlib
+import tarfile
+import zipfile
+import logging
+logger = logging.getLogger(__name__)
+
+ZIP, TAR, GZIP = "zip", "tar", "gzip"
+
+# Separator between an archive path and the path of a member within it
+MEMBER_SEPARATOR = "!"
+
+# Extensions of documents stored as zip files
+DOCUMENT_EXTENSIONS = (".docx", ".docm", ".dotx", ".dotm", ".xlsx", ".xlsm", ".xltx", ".xltm",
+                       ".pptx", ".pptm", ".potx", ".ppsx", ".vsdx", ".odt", ".ods", ".odp",
+                       ".odg", ".ott", ".ots", ".otp", ".epub", ".jar", ".war", ".ear", ".apk")
+
+# Members marking a zip file as a document whatever its extension
+DOCUMENT_MEMBERS = frozenset(["[Content_Types].xml", "mimetype", "META-INF/MANIFEST.MF",
+                              "AndroidManifest.xml"])
+
+
+class ArchiveLimits:
+    """Limits applied while expanding a single archive, including its nested archives."""
+
+    def __init__(self, max_depth=3, max_members=10000, max_ratio=100.0,
+                 max_member_size=64 * 1024 * 1024):
+        """
+        Initialize the limits.
+
+        Args:
+            max_depth (int): <Optional> Levels of nested archives to expand.
+            max_members (int): <Optional> Members read from an archive and its nested archives.
+            max_ratio (float): <Optional> Largest total expanded size as a multiple of the archive size.
+            max_member_size (int): <Optional> Largest member read in bytes.
+        """
+        self.max_depth = max_depth
+        self.max_members = max_members
+        self.max_ratio = max_ratio
+        self.max_member_size = max_member_size
+
+
+class LimitExceeded(Exception):
+    """Raised when an archive exceeds one of its expansion limits."""
+    pass
+
+
+def detect_archive(head):
+    """
+    Detect the archive format from the leading bytes of a file.
+
+    Args:
+        head (bytes): At least the first 512 bytes of the file, when available.
+
+    Returns:
+        ZIP, TAR, GZIP or None if the content isn't an archive.
+    """
+    if head.startswith(b"PK\x03\x04") or head.startswith(b"PK\x05\x06"):
+        return ZIP
+    if len(head) >= 262 and head[257:262] == b"ustar":
+        return TAR
+    if head.startswith(b"\x1f\x8b"):
+        # A gzip stream holding a tar archive is expanded as a tar
+        try:
+            inner = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(head, 512)
+        except zlib.error:
+            return GZIP
+        return TAR if inner[257:262] == b"ustar" else GZIP
+    if head.startswith(b"BZh") or head.startswith(b"\xfd7zXZ\x00"):
+        # Only tar archives are expanded within bzip2 and xz streams
+        return TAR
+    return None
+
+
+def is_document_zip(fileobj, name=None):
+    """
+    Check whether a zip file is a document, such as a docx or odt, rather than an archive.
+
+    Args:
+        fileobj (file): Seekable binary file object of the zip file. It is left at the start.
+        name (str): <Optional> Path of the file, checked for a document extension.
+    """
+    if name and name.rsplit(MEMBER_SEPARATOR, 1)[-1].lower().endswith(DOCUMENT_EXTENSIONS):
+        return True
+    try:
+        # Only the central directory is read
+        with zipfile.ZipFile(fileobj) as zf:
+            return any(x in DOCUMENT_MEMBERS for x in zf.namelist())
+    except (zipfile.BadZipFile, OSError, ValueError):
+        return False
+    finally:
+        fileobj.seek(0)
+
+
+def detect_expandable(fileobj, name=None):
+    """
+    Detect the archive format of a file, leaving zip based documents unexpanded.
+
+    Args:
+        fileobj (file): Seekable binary file object positioned at the start of the file.
+        name (str): <Optional> Path of the file.
+
+    Returns:
+        ZIP, TAR, GZIP or None if the file isn't an archive to expand.
+    """
+    head = fileobj.read(1024)
+    fileobj.seek(0)
+    kind = detect_archive(head)
+    if kind == ZIP and is_document_zip(fileobj, name):
+        return None
+    return kind
+
+
+class _Expansion:
+    """Running totals of a single top level archive expansion."""
+
+    def __init__(self, limits, size):
+        self.limits = limits
+        self.max_bytes = max(1, size) * limits.max_ratio
+        self.members = 0
+        self.bytes = 0
+
+    def read(self, stream, name, declared=None):
+        """Read a member, enforcing the member count, size and expansion ratio."""
+        self.members += 1
+        if self.members > self.limits.max_members:
+            raise LimitExceeded("more than {} members".format(self.limits.max_members))
+
+        budget = self.max_bytes - self.bytes
+        if declared is not None and declared > budget:
+            raise LimitExceeded("expanded beyond {}x the archive size".format(
+                self.limits.max_ratio))
+
+        if declared is not None and declared > self.limits.max_member_size:
+            logger.warning("Skipping archive member {} of {} bytes".format(name, declared))
+            return None
+
+        # Never read past the limits, whatever size the member claims to be
+        data = stream.read(int(min(self.limits.max_member_size, budget)) + 1)
+        self.bytes += len(data)
+        if self.bytes > self.max_bytes:
+            raise LimitExceeded("expanded beyond {}x the archive size".format(
+                self.limits.max_ratio))
+
+        if len(data) > self.limits.max_member_size:
+            logger.warning("Skipping archive member {} larger than {} bytes".format(
+                name, self.limits.max_member_size))
+            return None
+        return data
+
+
+def _iter_zip(fileobj, prefix, expansion, depth):
+    with zipfile.ZipFile(fileobj) as zf:
+        for info in zf.infolist():
+            if info.is_dir():
+                continue
+            name = prefix + MEMBER_SEPARATOR + info.filename
+            with zf.open(info) as f:
+                data = expansion.read(f, name, info.file_size)
+            if data is not None:
+                yield from _expand_member(name, data, expansion, depth)
+
+
+def _iter_tar(fileobj, prefix, expansion, depth):
+    # Stream mode reads members in order without seeking
+    with tarfile.open(fileobj=fileobj, mode="r|*") as tf:
+        for member in tf:
+            if not member.isfile():
+                continue
+            name = prefix + MEMBER_SEPARATOR + member.name
+            data = expansion.read(tf.extractfile(member), name, member.size)
+            if data is not None:
+                yield from _expand_member(name, data, expansion, depth)
+
+
+def _iter_gzip(fileobj, prefix, expansion, depth):
+    base = prefix.rsplit(MEMBER_SEPARATOR, 1)[-1].rsplit('/', 1)[-1]
+    inner = base[:-3] if base.lower().endswith(".gz") else base
+    name = prefix + MEMBER_SEPARATOR + inner
+    with gzip.GzipFile(fileobj=fileobj) as f:
+        data = expansion.read(f, name)
+    if data is not None:
+        yield from _expand_member(name, data, expansion, depth)
+
+
+_EXPANDERS = {ZIP: _iter_zip, TAR: _iter_tar, GZIP: _iter_gzip}
+
+
+def _expand_member(name, data, expansion, depth):
+    """Yield a member, or the members within it if it is a nested archive."""
+    kind = detect_archive(data[:1024])
+    if kind == ZIP and is_document_zip(io.BytesIO(data), name):
+        kind = None
+    if kind and depth < expansion.limits.max_depth:
+        count = 0
+        try:
+            for member in _EXPANDERS[kind](io.BytesIO(data), name, expansion, depth + 1):
+                count += 1
+                yield member
+            return
+        except LimitExceeded:
+            raise
+        except Exception as ex:
+            logger.warning("Unable to expand nested archive {}. {}".format(name, ex))
+            if count:
+                return
+    yield name, data
+
+
+def iter_members(fileobj, name, size, limits=None):
+    """
+    Yield every member of an archive, expanding nested archives.
+
+    Args:
+        fileobj (file): Binary file object positioned at the start of the archive.
+        name (str): Path reported for the archive. Members are reported as name!member.
+        size (int): Size of the archive in bytes, used for the expansion ratio.
+        limits (ArchiveLimits): <Optional> Expansion limits.
+
+    Returns:
+        Generator of (member path, member bytes). Nothing is yielded if the file
+        isn't an archive or is a zip based document.
+
+    Raises:
+        LimitExceeded: The archive exceeded an expansion limit. Members yielded
+                       before the limit was reached are still valid.
+    """
+    limits = limits or ArchiveLimits()
+    kind = detect_expandable(fileobj, name)
+    if not kind or limits.max_depth < 1:
+        return
+
+    yield from _EXPANDERS[kind](fileobj, name, _Expansion(limits, size), 1)
@@ -0,0 +1,281 @@
+"""
+Core module for the asynchronous External File Service Interface.
+
+This module defines the asyncio counterpart of fileServiceInterface. Handlers
+implementing it keep their requests in flight on a single event loop so a scan
+can hold hundreds of concurrent requests open without a thread for each one.
+
+A thread offload shim is provided for handlers that only offer a blocking
+implementation.
+
+Created: 10/19/2026
+"""
+
+import time
+import asyncio
+import logging
+import cazscan
+from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from cazscan import (create_unique_temp_name, scan_cached, scan_downloaded, remove_temp_file,
+                     finish_item)
+from checkpoint import NullCheckpoint
+from metrics import metrics, LIST, SNIFF, DOWNLOAD
+logger = logging.getLogger(__name__)
+
+
+class asyncFileServiceInterface(metaclass=ABCMeta):
+    """Asynchronous External File Service Interface.
+
+    Initializers for derived classes are required to accept the following arguments:
+        handler (fileServiceInterface): Configured blocking handler for the same service.
+        concurrency (int): Maximum number of requests in flight at once.
+    """
+
+    checkpoint = NullCheckpoint()
+    # Only files owned by this shard are scanned when set (see sharding.Shard)
+    shard = None
+    # Matches are aggregated instead of reported when set (see summary.MatchSummary)
+    summary = None
+    # Hash crawls of find_file also report files listed in this ioc.IOCStore when set
+    iocs = None
+
+    @staticmethod
+    @abstractmethod
+    def get_service_type():
+        """Return a string id for the file service type handled."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def describe_file(self, item):
+        """
+        Describe a listed file without making any additional service requests.
+
+        Args:
+            item (object): Service specific file entry returned by list_files.
+
+        Returns:
+            cazobject.CazFile
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_files(self):
+        """
+        Walk the configured locations of the service.
+
+        Returns:
+            Async generator of the service specific file entries to scan.
+        """
+        raise NotImplementedError
+
+    async def read_head(self, item, size):
+        """
+        Read the leading bytes of a listed file without downloading all of it.
+
+        Returns:
+            Up to size bytes from the start of the file, or None if it can't be read in part.
+        """
+        raise NotImplementedError
+
+    async def sniff_item(self, item, info):
+        """Read the leading bytes of a listed file and decide whether to download and scan it."""
+        if not cazscan.should_sniff(info):
+            return True
+
+        service_type = self.get_service_type()
+        start = time.monotonic()
+        try:
+            head = await self.read_head(item, cazscan.sniff_size)
+        except NotImplementedError:
+            return True
+        except Exception as ex:
+            metrics.observe(SNIFF, service_type, time.monotonic() - start, error=True)
+            logger.debug("Unable to sniff file {}. {}".format(info.name, ex))
+            return True
+        if head is None:
+            return True
+        return cazscan.sniff_content(service_type, info, head, time.monotonic() - start)
+
+    @abstractmethod
+    async def download_file(self, item, f_path):
+        """
+        Download the contents of a listed file.
+
+        Args:
+            item (object): Service specific file entry returned by list_files.
+            f_path (str): Local path to write the file contents to.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def find_file(self, name=None, md5=None, sha1=None):
+        """
+        Search for a file by name or hash.
+
+        Args:
+            name (string): Filename to find.
+            md5 (string): MD5 hash of the file to find.
+            sha1 (string): SHA1 hash of the file to find.
+
+        Returns:
+            List of CazFile objects matching the request parameters.
+        """
+        raise NotImplementedError
+
+    def checkpoint_key(self, item):
+        """Return a key identifying a listed file within the checkpoint."""
+        return self.describe_file(item).file_id
+
+    async def close(self):
+        """Release any sessions held by the handler."""
+        pass
+
+    async def scan_item(self, item, temp_dir, expressions):
+        """
+        Download a single listed file and search its contents.
+
+        The content extraction is blocking so it is offloaded to the default executor.
+
+        Returns:
+            List of CazRegMatch entries reported against the file's service path.
+        """
+        service_type = self.get_service_type()
+        info = self.describe_file(item)
+        metrics.observe(LIST, service_type, items=1)
+        loop = asyncio.get_event_loop()
+        matches = await loop.run_in_executor(None, scan_cached, service_type, info, expressions)
+        if matches is not None:
+            return finish_item(self, self.checkpoint_key(item), matches)
+
+        if not await self.sniff_item(item, info):
+            return finish_item(self, self.checkpoint_key(item), [])
+
+        f_path = create_unique_temp_name(temp_dir, info.file_id, info.name)
+        try:
+            await self.download_file(item, f_path)
+        except Exception as ex:
+            metrics.observe(DOWNLOAD, service_type, error=True)
+            logger.error("Unable to download file {}. {}".format(info.name, ex))
+            remove_temp_file(f_path, service_type)
+            return finish_item(self, self.checkpoint_key(item), [])
+
+        matches = await loop.run_in_executor(None,
+                                             scan_downloaded,
+                                             service_type,
+                                             info,
+                                             f_path,
+                                             expressions)
+        return finish_item(self, self.checkpoint_key(item), matches)
+
+    async def scan_files(self, temp_dir, expressions):
+        """
+        Scan all files for any content matches.
+
+        Listing continues while earlier files are downloading. The number of
+        files in flight is capped by the handler concurrency.
+
+        Args:
+            temp_dir (str): Path to the temporary directory to hold files for comparison
+            expressions (CazRegExp[]): List of regular expressions for content comparison
+        """
+        matches = []
+        in_flight = asyncio.Semaphore(self.concurrency)
+
+        async def run(item):
+            try:
+                matches.extend(await self.scan_item(item, temp_dir, expressions))
+            finally:
+                in_flight.release()
+
+        tasks = []
+        async for item in self.list_files():
+            if self.shard and not self.shard.owns(self.checkpoint_key(item)):
+                continue
+            await in_flight.acquire()
+            tasks.append(asyncio.ensure_future(run(item)))
+
+        if tasks:
+            await asyncio.gather(*tasks)
+
+        return matches
+
+
+class asyncThreadHandler(asyncFileServiceInterface):
+    """Offload a blocking fileServiceInterface handler onto a thread pool.
+
+    This lets handlers without a native asynchronous implementation take part
+    in an asyncio scan. Concurrency is still bounded by the number of threads.
+    """
+
+    def __init__(self, handler, concurrency=32):
+        """
+        Initialize the shim around a configured blocking handler.
+
+        Args:
+            handler (fileServiceInterface): Handler to offload.
+            concurrency (int): Number of worker threads to offload onto.
+        """
+        self.handler = handler
+        self.concurrency = concurrency
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def get_service_type(self):
+        """Return the type of file service handled by the wrapped handler."""
+        return self.handler.get_service_type()
+
+    async def _offload(self, func, *args, **kwargs):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, lambda: func(*args, **kwargs))
+
+    @property
+    def checkpoint(self):
+        """Checkpoint the wrapped handler records its listing progress with."""
+        return self.handler.checkpoint
+
+    @property
+    def summary(self):
+        """Summary the wrapped handler aggregates its matches into."""
+        return self.handler.summary
+
+    @property
+    def iocs(self):
+        """IOC store the wrapped handler checks listed hashes against."""
+        return self.handler.iocs
+
+    def checkpoint_key(self, item):
+        """Return the checkpoint key of a listed file using the wrapped handler."""
+        return self.handler.checkpoint_key(item)
+
+    def describe_file(self, item):
+        """Describe a listed file using the wrapped handler."""
+        return self.handler.describe_file(item)
+
+    async def list_files(self):
+        """Pull the blocking listing generator one entry at a time on the thread pool.
+
+        Entries are ordered by the wrapped handler's priority scheduler, if one is attached.
+        """
+        items = iter(self.handler.schedule(self.handler.list_files()))
+        finished = object()
+        while True:
+            item = await self._offload(next, items, finished)
+            if item is finished:
+                break
+            yield item
+
+    async def read_head(self, item, size):
+        """Read the leading bytes of a listed file on the thread pool."""
+        return await self._offload(self.handler.read_head, item, size)
+
+    async def download_file(self, item, f_path):
+        """Download a listed file on the thread pool."""
+        await self._offload(self.handler.download_file, item, f_path)
+
+    async def find_file(self, name=None, md5=None, sha1=None):
+        """Run the blocking find on the thread pool."""
+        return await self._offload(self.handler.find_file, name=name, md5=md5, sha1=sha1)
+
+    async def close(self):
+        """Shut down the worker threads."""
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,513 @@
+"""
+Native asyncio handlers for the supported cloud services.
+
+Each handler speaks the service REST API directly through a shared aiohttp
+session, reusing the credentials of an already configured blocking handler.
+The blocking SDKs are only used for authentication.
+
+Created: 10/19/2026
+"""
+
+import os
+import json
+import asyncio
+import logging
+import xml.etree.ElementTree as ElementTree
+from urllib.parse import quote
+from asyncfileservice import asyncFileServiceInterface, asyncThreadHandler
+from cazobjects import CazFile
+from ratelimit import LIST, SEARCH, DOWNLOAD
+from connections import register_pool
+logger = logging.getLogger(__name__)
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# Size of the chunks written to disk while streaming a download
+CHUNK_SIZE = 1024 * 1024
+
+
+class asyncHTTPHandler(asyncFileServiceInterface):
+    """Common session handling for handlers backed by aiohttp."""
+
+    def __init__(self, handler, concurrency=500):
+        """
+        Initialize the handler around a configured blocking handler.
+
+        Args:
+            handler (fileServiceInterface): Configured handler providing credentials.
+            concurrency (int): Maximum number of requests in flight at once.
+        """
+        if aiohttp is None:
+            raise ImportError("aiohttp is required for asynchronous {} access".format(
+                handler.get_service_type()))
+
+        self.handler = handler
+        self.concurrency = concurrency
+        self._session = None
+
+    @property
+    def session(self):
+        """Lazily create the pooled session on the running event loop."""
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector)
+            register_pool("async_" + self.get_service_type().lower(),
+                          lambda: {"maxsize": connector.limit,
+                                   "in_use": len(connector._acquired)})
+        return self._session
+
+    async def close(self):
+        """Close the pooled session."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _request(self, endpoint, method, url, read="json", f_path=None, **kwargs):
+        """
+        Make a request through the handler's request scheduler.
+
+        Args:
+            endpoint (str): Endpoint class of the request (list, search, download).
+            method (str): HTTP method.
+            url (str): Request URL.
+            read (str): <Optional> Read the body as 'json' or 'bytes'.
+            f_path (str): <Optional> Stream the body to this local path instead.
+            kwargs: Additional aiohttp request arguments.
+
+        Returns:
+            The decoded response body, or None when streamed to a file.
+        """
+        async def send():
+            async with self.session.request(method, url, **kwargs) as resp:
+                # Throttle responses surface as ClientResponseError for the scheduler
+                resp.raise_for_status()
+                if f_path:
+                    with open(f_path, 'wb') as f:
+                        async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                            f.write(chunk)
+                    return None
+                if read == "bytes":
+                    return await resp.read()
+                return await resp.json(content_type=None)
+
+        return await self.handler.scheduler.call_async(endpoint, send)
+
+
+class asyncAmazonS3Handler(asyncHTTPHandler):
+    """Amazon S3 handler signing REST requests with the botocore SigV4 signer."""
+
+    S3_NS = "{http://s3.amazonaws.com/doc/2006-03-01/}"
+
+    def __init__(self, handler, concurrency=500):
+        """Initialize from a configured amazonS3Handler."""
+        super(asyncAmazonS3Handler, self).__init__(handler, concurrency)
+        from botocore.credentials import Credentials
+        self.credentials = Credentials(handler.access_key_id, handler.secret_key)
+
+    @staticmethod
+    def get_service_type():
+        """Return the type of file service (Amazon)."""
+        return "AmazonS3"
+
+    def _signed_headers(self, method, url):
+        from botocore.auth import S3SigV4Auth
+        from botocore.awsrequest import AWSRequest
+        request = AWSRequest(method=method, url=url)
+        S3SigV4Auth(self.credentials, "s3", self.handler.region).add_auth(request)
+        return dict(request.headers.items())
+
+    def _bucket_url(self, bucket):
+        return "https://{}.s3.{}.amazonaws.com".format(bucket, self.handler.region)
+
+    def checkpoint_key(self, item):
+        """Return the bucket qualified key of a listed object, matching amazonS3Handler."""
+        return "{}/{}".format(item['bucket'], item['key'])
+
+    def describe_file(self, item):
+        """Describe a listed object entry."""
+        return CazFile(item['key'],
+                       os.path.basename(item['key']),
+                       item['bucket'],
+                       md5=item['etag'],
+                       path=item['key'],
+                       size=item['size'],
+                       modified=item['modified'])
+
+    async def _list_bucket(self, bucket):
+        token = None
+        while True:
+            url = "{}/?list-type=2".format(self._bucket_url(bucket))
+            if token:
+                url += "&continuation-token={}".format(quote(token, safe=''))
+            body = await self._request(LIST, "GET", url,
+                                       read="bytes",
+                                       headers=self._signed_headers("GET", url))
+            root = ElementTree.fromstring(body)
+
+            for c in root.iter(self.S3_NS + "Contents"):
+                yield {'bucket': bucket,
+                       'key': c.findtext(self.S3_NS + "Key"),
+                       'etag': c.findtext(self.S3_NS + "ETag", "").strip('"'),
+                       'size': int(c.findtext(self.S3_NS + "Size", "0")),
+                       'modified': c.findtext(self.S3_NS + "LastModified")}
+
+            if root.findtext(self.S3_NS + "IsTruncated") != "true":
+                break
+            token = root.findtext(self.S3_NS + "NextContinuationToken")
+
+    async def list_files(self):
+        """Yield every object in the configured buckets."""
+        for b in self.handler.buckets:
+            async for item in self._list_bucket(b):
+                if item['key'].endswith('/') and not item['size']:
+                    # Skip folder placeholders
+                    continue
+                yield item
+
+    async def download_file(self, item, f_path):
+        """Stream an object to a local path."""
+        url = "{}/{}".format(self._bucket_url(item['bucket']), quote(item['key']))
+        await self._request(DOWNLOAD, "GET", url,
+                            f_path=f_path,
+                            headers=self._signed_headers("GET", url))
+
+    async def read_head(self, item, size):
+        """Read the leading bytes of an object with a ranged GET."""
+        url = "{}/{}".format(self._bucket_url(item['bucket']), quote(item['key']))
+        headers = self._signed_headers("GET", url)
+        headers["Range"] = "bytes=0-{}".format(size - 1)
+        return (await self._request(DOWNLOAD, "GET", url, read="bytes", headers=headers))[:size]
+
+    async def find_file(self, name=None, md5=None, sha1=None):
+        """Find files by key substring, ETag or listed IOC across the configured buckets."""
+        md5 = md5.lower() if md5 else None
+        sha1 = sha1.lower() if sha1 else None
+        matches = []
+        async for item in self.list_files():
+            if (name and name in item['key']) or \
+                    (md5 and item['etag'] == md5) or \
+                    (sha1 and item['etag'] == sha1) or \
+                    (self.iocs is not None and self.iocs.contains(item['etag'])):
+                matches.append(self.describe_file(item))
+
+        return matches
+
+
+class asyncDropboxHandler(asyncHTTPHandler):
+    """Dropbox handler using the v2 HTTP API."""
+
+    API_URL = "https://api.dropboxapi.com/2"
+    CONTENT_URL = "https://content.dropboxapi.com/2"
+
+    @staticmethod
+    def get_service_type():
+        """Return the type of file service (Dropbox)."""
+        return "Dropbox"
+
+    def _headers(self):
+        return {"Authorization": "Bearer {}".format(self.handler.access_token)}
+
+    async def _rpc(self, endpoint, route, args):
+        return await self._request(endpoint, "POST", "{}/{}".format(self.API_URL, route),
+                                   json=args,
+                                   headers=self._headers())
+
+    def describe_file(self, item):
+        """Describe a listed file metadata entry."""
+        return CazFile(item['id'],
+                       item['name'],
+                       item.get('parent_shared_folder_id', None),
+                       path=item.get('path_display', None),
+                       size=item.get('size', None),
+                       modified=item.get('server_modified', None),
+                       content_hash=item.get('content_hash', None))
+
+    async def _list_folder(self, path):
+        res = await self._rpc(LIST, "files/list_folder", {"path": path,
+                                                          "recursive": True,
+                                                          "limit": self.handler.list_limit})
+        while True:
+            for x in res['entries']:
+                if x.get('.tag') == 'file':
+                    yield x
+            if not res['has_more']:
+                break
+            res = await self._rpc(LIST, "files/list_folder/continue", {"cursor": res['cursor']})
+
+    async def list_files(self):
+        """Yield every file in the configured folders."""
+        for f in self.handler.folders:
+            try:
+                async for x in self._list_folder(f):
+                    yield x
+            except Exception as ex:
+                logger.error("Unable to process folder {}. {}".format(f, ex))
+
+    async def download_file(self, item, f_path):
+        """Stream a file to a local path."""
+        headers = self._headers()
+        headers["Dropbox-API-Arg"] = json.dumps({"path": item['path_lower']})
+        await self._request(DOWNLOAD, "POST", "{}/files/download".format(self.CONTENT_URL),
+                            f_path=f_path,
+                            headers=headers)
+
+    async def read_head(self, item, size):
+        """Read the leading bytes of a file with a ranged download."""
+        headers = self._headers()
+        headers["Dropbox-API-Arg"] = json.dumps({"path": item['path_lower']})
+        headers["Range"] = "bytes=0-{}".format(size - 1)
+        return (await self._request(DOWNLOAD, "POST", "{}/files/download".format(self.CONTENT_URL),
+                                    read="bytes",
+                                    headers=headers))[:size]
+
+    async def find_file(self, name=None, md5=None, sha1=None):
+        """Search every configured folder by name at once."""
+        if not name and self.iocs is not None:
+            logger.error("Dropbox does not report MD5 or SHA1 hashes to check IOCs against.")
+            return []
+
+        if not name and (md5 or sha1):
+            raise ValueError("Dropbox does not support hash only searching.")
+
+        async def search_folder(f):
+            found = []
+            start = 0
+            while True:
+                res = await self._rpc(SEARCH, "files/search", {"path": f,
+                                                               "query": name,
+                                                               "start": start})
+                for m in res['matches']:
+                    found.append(self.describe_file(m['metadata']))
+                if not res['more']:
+                    break
+                start = res['start']
+            return found
+
+        matches = []
+        for found in await asyncio.gather(*[search_folder(f) for f in self.handler.folders]):
+            matches.extend(found)
+        return matches
+
+
+class asyncBoxHandler(asyncHTTPHandler):
+    """Box handler using the 2.0 HTTP API."""
+
+    API_URL = "https://api.box.com/2.0"
+
+    @staticmethod
+    def get_service_type():
+        """Return the type of file service (Box)."""
+        return "Box"
+
+    def _headers(self):
+        return {"Authorization": "Bearer {}".format(self.handler.oauth.access_token)}
+
+    async def _get(self, endpoint, route, params):
+        return await self._request(endpoint, "GET", "{}/{}".format(self.API_URL, route),
+                                   params=params,
+                                   headers=self._headers())
+
+    def describe_file(self, item):
+        """Describe a listed file entry."""
+        return CazFile(item['id'],
+                       item['name'],
+                       None,
+                       sha1=item.get('sha1', None),
+                       path=item['name'],
+                       size=item.get('size', None),
+                       modified=item.get('modified_at', None))
+
+    async def _folder_ids(self):
+        loop = asyncio.get_event_loop()
+        folders = await loop.run_in_executor(None, self.handler._build_folder_list)
+        return [x._object_id for x in folders]
+
+    async def list_files(self):
+        """Walk the configured folders listing each folder level concurrently."""
+        limit = 1000
+        processed = set()
+        pending = await self._folder_ids()
+
+        async def list_folder(fid):
+            items = []
+            offset = 0
+            while True:
+                res = await self._get(LIST,
+                                      "folders/{}/items".format(fid),
+                                      {"limit": limit,
+                                       "offset": offset,
+                                       "fields": "id,type,name,sha1,size,modified_at"})
+                entries = res.get('entries', [])
+                items.extend(entries)
+                if len(entries) < limit:
+                    return items
+                offset += limit
+
+        while pending:
+            level = [x for x in set(pending) if x not in processed]
+            processed.update(level)
+            pending = []
+            for res in await asyncio.gather(*[list_folder(x) for x in level],
+                                            return_exceptions=True):
+                if isinstance(res, Exception):
+                    logger.error("Unable to process folder. {}".format(res))
+                    continue
+                for x in res:
+                    if x['type'] == 'folder':
+                        pending.append(x['id'])
+                    elif x['type'] == 'file':
+                        yield x
+
+    async def download_file(self, item, f_path):
+        """Stream a file to a local path."""
+        await self._request(DOWNLOAD, "GET", "{}/files/{}/content".format(self.API_URL, item['id']),
+                            f_path=f_path,
+                            headers=self._headers())
+
+    async def read_head(self, item, size):
+        """Read the leading bytes of a file with a byte range request."""
+        headers = self._headers()
+        headers["Range"] = "bytes=0-{}".format(size - 1)
+        return (await self._request(DOWNLOAD, "GET", "{}/files/{}/content".format(self.API_URL, item['id']),
+                                    read="bytes",
+                                    headers=headers))[:size]
+
+    async def find_file(self, name=None, md5=None, sha1=None):
+        """Find files by name search and/or a SHA1 walk."""
+        matches = []
+        if name:
+            folder_ids = ",".join(await self._folder_ids())
+            res = await self._get(SEARCH, "search", {"query": name,
+                                                     "limit": 200,
+                                                     "ancestor_folder_ids": folder_ids})
+            matches.extend(self.describe_file(x) for x in res.get('entries', []))
+
+        if sha1 or self.iocs is not None:
+            async for x in self.list_files():
+                if (sha1 and x.get('sha1', None) == sha1) or \
+                        (self.iocs is not None and self.iocs.contains(x.get('sha1', None))):
+                    matches.append(self.describe_file(x))
+
+        return matches
+
+
+class asyncGoogleDriveHandler(asyncHTTPHandler):
+    """Google Drive handler using the v3 HTTP API."""
+
+    API_URL = "https://www.googleapis.com/drive/v3/files"
+    FIELDS = ("nextPageToken, files(id, name, kind, mimeType, md5Checksum, parents, shared,"
+              " size, modifiedTime)")
+
+    @staticmethod
+    def get_service_type():
+        """Return the type of file service (Google Drive)."""
+        return "GoogleDrive"
+
+    async def _headers(self):
+        credentials = self.handler.credentials
+        if credentials.access_token_expired:
+            import httplib2
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, credentials.refresh, httplib2.Http())
+        return {"Authorization": "Bearer {}".format(credentials.access_token)}
+
+    def describe_file(self, item):
+        """Describe a listed file entry."""
+        return self.handler.describe_file(item)
+
+    async def _query(self, query):
+        page = ""
+        while page is not None:
+            params = {"pageSize": 1000, "q": query, "fields": self.FIELDS, "spaces": "drive"}
+            if page:
+                params["pageToken"] = page
+            res = await self._request(LIST, "GET", self.API_URL,
+                                      params=params,
+                                      headers=await self._headers())
+
+            for item in res.get('files', []):
+                yield item
+            page = res.get('nextPageToken', None)
+
+    async def list_files(self):
+        """Yield every unshared file entry visible to the account."""
+        async for item in self._query(""):
+            if item.get('mimeType') == self.handler.FOLDER_MIME:
+                continue
+            shared = item.get('shared', None)
+            if shared is None or shared:
+                continue
+            if item.get('id', None) and item.get('name', None):
+                yield item
+
+    async def download_file(self, item, f_path):
+        """Stream a file to a local path."""
+        await self._request(DOWNLOAD, "GET", "{}/{}".format(self.API_URL, item['id']),
+                            f_path=f_path,
+                            params={"alt": "media"},
+                            headers=await self._headers())
+
+    async def read_head(self, item, size):
+        """Read the leading bytes of a file with a ranged media request."""
+        if 'size' not in item:
+            # Google documents have no stored content to read
+            return None
+        headers = await self._headers()
+        headers["Range"] = "bytes=0-{}".format(size - 1)
+        return (await self._request(DOWNLOAD, "GET", "{}/{}".format(self.API_URL, item['id']),
+                                    read="bytes",
+                                    params={"alt": "media"},
+                                    headers=headers))[:size]
+
+    async def find_file(self, name=None, md5=None, sha1=None):
+        """Find files by name query and/or an MD5 walk."""
+        matches = []
+        if name:
+            async for item in self._query("name contains '{}'".format(name)):
+                matches.append(self.describe_file(item))
+
+        if md5 or self.iocs is not None:
+            async for item in self._query(""):
+                check = item.get('md5Checksum', None)
+                if (md5 and check == md5) or (self.iocs is not None and self.iocs.contains(check)):
+                    matches.append(self.describe_file(item))
+
+        return matches
+
+
+# Native handlers by service type
+knownAsyncServices = [asyncAmazonS3Handler,
+                      asyncDropboxHandler,
+                      asyncBoxHandler,
+                      asyncGoogleDriveHandler]
+
+
+def get_async_service(handler, concurrency=500, native=True):
+    """
+    Wrap a configured blocking handler with its asynchronous counterpart.
+
+    Services without a native handler, or environments without aiohttp, fall
+    back to offloading the blocking handler onto threads. The handler's request
+    scheduler is allowed as many requests in flight as the concurrency asked for.
+
+    Args:
+        handler (fileServiceInterface): Configured blocking handler.
+        concurrency (int): Maximum number of requests in flight at once.
+        native (bool): <Optional> Use the native handler when there is one. Pass False when the
+                       handler is configured with features only the blocking handler supports.
+
+    Returns:
+        asyncFileServiceInterface
+    """
+    if native and aiohttp is not None:
+        for srv in knownAsyncServices:
+            if srv.get_service_type().lower() == handler.get_service_type().lower():
+                scheduler = getattr(handler, 'scheduler', None)
+                if scheduler is not None:
+                    scheduler.ensure_concurrency(concurrency)
+                return srv(handler, concurrency)
+
+    return asyncThreadHandler(handler, min(concurrency, 64))
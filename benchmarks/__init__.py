@@ -0,0 +1,7 @@
+"""
+Cazador benchmark suite.
+
+Runs the service handlers against local stand-in backends serving a generated
+corpus so crawl and scan throughput can be compared between commits without
+any cloud account. See benchmarks/run.py for usage.
+"""
@@ -0,0 +1,394 @@
+"""
+Local stand-in backends for the benchmark suite.
+
+Each fake mimics just enough of a cloud SDK client for the matching handler to
+crawl, search and download a corpus directory tree. The handlers themselves are
+unchanged so the benchmark measures the real crawl and scan code paths.
+"""
+
+import os
+import shutil
+import hashlib
+import datetime
+
+
+def _walk(root):
+    """Yield (relative path, absolute path) of every file under root in a stable order."""
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names.sort()
+        for name in sorted(file_names):
+            full = os.path.join(dir_path, name)
+            yield os.path.relpath(full, root).replace(os.sep, '/'), full
+
+
+def _digest(path, algorithm):
+    h = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _dropbox_content_hash(path):
+    """Dropbox content_hash: SHA-256 of the SHA-256 digests of each 4MB block."""
+    blocks = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(4 * 1024 * 1024), b''):
+            blocks.update(hashlib.sha256(chunk).digest())
+    return blocks.hexdigest()
+
+
+def _modified(path):
+    return datetime.datetime.fromtimestamp(os.path.getmtime(path), datetime.timezone.utc)
+
+
+# ---------------------------------------------------------------------------
+# Amazon S3
+# ---------------------------------------------------------------------------
+
+class FakeS3Object:
+    """Loaded object details, as returned by Bucket.Object()."""
+
+    def __init__(self, root, bucket, key):
+        self.path = os.path.join(root, bucket, key)
+        self.key = key
+        self.e_tag = None
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            import botocore.exceptions
+            raise botocore.exceptions.ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        self.e_tag = '"{}"'.format(_digest(self.path, 'md5'))
+
+
+class FakeS3Bucket:
+    def __init__(self, root, name):
+        self.root = root
+        self.name = name
+
+    def Object(self, key):
+        return FakeS3Object(self.root, self.name, key)
+
+
+class FakeS3Client:
+    """Low level client supporting paged listing and downloads."""
+
+    def __init__(self, root, page_size=1000):
+        self.root = root
+        self.page_size = page_size
+        self.listings = {}
+
+    def _keys(self, bucket):
+        if bucket not in self.listings:
+            self.listings[bucket] = list(_walk(os.path.join(self.root, bucket)))
+        return self.listings[bucket]
+
+    def list_objects_v2(self, Bucket, ContinuationToken=None, MaxKeys=None, **kwargs):
+        keys = self._keys(Bucket)
+        start = int(ContinuationToken or 0)
+        end = start + (MaxKeys or self.page_size)
+        contents = [{"Key": key,
+                     "ETag": '"{}"'.format(_digest(full, 'md5')),
+                     "Size": os.path.getsize(full),
+                     "LastModified": _modified(full)} for key, full in keys[start:end]]
+        page = {"Contents": contents, "IsTruncated": end < len(keys)}
+        if page["IsTruncated"]:
+            page["NextContinuationToken"] = str(end)
+        return page
+
+    def download_file(self, Bucket, Key, Filename):
+        shutil.copyfile(os.path.join(self.root, Bucket, Key), Filename)
+
+
+class FakeS3Resource:
+    """Stand-in for boto3.resource('s3') backed by a directory per bucket."""
+
+    class _Meta:
+        def __init__(self, client):
+            self.client = client
+
+    def __init__(self, root):
+        self.root = root
+        self.meta = FakeS3Resource._Meta(FakeS3Client(root))
+
+    def Bucket(self, name):
+        return FakeS3Bucket(self.root, name)
+
+
+def make_s3_handler(root, buckets, config=None):
+    """Build an amazonS3Handler whose client serves the corpus."""
+    from services.amazons3 import amazonS3Handler
+    fields = {"region": "us-east-1",
+              "access_key_id": "benchmark",
+              "secret_key": "benchmark",
+              "buckets": ";".join(buckets)}
+    fields.update(config or {})
+    handler = amazonS3Handler(fields)
+    handler.client = FakeS3Resource(root)
+    return handler
+
+
+# ---------------------------------------------------------------------------
+# Dropbox
+# ---------------------------------------------------------------------------
+
+class _Result:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class FakeDropbox:
+    """Stand-in for dropbox.Dropbox backed by a directory tree."""
+
+    REV = "0123456789abcdef"
+
+    def __init__(self, root):
+        self.root = root
+        self.cursors = {}
+
+    def _metadata(self, rel_path):
+        from dropbox.files import FileMetadata, FolderMetadata
+        full = os.path.join(self.root, rel_path.lstrip('/'))
+        name = os.path.basename(rel_path)
+        path = "/" + rel_path.lstrip('/')
+        if os.path.isdir(full):
+            return FolderMetadata(name=name, id="id:" + hashlib.md5(path.encode()).hexdigest(),
+                                  path_lower=path.lower(), path_display=path)
+        modified = _modified(full).replace(tzinfo=None)
+        return FileMetadata(name=name,
+                            id="id:" + hashlib.md5(path.encode()).hexdigest(),
+                            client_modified=modified,
+                            server_modified=modified,
+                            rev=self.REV,
+                            size=os.path.getsize(full),
+                            content_hash=_dropbox_content_hash(full),
+                            path_lower=path.lower(),
+                            path_display=path)
+
+    def _entries(self, path, recursive):
+        base = os.path.join(self.root, path.lstrip('/'))
+        entries = []
+        if recursive:
+            for dir_path, dir_names, file_names in os.walk(base):
+                dir_names.sort()
+                for name in dir_names + sorted(file_names):
+                    entries.append(os.path.relpath(os.path.join(dir_path, name), self.root))
+        else:
+            for name in sorted(os.listdir(base)):
+                entries.append(os.path.relpath(os.path.join(base, name), self.root))
+        return [self._metadata(x.replace(os.sep, '/')) for x in entries]
+
+    def _page(self, entries, start, limit):
+        end = start + (limit or 2000)
+        cursor = "{}:{}".format(id(entries), end)
+        self.cursors[cursor] = (entries, limit)
+        return _Result(entries=entries[start:end], cursor=cursor, has_more=end < len(entries))
+
+    def files_list_folder(self, path, recursive=False, limit=None, **kwargs):
+        return self._page(self._entries(path, recursive), 0, limit)
+
+    def files_list_folder_continue(self, cursor):
+        entries, limit = self.cursors[cursor]
+        return self._page(entries, int(cursor.split(':')[1]), limit)
+
+    def files_search(self, path, query, start=0, max_results=100, **kwargs):
+        found = [x for x in self._entries(path, True) if query.lower() in x.name.lower()]
+        page = found[start:start + max_results]
+        return _Result(matches=[_Result(metadata=x) for x in page],
+                       more=start + max_results < len(found),
+                       start=start + len(page))
+
+    def files_download_to_file(self, download_path, path):
+        shutil.copyfile(os.path.join(self.root, path.lstrip('/')), download_path)
+
+
+def make_dropbox_handler(root, folders, config=None):
+    """Build a dropboxHandler whose client serves the corpus."""
+    from services.dropbox import dropboxHandler
+    fields = {"access_token": "benchmark", "folders": ";".join("/" + x for x in folders)}
+    fields.update(config or {})
+    handler = dropboxHandler(fields)
+    handler.client = FakeDropbox(root)
+    return handler
+
+
+# ---------------------------------------------------------------------------
+# Box
+# ---------------------------------------------------------------------------
+
+class FakeBoxFile:
+    type = 'file'
+
+    def __init__(self, root, rel_path):
+        self.full = os.path.join(root, rel_path)
+        self.id = hashlib.md5(rel_path.encode()).hexdigest()
+        self.name = os.path.basename(rel_path)
+        self.parent = os.path.dirname(rel_path)
+        self.sha1 = _digest(self.full, 'sha1')
+        self.size = os.path.getsize(self.full)
+        self.modified_at = _modified(self.full).isoformat()
+        self.path_collection = {"entries": [{"name": x} for x in self.parent.split('/') if x]}
+
+    def download_to(self, f):
+        with open(self.full, 'rb') as src:
+            shutil.copyfileobj(src, f)
+
+
+class FakeBoxFolder:
+    type = 'folder'
+
+    # Folder paths by id so folders can be looked up again like the real service
+    known = {}
+
+    def __init__(self, root, rel_path):
+        self.root = root
+        self.rel_path = rel_path
+        self.id = self._object_id = hashlib.md5(("folder:" + rel_path).encode()).hexdigest()
+        self.name = os.path.basename(rel_path)
+        FakeBoxFolder.known[self.id] = rel_path
+
+    def get_items(self, limit, offset=0, fields=None):
+        base = os.path.join(self.root, self.rel_path)
+        items = []
+        for name in sorted(os.listdir(base))[offset:offset + limit]:
+            rel = os.path.join(self.rel_path, name).replace(os.sep, '/').lstrip('/')
+            if os.path.isdir(os.path.join(base, name)):
+                items.append(FakeBoxFolder(self.root, rel))
+            else:
+                items.append(FakeBoxFile(self.root, rel))
+        return items
+
+
+class FakeBoxClient:
+    """Stand-in for boxsdk.Client backed by a directory tree."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def folder(self, folder_id):
+        return FakeBoxFolder(self.root, FakeBoxFolder.known.get(folder_id, ''))
+
+    def search(self, query, limit=200, offset=0, ancestor_folders=None, result_type=None):
+        if result_type == "folder":
+            if os.path.isdir(os.path.join(self.root, query)):
+                return [FakeBoxFolder(self.root, query)]
+            return []
+
+        found = [FakeBoxFile(self.root, rel) for rel, _ in _walk(self.root)
+                 if query.lower() in os.path.basename(rel).lower()]
+        return found[offset:offset + limit]
+
+
+def make_box_handler(root, folders, config=None):
+    """Build a boxHandler whose client serves the corpus."""
+    from services.box import boxHandler
+    fields = {"access_token": "benchmark", "folders": ";".join(folders)}
+    fields.update(config or {})
+    handler = boxHandler(fields)
+    handler.client = FakeBoxClient(root)
+    return handler
+
+
+# ---------------------------------------------------------------------------
+# Google Drive
+# ---------------------------------------------------------------------------
+
+class FakeHttpResponse(dict):
+    """httplib2.Response look-alike."""
+
+    def __init__(self, status, headers):
+        super(FakeHttpResponse, self).__init__(headers)
+        self.status = status
+        self.reason = "OK"
+
+
+class FakeDriveHttp:
+    """Serves ranged media requests the way MediaIoBaseDownload expects."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def request(self, uri, method="GET", headers=None, **kwargs):
+        full = os.path.join(self.root, uri)
+        total = os.path.getsize(full)
+        first, last = 0, total - 1
+        if headers and 'range' in headers:
+            first, last = [int(x) for x in headers['range'].split('=')[1].split('-')]
+            last = min(last, total - 1)
+        with open(full, 'rb') as f:
+            f.seek(first)
+            content = f.read(last - first + 1)
+        return FakeHttpResponse(206, {"content-range": "bytes {}-{}/{}".format(first,
+                                                                             last,
+                                                                             total),
+                                      "status": "206"}), content
+
+
+class FakeDriveRequest:
+    def __init__(self, result=None, uri=None, http=None):
+        self.result = result
+        self.uri = uri
+        self.http = http
+        self.headers = {}
+
+    def execute(self, **kwargs):
+        return self.result
+
+
+class FakeDriveFiles:
+    def __init__(self, root, http):
+        self.root = root
+        self.http = http
+
+    def _item(self, rel, full):
+        return {"id": rel,
+                "name": os.path.basename(rel),
+                "kind": "drive#file",
+                "mimeType": "text/plain",
+                "md5Checksum": _digest(full, 'md5'),
+                "parents": [os.path.dirname(rel)],
+                "shared": False,
+                "size": str(os.path.getsize(full)),
+                "modifiedTime": _modified(full).isoformat()}
+
+    def list(self, pageSize=1000, q="", fields=None, pageToken=None, **kwargs):
+        files = list(_walk(self.root))
+        if q.startswith("name contains"):
+            name = q.split("'")[1]
+            files = [x for x in files if name in os.path.basename(x[0])]
+        start = int(pageToken or 0)
+        end = start + pageSize
+        result = {"files": [self._item(rel, full) for rel, full in files[start:end]]}
+        if end < len(files):
+            result["nextPageToken"] = str(end)
+        return FakeDriveRequest(result)
+
+    def get_media(self, fileId):
+        return FakeDriveRequest(uri=fileId, http=self.http)
+
+
+class FakeDrive:
+    """Stand-in for the Drive v3 discovery client backed by a directory tree."""
+
+    def __init__(self, root):
+        self.root = root
+        self.http = FakeDriveHttp(root)
+
+    def files(self):
+        return FakeDriveFiles(self.root, self.http)
+
+
+def make_drive_handler(root, config=None):
+    """Build a googledriveHandler whose client serves the corpus.
+
+    The handler initializer runs the interactive OAuth flow so the client and
+    scheduler are attached directly instead.
+    """
+    from services.googledrive import googledriveHandler
+    from ratelimit import get_scheduler
+    from connections import ThreadLocalClient
+    handler = googledriveHandler.__new__(googledriveHandler)
+    handler.credentials = None
+    handler.scheduler = get_scheduler(handler.get_service_type(), config or {})
+    handler._clients = ThreadLocalClient("bench_googledrive", lambda: FakeDrive(root))
+    return handler
@@ -0,0 +1,314 @@
+"""
+Cazador benchmark runner.
+
+Generates a synthetic corpus, serves it to each service handler through the
+local stand-in backends, and times find_file and scan_files. Each handler runs
+in a fresh process, so its peak RSS is its own rather than the high-water mark
+of every handler run before it. Results are written as JSON tagged with the
+current commit so runs can be compared.
+
+Usage:
+    python -m benchmarks.run [options]
+
+    -s, --services= Handlers to run (amazons3,dropbox,box,googledrive,localfs). Default: all
+    -n, --files= Number of corpus files. Default: 500
+    -z, --size= Average corpus file size in bytes. Default: 16384
+    -t, --formats= Comma separated corpus formats (txt,csv,json,log,bin). Default: txt,csv,json,log
+    -d, --density= Probability of a secret on each corpus line. Default: 0.01
+    -r, --corpus= Use an existing corpus directory instead of generating one.
+    -e, --extractor= Content extractor, 'plain' or 'tika'. Default: plain
+    -o, --output= File path to write the JSON results to.
+    -b, --baseline= JSON results of an earlier run to compare against.
+    --threshold= Relative slowdown reported as a regression. Default: 0.10
+"""
+
+import os
+import sys
+import json
+import time
+import getopt
+import shutil
+import resource
+import tempfile
+import traceback
+import subprocess
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import cazscan
+from cazobjects import CazRegEx
+from benchmarks import fakes
+from benchmarks.corpus import generate_corpus, BENCH_EXPRESSIONS
+
+# Scheduler settings keeping the fakes from being paced like the real services
+UNTHROTTLED = {"rate": "1000000", "max_concurrency": "256"}
+
+# Metrics compared between runs, and whether larger values are better
+COMPARED = {"scan_objects_per_sec": True,
+            "scan_mb_per_sec": True,
+            "matches_per_sec": True,
+            "find_seconds": False,
+            "peak_rss_mb": False}
+
+
+class PlainTextParser:
+    """Extractor reading files as UTF-8 text so runs don't depend on a Tika server."""
+
+    @staticmethod
+    def from_file(file_path):
+        with open(file_path, 'rb') as f:
+            return {"content": f.read().decode('utf-8', errors='ignore')}
+
+    @staticmethod
+    def from_buffer(data):
+        return {"content": data.decode('utf-8', errors='ignore')}
+
+
+def peak_rss_mb():
+    """Return the peak resident set size of the process in MB. See run_isolated."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS reports bytes
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
+def git_commit():
+    """Return the commit being benchmarked, if available."""
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.realpath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def make_localfs_handler(root, buckets):
+    """Build a localfsHandler over the corpus as a network free baseline."""
+    from services.localfs import localfsHandler
+    return localfsHandler({"paths": ";".join(os.path.join(root, x) for x in buckets)})
+
+
+def build_handlers(names, corpus):
+    """Create the requested handlers backed by the corpus."""
+    root = corpus["root"]
+    factories = {
+        "amazons3": lambda: fakes.make_s3_handler(root, corpus["buckets"], UNTHROTTLED),
+        "dropbox": lambda: fakes.make_dropbox_handler(root, corpus["buckets"], UNTHROTTLED),
+        "box": lambda: fakes.make_box_handler(root, corpus["buckets"], UNTHROTTLED),
+        "googledrive": lambda: fakes.make_drive_handler(root, UNTHROTTLED),
+        "localfs": lambda: make_localfs_handler(root, corpus["buckets"]),
+    }
+    handlers = {}
+    for name in names:
+        handlers[name] = factories[name]()
+    return handlers
+
+
+def run_handler(handler, corpus, expressions, temp_dir):
+    """
+    Time find_file and scan_files for a single handler.
+
+    Returns:
+        Dictionary of the handler results.
+    """
+    start = time.perf_counter()
+    try:
+        handler.find_file(name="file0000001")
+    except Exception as ex:
+        print("find_file failed: {}".format(ex))
+    find_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matches = handler.scan_files(temp_dir, expressions)
+    scan_seconds = time.perf_counter() - start
+
+    mb = corpus["bytes"] / (1024.0 * 1024.0)
+    return {"find_seconds": round(find_seconds, 4),
+            "scan_seconds": round(scan_seconds, 4),
+            "objects": corpus["files"],
+            "matches": len(matches),
+            "scan_objects_per_sec": round(corpus["files"] / scan_seconds, 2),
+            "scan_mb_per_sec": round(mb / scan_seconds, 3),
+            "matches_per_sec": round(len(matches) / scan_seconds, 2),
+            "peak_rss_mb": round(peak_rss_mb(), 1)}
+
+
+def _service_main(name, corpus, extractor, temp_dir, conn):
+    """Build and time a single handler, sending back its results. Runs in its own process."""
+    if extractor == "plain":
+        cazscan._parser = PlainTextParser
+    expressions = [CazRegEx(x, exp) for x, exp in BENCH_EXPRESSIONS.items()]
+    try:
+        handler = build_handlers([name], corpus)[name]
+        conn.send(("ok", run_handler(handler, corpus, expressions, temp_dir)))
+    except Exception:
+        conn.send(("error", traceback.format_exc()))
+    conn.close()
+
+
+def run_isolated(name, corpus, extractor, temp_dir):
+    """
+    Time a single handler in a newly spawned process.
+
+    ru_maxrss is the high-water mark of a whole process, so running every handler
+    in the runner would report the largest handler so far for all of them.
+
+    Returns:
+        Dictionary of the handler results.
+    """
+    context = multiprocessing.get_context("spawn")
+    conn, child = context.Pipe(duplex=False)
+    process = context.Process(target=_service_main, args=(name, corpus, extractor, temp_dir, child))
+    process.start()
+    child.close()
+    try:
+        status, value = conn.recv()
+    except EOFError:
+        status, value = "error", None
+    finally:
+        conn.close()
+        process.join()
+
+    if status == "error":
+        raise RuntimeError("{} benchmark failed. {}".format(
+            name, value or "Exited with code {}".format(process.exitcode)))
+    return value
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare results to an earlier run.
+
+    Returns:
+        List of regression description strings.
+    """
+    regressions = []
+    for name, current in results["services"].items():
+        previous = baseline.get("services", {}).get(name)
+        if not previous:
+            continue
+        for metric, higher_is_better in COMPARED.items():
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            print("  {:<12} {:<22} {:>12} -> {:>12} ({:+.1f}%)".format(name, metric, old, new,
+                                                                       change * 100))
+            if worse > threshold:
+                regressions.append("{} {} regressed {:.1f}%".format(name, metric, worse * 100))
+    return regressions
+
+
+def print_help():
+    """Print the runner usage."""
+    print(__doc__)
+
+
+def main(argv):
+    try:
+        opts, args = getopt.getopt(argv,
+                                   "hs:n:z:t:d:r:e:o:b:",
+                                   ["services=", "files=", "size=", "formats=", "density=",
+                                    "corpus=", "extractor=", "output=", "baseline=",
+                                    "threshold="])
+    except getopt.GetoptError:
+        print_help()
+        return 2
+
+    services = ["amazons3", "dropbox", "box", "googledrive", "localfs"]
+    files = 500
+    size = 16384
+    formats = ("txt", "csv", "json", "log")
+    density = 0.01
+    corpus_dir = None
+    extractor = "plain"
+    output = None
+    baseline = None
+    threshold = 0.10
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print_help()
+            return 0
+        elif opt in ("-s", "--services"):
+            services = [x.strip().lower() for x in arg.split(',') if x.strip()]
+        elif opt in ("-n", "--files"):
+            files = int(arg)
+        elif opt in ("-z", "--size"):
+            size = int(arg)
+        elif opt in ("-t", "--formats"):
+            formats = tuple(x.strip() for x in arg.split(',') if x.strip())
+        elif opt in ("-d", "--density"):
+            density = float(arg)
+        elif opt in ("-r", "--corpus"):
+            corpus_dir = arg
+        elif opt in ("-e", "--extractor"):
+            extractor = arg
+        elif opt in ("-o", "--output"):
+            output = arg
+        elif opt in ("-b", "--baseline"):
+            baseline = arg
+        elif opt == "--threshold":
+            threshold = float(arg)
+
+    work_dir = tempfile.mkdtemp(prefix="caz_bench_")
+    try:
+        if corpus_dir:
+            buckets = sorted(x for x in os.listdir(corpus_dir)
+                             if os.path.isdir(os.path.join(corpus_dir, x)))
+            listed = [os.path.join(d, f) for b in buckets
+                      for d, _, fs in os.walk(os.path.join(corpus_dir, b)) for f in fs]
+            corpus = {"root": corpus_dir,
+                      "files": len(listed),
+                      "bytes": sum(os.path.getsize(x) for x in listed),
+                      "buckets": buckets}
+        else:
+            start = time.perf_counter()
+            corpus = generate_corpus(os.path.join(work_dir, "corpus"),
+                                     files=files,
+                                     size=size,
+                                     formats=formats,
+                                     density=density)
+            print("Generated {} files ({:.1f} MB) in {:.1f}s".format(
+                corpus["files"], corpus["bytes"] / (1024.0 * 1024.0), time.perf_counter() - start))
+
+        temp_dir = os.path.join(work_dir, "scan")
+        os.makedirs(temp_dir)
+
+        results = {"commit": git_commit(),
+                   "timestamp": time.time(),
+                   "extractor": extractor,
+                   "corpus": {k: v for k, v in corpus.items() if k != "root"},
+                   "services": {}}
+        for name in services:
+            res = run_isolated(name, corpus, extractor, temp_dir)
+            results["services"][name] = res
+            print("{:<12} {:>8.1f} obj/s {:>8.2f} MB/s {:>9.1f} matches/s"
+                  " find {:>7.3f}s peak RSS {:>7.1f} MB".format(name,
+                                                               res["scan_objects_per_sec"],
+                                                               res["scan_mb_per_sec"],
+                                                               res["matches_per_sec"],
+                                                               res["find_seconds"],
+                                                               res["peak_rss_mb"]))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if baseline:
+        with open(baseline) as f:
+            previous = json.load(f)
+        print("Compared to {}:".format(previous.get("commit")))
+        regressions = compare(results, previous, threshold)
+        for x in regressions:
+            print("REGRESSION: {}".format(x))
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
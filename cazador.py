@@ -10,14 +10,21 @@ Creator: Nathan Palmer
 
 import os
 import sys
+import time
 import traceback
 import logging
 from logging.config import fileConfig
 import getopt
-import pkgutil
-import importlib
+import queue
 import configparser as ConfigParser
+from concurrent.futures import ThreadPoolExecutor
 from cazobjects import CazRegEx
+from regexengine import ENGINES, RE
+from connections import pool_stats
+from metrics import metrics, PrometheusExporter
+from checkpoint import Checkpoint, scan_fingerprint
+from sinks import open_sink, merge_results, FORMATS
+from sharding import Shard
 
 modulepath = os.path.realpath(os.path.dirname(__file__))
 fileConfig(os.path.join(modulepath, 'logging.conf'), disable_existing_loggers=False)
@@ -25,22 +32,8 @@ logger = logging.getLogger("cazador")
 
 _config = ConfigParser.RawConfigParser()
 
-# Import all file services
+# File service handlers are registered by type and only imported when requested
 import services
-for _, name, _ in pkgutil.iter_modules([os.path.dirname(services.__file__)]):
-    try:
-        importlib.import_module('services.' + name)
-    except Exception as ex:
-        logger.error(traceback.format_exc())
-        logger.error("Failed to import {}: {}".format(name, ex))
-
-from fileservice import fileServiceInterface
-
-# Register all service handlers with the file service interface and ensure
-# they implement the necessary methods.
-knownServices = fileServiceInterface.__subclasses__()
-for srv in knownServices:
-    logging.debug("Found service {} for {}".format(str(srv), srv.get_service_type()))
 
 
 def get_service(fs_type, init_args):
@@ -54,41 +47,440 @@ def get_service(fs_type, init_args):
     Returns:
         fileServiceInterface: A instance handler for the file service.
     """
-    for srv in knownServices:
-        if srv.get_service_type().lower() == fs_type.lower():
-            try:
-                res = srv(init_args)
-            except Exception as ex:
-                logger.error("Failed to create service instance: {}".format(ex))
-                raise
-
-            return res
+    srv = services.load_service(fs_type)
+    try:
+        res = srv(init_args)
+    except Exception as ex:
+        logger.error("Failed to create service instance: {}".format(ex))
+        raise
 
-    raise ValueError("Unsupported file service type: {}".format(fs_type))
+    return res
 
 
 def print_known_services():
     """Print helper for known service list."""
     print("Known services:")
-    for srv in knownServices:
-        print("    {}".format(srv.get_service_type().lower()))
+    for srv in services.get_service_types():
+        print("    {}".format(srv))
 
 
 def print_help():
     """Print command line tool help."""
     print("""Cazador command line tool.
-cazador.py -c <Config file> -s <Service Type>
+cazador.py -c <Config file> -s <Service Type>[,<Service Type>...]
 
-    -s, --service= Cloud/File service type to search through.
+    -s, --service= Cloud/File service type(s) to search through. Use a comma separated
+                  list or repeat the option to search several services concurrently.
+                  Use 'all' for every known service configured in the configuration document.
                   !!! This must have a matching segment in the configuration document
     -c, --config= <Optional> File path to the configuration document for file/cloud service.
                   Default: [Current Directory]/cloud.conf
     -f, --filename= <Optional> Name of the file to search within the file/cloud service.
     -m, --md5= <Optional> MD5 hash of the file to search within the file/cloud service.
-    -a, --sha1= <Optional> SHA1 of the file to search within the file/cloud service.""")
+    -a, --sha1= <Optional> SHA1 of the file to search within the file/cloud service.
+    --ioc= <Optional> Threat intel feed file(s), comma separated. Every file whose MD5 or
+                  SHA1 is listed in a feed is found by crawling the service.
+    --async= <Optional> Run find and scan on the asyncio handlers with this many requests
+                  in flight per service. Requires Python 3.6+ and aiohttp.
+    --profile-regex <Optional> Time every [regex] rule evaluation and print a ranked cost
+                  report at the end of the run.
+    -o, --output= <Optional> File path to write the results to. Use '-' for stdout.
+                  Files ending in .gz, .bz2 or .xz are compressed. Default: stdout
+    --format= <Optional> Result format, one of text, jsonl or csv. Default: text
+    --compress= <Optional> Compress the results written (gz, bz2 or xz).
+    --shard= <Optional> Only scan this shard of each service, given as index/count
+                  such as 0/4. Run one process per shard index to split a scan
+                  across hosts with no overlap. Find operations are not sharded.
+    --get= <Optional> Download a verified copy of the files found by -f, -m or -a into
+                  this directory instead of only listing them. Interrupted downloads
+                  resume when run again.
+    --merge <Optional> Combine the result files given after the options, such as
+                  the output of every shard, into the --output destination.
+    --plan <Optional> Only list each service and report the files, bytes, file types and
+                  API requests a scan would take, with its estimated wall time.
+    --summary <Optional> Report the hits per rule and folder, the distinct values found and
+                  the files with the most matches instead of every individual match.
+    --resume <Optional> Save each service's scan progress and continue it from its last
+                  saved checkpoint instead of crawling the service again. Progress
+                  is saved to the checkpoint_dir, or the temp_dir if none is configured.
+    --metrics= <Optional> File path to write a JSON summary of the per-stage metrics to.
+    --prometheus= <Optional> Prometheus textfile path updated with the per-stage metrics
+                  while the run is in progress.""")
     print_known_services()
 
 
+def resolve_services(requested, config):
+    """
+    Expand the requested service types into a unique list of service types.
+
+    Args:
+        requested (string[]): Service types from the command line. May include 'all'.
+        config (ConfigParser): Loaded configuration document.
+
+    Returns:
+        List of service type strings to run.
+    """
+    known = services.get_service_types()
+    resolved = []
+    for r in requested:
+        if r.lower() == "all":
+            # Only run the known services that have a configuration segment
+            names = [x for x in config.sections() if x.lower() in known]
+        else:
+            names = [r]
+
+        for n in names:
+            if n.lower() not in [x.lower() for x in resolved]:
+                resolved.append(n)
+
+    return resolved
+
+
+def scan_concurrency(service, async_concurrency=None):
+    """Return the number of files a service scans at once."""
+    if async_concurrency:
+        return async_concurrency
+    # Handlers without a worker pool scan one file at a time
+    return getattr(service, "workers", 1)
+
+
+def stage_totals(service_type):
+    """Return the metrics of every stage recorded for a service so far."""
+    return metrics.summary()["services"].get(service_type.lower(), {})
+
+
+def plan_service(service, emit, concurrency=1, history=None):
+    """
+    List a service as a scan would and report what the scan would cost.
+
+    Args:
+        service (fileServiceInterface): Configured handler with its shard and checkpoint attached
+        emit (func): Called with each line of the report
+        concurrency (int): <Optional> Files the scan would process at once
+        history (ThroughputHistory): <Optional> Throughput measured by earlier scans
+    """
+    import cazscan
+    from planner import ScanPlan
+    from textcache import content_key
+    service_type = service.get_service_type()
+    plan = ScanPlan(service_type, concurrency, cazscan.sniff_size, service.download_part_size)
+
+    before = stage_totals(service_type)
+    start = time.monotonic()
+    for item in service.list_files():
+        info = service.describe_file(item)
+        key = content_key(info)
+        plan.add(info, cached=bool(cazscan.text_cache is not None and key and
+                                   cazscan.text_cache.contains(key)))
+    plan.listing_seconds = time.monotonic() - start
+
+    after = stage_totals(service_type)
+    for stage in ("list", "search", "metadata"):
+        calls = after.get(stage, {}).get("calls", 0) - before.get(stage, {}).get("calls", 0)
+        if calls:
+            plan.listing_requests[stage] = calls
+
+    rates = history.rates(service_type) if history else None
+    scheduler = getattr(service, "scheduler", None)
+    request_rates = scheduler.rates if scheduler else None
+    logger.debug("Plan for {}: {}".format(service_type, plan.to_dict(rates, request_rates)))
+    for line in plan.report(rates, request_rates):
+        emit(line)
+
+
+class RunOptions:
+    """Operations and settings requested for a run, shared by every service."""
+
+    def __init__(self, filename=None, md5=None, sha1=None, expressions=None, temp_dir=None,
+                 async_concurrency=None, checkpoint_dir=None, checkpoint_interval=60.0,
+                 resume=False, shard=None, get_dir=None, plan=False, history=None, iocs=None):
+        """
+        Initialize the options.
+
+        Args:
+            filename (string): <Optional> Name of the file to find
+            md5 (string): <Optional> MD5 hash of the file to find
+            sha1 (string): <Optional> SHA1 hash of the file to find
+            expressions (CazRegEx[]): <Optional> Compiled expressions for content scanning
+            temp_dir (string): <Optional> Temporary directory used while scanning
+            async_concurrency (int): <Optional> Use the asyncio handler with this many requests in flight
+            checkpoint_dir (string): <Optional> Directory to periodically save the scan progress to
+            checkpoint_interval (float): <Optional> Seconds between checkpoint saves
+            resume (bool): <Optional> Continue the scan from the last saved checkpoint
+            shard (Shard): <Optional> Only scan the files owned by this shard
+            get_dir (string): <Optional> Download a copy of the files found into this directory
+            plan (bool): <Optional> Only report what a scan would cost instead of running it
+            history (ThroughputHistory): <Optional> Scan throughput to estimate plans with and to
+                                         record completed scans in
+            iocs (IOCStore): <Optional> Find every file whose hash is listed in this store
+        """
+        self.filename = filename
+        self.md5 = md5
+        self.sha1 = sha1
+        self.expressions = expressions
+        self.temp_dir = temp_dir
+        self.async_concurrency = async_concurrency
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpoint_interval = checkpoint_interval
+        self.resume = resume
+        self.shard = shard
+        self.get_dir = get_dir
+        self.plan = plan
+        self.history = history
+        self.iocs = iocs
+
+
+def native_async_unsupported(service, checkpoint, options):
+    """
+    List the configured features a service's native asyncio handler would ignore.
+
+    Args:
+        service (fileServiceInterface): Configured handler
+        checkpoint (Checkpoint): <Optional> Checkpoint recording the scan
+        options (RunOptions): Requested operations
+
+    Returns:
+        List of feature descriptions, empty when the native handler can be used.
+    """
+    unsupported = []
+    if checkpoint is not None:
+        unsupported.append("checkpoints")
+    if getattr(service, 'inventories', None):
+        unsupported.append("inventory reports")
+    if options.filename and getattr(service, 'filename_crawl', True) is False:
+        # The native handlers always find names by listing
+        unsupported.append("filename_crawl = false")
+    return unsupported
+
+
+def attach_checkpoint(service, config_fields, options, summary=None):
+    """
+    Attach the checkpoint saving a service's scan progress, restoring it when resuming.
+
+    Returns:
+        Checkpoint, or None if checkpoints are disabled.
+    """
+    if not options.checkpoint_dir:
+        return None
+
+    import cazscan
+    service_type = service.get_service_type()
+    name = service_type.lower()
+    if options.shard:
+        name = "{}_shard{}of{}".format(name, options.shard.index, options.shard.count)
+    if summary is not None:
+        # Summary checkpoints hold aggregates instead of matches so they're kept apart
+        name += "_summary"
+    checkpoint = Checkpoint(os.path.join(options.checkpoint_dir, "cazador_{}.checkpoint".format(name)),
+                            scan_fingerprint(options.expressions, config_fields,
+                                             cazscan.similarity_index),
+                            options.checkpoint_interval)
+    checkpoint.summary = summary
+    if options.resume and not checkpoint.load():
+        logger.info("No checkpoint to resume for {}. Starting a full scan.".format(service_type))
+    service.checkpoint = checkpoint
+    return checkpoint
+
+
+def find_service_files(service, find_file, options, emit, emit_results):
+    """
+    Run the requested name, hash and IOC searches against a service.
+
+    Args:
+        service (fileServiceInterface): Configured handler
+        find_file (func): The handler's find_file, or its asyncio counterpart
+        options (RunOptions): Requested operations
+        emit (func): Called with each status message
+        emit_results (func): Called with each batch of results and the query that found them
+    """
+    filename, md5, sha1 = options.filename, options.md5, options.sha1
+    if options.get_dir and (filename or md5 or sha1):
+        try:
+            copies = service.get_file(name=filename, md5=md5, sha1=sha1, dest_dir=options.get_dir)
+            emit("Downloaded {} files".format(len(copies)))
+            for info, f_path in copies:
+                emit("Saved {} to {}".format(info.path or info.name, f_path))
+            emit_results([info for info, f_path in copies], "get")
+        except Exception as ex:
+            emit("Unable to get file. {}".format(ex))
+        filename = md5 = sha1 = None
+
+    try:
+        if filename:
+            matches = find_file(name=filename)
+            emit("Found {} filename matches".format(len(matches)))
+            emit_results(matches, "name")
+    except Exception as ex:
+        emit("Unexpected error finding file {} by name. {}".format(filename, ex))
+
+    try:
+        if md5:
+            matches = find_file(md5=md5)
+            emit("Found {} MD5 matches".format(len(matches)))
+            emit_results(matches, "md5")
+    except Exception as ex:
+        emit("Unexpected error finding file {} by MD5. {}".format(filename, ex))
+
+    try:
+        if sha1:
+            matches = find_file(sha1=sha1)
+            emit("Found {} SHA1 matches".format(len(matches)))
+            emit_results(matches, "sha1")
+    except Exception as ex:
+        emit("Unexpected error finding file {} by sha1. {}".format(filename, ex))
+
+    try:
+        if options.iocs is not None:
+            # Only attached for this crawl so the searches above report their own matches
+            service.iocs = options.iocs
+            matches = find_file()
+            emit("Found {} IOC matches".format(len(matches)))
+            emit_results(matches, "ioc")
+    except Exception as ex:
+        emit("Unexpected error finding files by IOC. {}".format(ex))
+
+
+def scan_service(service, scan_files, checkpoint, options, emit, emit_results, summary=None):
+    """
+    Scan the contents of every file in a service, saving its progress with the checkpoint.
+
+    Args:
+        service (fileServiceInterface): Configured handler
+        scan_files (func): The handler's scan_files, or its asyncio counterpart
+        checkpoint (Checkpoint): <Optional> Checkpoint recording the scan
+        options (RunOptions): Requested operations
+        emit (func): Called with each status message
+        emit_results (func): Called with each batch of results
+        summary (MatchSummary): <Optional> Summary the matches are aggregated into
+    """
+    service_type = service.get_service_type()
+    history = options.history
+    logger.debug("Starting {} scan...".format(service_type))
+    restored = []
+    if checkpoint:
+        restored = list(checkpoint.matches)
+        checkpoint.start()
+    before = stage_totals(service_type)
+    start = time.monotonic()
+    try:
+        res = restored + scan_files(options.temp_dir, options.expressions)
+        if checkpoint:
+            checkpoint.stop(completed=True)
+        if history:
+            after = stage_totals(service_type)
+
+            def added(stage, field):
+                return after.get(stage, {}).get(field, 0) - before.get(stage, {}).get(field, 0)
+
+            # In place scans such as localfs don't download, so their extracted bytes are used
+            history.record(service_type,
+                           added("list", "items"),
+                           added("download", "bytes") or added("extract", "bytes"),
+                           time.monotonic() - start,
+                           scan_concurrency(service, options.async_concurrency))
+        if summary is not None:
+            # Reported by the output loop, which knows whether the sink can take it as a record
+            emit_results([summary], "summary")
+        else:
+            emit("{} scanned results found.".format(len(res)))
+            emit_results(res)
+    except Exception as ex:
+        logger.error(traceback.format_exc())
+        emit("Unexpected error scanning file contents. {}".format(ex))
+        if checkpoint:
+            checkpoint.stop()
+            emit("Scan progress saved. Use --resume to continue.")
+
+
+def run_service(service_type, config_fields, results, options, summary=None):
+    """
+    Run the requested find and scan operations against a single service.
+
+    Output is not written directly, instead every status message and batch of results
+    is placed on the shared results queue so several services can run at once into a
+    single stream.
+
+    Args:
+        service_type (string): Type of service to create
+        config_fields (dict): Configuration segment for the service
+        results (queue.Queue): Merged output queue receiving (service_type, message, items, query)
+                               entries
+        options (RunOptions): Operations and settings requested for the run
+        summary (MatchSummary): <Optional> Aggregate the matches into this summary and report it
+                                instead of the individual matches
+    """
+    def emit(message):
+        results.put((service_type, message, None, None))
+
+    def emit_results(items, query=None):
+        if items:
+            results.put((service_type, None, items, query))
+
+    try:
+        # Create a service instance
+        service = get_service(service_type, config_fields)
+    except Exception as ex:
+        emit("Unable to create service. {}".format(ex))
+        return
+
+    import cazscan
+    # Files are scanned when there are rules to match or reference documents to compare to
+    scanning = bool(options.expressions) or cazscan.similarity_index is not None
+
+    service.shard = options.shard
+    service.summary = summary
+    checkpoint = attach_checkpoint(service, config_fields, options, summary) if scanning else None
+
+    async_concurrency = options.async_concurrency
+    if options.plan:
+        try:
+            plan_service(service, emit, scan_concurrency(service, async_concurrency), options.history)
+        except Exception as ex:
+            logger.error(traceback.format_exc())
+            emit("Unable to plan the scan. {}".format(ex))
+        return
+
+    find_file = service.find_file
+    scan_files = service.scan_files
+    if async_concurrency:
+        # Drive the asyncio handler from this service thread's own event loop
+        import asyncio
+        from asyncfileservice import asyncThreadHandler
+        from asyncservices import get_async_service
+        async_service = get_async_service(service, async_concurrency)
+        unsupported = native_async_unsupported(service, checkpoint, options)
+        if unsupported and not isinstance(async_service, asyncThreadHandler):
+            logger.warning("Using the threaded {} handler, the asyncio handler does not support"
+                           " {}.".format(service_type, ", ".join(unsupported)))
+            async_service = get_async_service(service, async_concurrency, native=False)
+        loop = asyncio.new_event_loop()
+        if not isinstance(async_service, asyncThreadHandler):
+            async_service.shard = options.shard
+            async_service.summary = summary
+            if service.priority is not None:
+                logger.warning("The asyncio {} handler scans files in listing order, ignoring the"
+                               " priority scheduler.".format(service_type))
+
+        def find_file(**kwargs):
+            if not isinstance(async_service, asyncThreadHandler):
+                async_service.iocs = service.iocs
+            return loop.run_until_complete(async_service.find_file(**kwargs))
+
+        def scan_files(*args):
+            return loop.run_until_complete(async_service.scan_files(*args))
+
+    find_service_files(service, find_file, options, emit, emit_results)
+
+    if scanning:
+        scan_service(service, scan_files, checkpoint, options, emit, emit_results, summary)
+    else:
+        logger.info("Bypassing {} content scan. Not requested.".format(service_type))
+
+    if async_concurrency:
+        loop.run_until_complete(async_service.close())
+        loop.close()
+
+
 def test_find_file(service):
     """Dev Test Method"""
     # TODO - Remove this test code !!!!
@@ -148,8 +540,11 @@ if __name__ == "__main__":
 
     try:
         opts, args = getopt.getopt(argv,
-                                   "hc:s:f:m:a:",
-                                   ["config=", "service=", "filename=", "md5=", "sha1="])
+                                   "hc:s:f:m:a:o:",
+                                   ["config=", "service=", "filename=", "md5=", "sha1=", "async=",
+                                    "metrics=", "prometheus=", "profile-regex", "resume",
+                                    "output=", "format=", "compress=", "shard=", "merge",
+                                    "get=", "plan", "summary", "ioc="])
     except getopt.GetoptError:
         print_help()
         sys.exit(2)
@@ -157,6 +552,21 @@ if __name__ == "__main__":
     filename = None
     md5 = None
     sha1 = None
+    async_concurrency = None
+    metrics_path = None
+    prometheus_path = None
+    profile_regex = False
+    resume = False
+    output_path = None
+    output_format = "text"
+    compression = None
+    shard = None
+    merge = False
+    get_dir = None
+    plan = False
+    summarize = False
+    ioc_feeds = []
+    service_types = []
 
     config_path = "cloud.conf"
     for opt, arg in opts:
@@ -164,7 +574,7 @@ if __name__ == "__main__":
             print_help()
             sys.exit()
         elif opt in ("-s", "--service"):
-            service_type = arg
+            service_types.extend(x.strip() for x in arg.split(',') if x.strip())
         elif opt in ("-c", "--config"):
             config_path = arg
         elif opt in ("-f", "--file"):
@@ -173,32 +583,182 @@ if __name__ == "__main__":
             md5 = arg
         elif opt in ("-a", "--sha1"):
             sha1 = arg
+        elif opt == "--async":
+            async_concurrency = int(arg)
+        elif opt == "--metrics":
+            metrics_path = arg
+        elif opt == "--prometheus":
+            prometheus_path = arg
+        elif opt == "--profile-regex":
+            profile_regex = True
+        elif opt == "--resume":
+            resume = True
+        elif opt in ("-o", "--output"):
+            output_path = arg
+        elif opt == "--format":
+            output_format = arg.lower()
+        elif opt == "--compress":
+            compression = arg.lower()
+        elif opt == "--shard":
+            try:
+                shard = Shard.parse(arg)
+            except ValueError as ex:
+                logger.error(ex)
+                sys.exit(2)
+        elif opt == "--merge":
+            merge = True
+        elif opt == "--get":
+            get_dir = arg
+        elif opt == "--plan":
+            plan = True
+        elif opt == "--summary":
+            summarize = True
+        elif opt == "--ioc":
+            ioc_feeds.extend(x.strip() for x in arg.split(',') if x.strip())
 
-    if not service_type:
-        logger.error("Unable to complete operation. No valid service type was specified.")
+    if merge:
+        if not args:
+            logger.error("No result files to merge were specified.")
+            sys.exit(2)
+        count = merge_results(args, output_path, compression)
+        logger.info("Merged {} results from {} files".format(count, len(args)))
+        sys.exit()
+
+    if output_format not in FORMATS:
+        logger.error("Unknown output format {}. Expected one of {}".format(output_format,
+                                                                          ", ".join(FORMATS)))
         print_help()
         sys.exit(2)
 
     _config.read(config_path)
+    service_types = resolve_services(service_types, _config)
+
+    if not service_types:
+        logger.error("Unable to complete operation. No valid service type was specified.")
+        print_help()
+        sys.exit(2)
+
+    # Build a list of expression objects for performing content analysis.
+    # These are compiled once and shared by every service.
+    # Rules use the regex engine, which matches like re but can time out a line. The
+    # linear time re2 engine is opt-in since its classes such as \w only cover ASCII.
+    try:
+        regex_engine = _config["scanner"]["regex_engine"].lower() or "regex"
+    except:
+        regex_engine = "regex"
 
-    # Create a service instance
-    service = get_service(service_type, _config[service_type])
+    if regex_engine not in ENGINES:
+        logger.error("Unknown regex engine {}. Expected one of {}".format(regex_engine,
+                                                                         ", ".join(ENGINES)))
+        sys.exit(2)
 
-    # Build a list of expression objects for performing content analysis
     regex_exps = []
     try:
         cfg_reg = _config["regex"]
         for x in cfg_reg:
-            regex_exps.append(CazRegEx(x, cfg_reg[x]))
+            regex_exps.append(CazRegEx(x, cfg_reg[x], regex_engine))
     except:
         # Ignore exceptions reading the configuration... it can be empty
         pass
 
+    for x in regex_exps:
+        logger.debug("Rule {} uses the {} engine".format(x.name, x.engine))
+        for warning in x.warnings:
+            logger.warning("Rule {} may backtrack catastrophically: {}".format(x.name, warning))
+
+    # Only the regex engine can abandon the evaluation of a line part way through
+    untimed = [x.name for x in regex_exps if x.engine == RE]
+    if untimed:
+        logger.warning("Rules {} use the re engine, so their time budget is only checked between"
+                       " lines. Install regex from requirements.txt.".format(
+                           ", ".join(untimed)))
+
     try:
         temp_dir = _config["scanner"]["temp_dir"]
     except:
         temp_dir = os.path.dirname(__file__)
 
+    # Scans only save their progress when a checkpoint_dir is configured or --resume is given
+    try:
+        checkpoint_dir = _config["scanner"]["checkpoint_dir"] or None
+    except:
+        checkpoint_dir = None
+    if resume and not checkpoint_dir:
+        checkpoint_dir = temp_dir
+
+    try:
+        checkpoint_interval = float(_config["scanner"]["checkpoint_interval"])
+    except:
+        checkpoint_interval = 60.0
+
+    # Scans record their throughput, when a history file is configured, so plans can
+    # estimate how long the next one will take
+    from planner import ThroughputHistory
+    try:
+        history_path = _config["scanner"]["throughput_history"] or None
+    except:
+        history_path = None
+    history = ThroughputHistory(history_path) if history_path else None
+
+    # Copies saved by --get are downloaded in parallel ranges of this size
+    from fileservice import fileServiceInterface
+    try:
+        fileServiceInterface.download_workers = max(1, int(_config["scanner"]["download_workers"]))
+    except:
+        pass
+    try:
+        fileServiceInterface.download_chunk_size = int(float(_config["scanner"]["download_chunk_size"]) *
+                                                       1024 * 1024)
+    except:
+        pass
+
+    # Scan the listed files most likely to hold a finding first
+    try:
+        use_priority = _config["priority"]["enabled"].lower() != 'false'
+    except:
+        use_priority = True
+
+    if use_priority:
+        from priority import (PriorityScorer, PriorityScheduler, parse_weights, DEFAULT_EXTENSIONS,
+                              DEFAULT_MIME_TYPES, DEFAULT_KEYWORDS)
+        weights = {}
+        for key, defaults in (("extensions", DEFAULT_EXTENSIONS),
+                              ("mime_types", DEFAULT_MIME_TYPES),
+                              ("keywords", DEFAULT_KEYWORDS)):
+            weights[key] = dict(defaults)
+            try:
+                value = _config["priority"][key]
+            except:
+                continue
+            try:
+                weights[key].update(parse_weights(value))
+            except ValueError:
+                logger.error("Invalid [priority] {} weights {}. Expected name:weight pairs"
+                             " separated by ';'".format(key, value))
+                sys.exit(2)
+        scorer = PriorityScorer(**weights)
+        try:
+            scorer.recency_weight = float(_config["priority"]["recency_weight"])
+        except:
+            pass
+        try:
+            scorer.recency_half_life = max(0.001, float(_config["priority"]["recency_half_life"]))
+        except:
+            pass
+        try:
+            scorer.size_weight = float(_config["priority"]["size_weight"])
+        except:
+            pass
+        try:
+            max_pending = int(_config["priority"]["max_pending"])
+        except:
+            max_pending = 10000
+        try:
+            warmup = float(_config["priority"]["warmup"])
+        except:
+            warmup = 2.0
+        fileServiceInterface.priority = PriorityScheduler(scorer, max_pending, warmup)
+
     # TODO REMOVE THIS TEST CODE
     """
     test_find = True
@@ -207,44 +767,274 @@ if __name__ == "__main__":
         logger.info("")
     """
 
+    import cazscan
+    if profile_regex:
+        cazscan.profile_expressions = True
+
+    # Stop evaluating a rule within a file once it has used its time budget
     try:
-        if filename:
-            matches = service.find_file(name=filename)
-            print("Found {} filename matches".format(len(matches)))
-            for x in matches:
-                print(x)
-    except Exception as ex:
-        print("Unexpected error finding file {} by name. {}".format(filename, ex))
+        cazscan.regex_budget = float(_config["scanner"]["regex_budget"]) or None
+    except:
+        cazscan.regex_budget = 10.0
 
+    # Read the leading bytes of each file to skip binaries before the full download
     try:
-        if md5:
-            matches = service.find_file(md5=md5)
-            print("Found {} MD5 matches".format(len(matches)))
-            for x in matches:
-                print(x)
-    except Exception as ex:
-        print("Unexpected error finding file {} by MD5. {}".format(filename, ex))
+        use_sniff = _config["scanner"]["sniff"].lower() != 'false'
+    except:
+        use_sniff = True
 
+    if use_sniff:
+        from sniff import DEFAULT_SNIFF_SIZE
+        try:
+            cazscan.sniff_size = max(1, int(float(_config["scanner"]["sniff_size"]) * 1024))
+        except:
+            cazscan.sniff_size = DEFAULT_SNIFF_SIZE
+
+    # Archive members are expanded and scanned individually unless disabled
     try:
-        if sha1:
-            matches = service.find_file(sha1=sha1)
-            print("Found {} SHA1 matches".format(len(matches)))
-            for x in matches:
-                print(x)
-    except Exception as ex:
-        print("Unexpected error finding file {} by sha1. {}".format(filename, ex))
+        scan_archives = _config["scanner"]["scan_archives"].lower() != 'false'
+    except:
+        scan_archives = True
 
-    if len(regex_exps) > 0:
-        logger.debug("Starting scan...")
+    if scan_archives:
+        limits = cazscan.archive_limits
         try:
-            res = service.scan_files(temp_dir, regex_exps)
-            logger.warn("{} scanned results found.".format(len(res)))
-            count = 0
-            for x in res:
-                logger.warn("{}: {}".format(count, x))
-                count += 1
-        except Exception as ex:
-            logger.error(traceback.format_exc())
-            logger.error("Unexpected error scanning file contents. {}".format(ex))
+            limits.max_depth = int(_config["scanner"]["archive_depth"])
+        except:
+            pass
+        try:
+            limits.max_members = int(_config["scanner"]["archive_members"])
+        except:
+            pass
+        try:
+            limits.max_ratio = float(_config["scanner"]["archive_ratio"])
+        except:
+            pass
+        try:
+            limits.max_member_size = int(float(_config["scanner"]["archive_member_size"]) *
+                                         1024 * 1024)
+        except:
+            pass
     else:
-        logger.info("Bypassing content scan. Not requested.")
+        cazscan.archive_limits = None
+
+    # Extract text in worker processes so a single file can't stall or exhaust the scan
+    extraction_pool = None
+    try:
+        extract_workers = int(_config["scanner"]["extract_workers"])
+    except:
+        extract_workers = 4
+
+    if extract_workers > 0:
+        from extractpool import ExtractionPool
+        try:
+            extract_timeout = float(_config["scanner"]["extract_timeout"])
+        except:
+            extract_timeout = 300.0
+        try:
+            extract_memory = int(float(_config["scanner"]["extract_memory"]) * 1024 * 1024)
+        except:
+            extract_memory = 2048 * 1024 * 1024
+        try:
+            extract_max_files = max(1, int(_config["scanner"]["extract_max_files"]))
+        except:
+            extract_max_files = 200
+        extraction_pool = ExtractionPool(workers=extract_workers,
+                                         timeout=extract_timeout,
+                                         max_rss=extract_memory,
+                                         max_files=extract_max_files)
+        cazscan.extraction_pool = extraction_pool
+
+    # Compare every scanned file to the sensitive reference documents when configured
+    try:
+        reference_dir = _config["similarity"]["reference_dir"]
+    except:
+        reference_dir = None
+
+    if reference_dir:
+        from similarity import build_index
+        try:
+            threshold = float(_config["similarity"]["threshold"])
+        except:
+            threshold = 0.5
+        try:
+            shingle_size = int(_config["similarity"]["shingle_size"])
+        except:
+            shingle_size = 5
+        try:
+            index_path = _config["similarity"]["index_path"] or None
+        except:
+            index_path = None
+        cazscan.similarity_index = build_index(reference_dir,
+                                               cazscan.extract_text,
+                                               threshold=threshold,
+                                               shingle_size=shingle_size,
+                                               index_path=index_path)
+
+    # Reuse the text extracted from unchanged files when a cache is configured
+    text_cache = None
+    try:
+        text_cache_dir = _config["scanner"]["text_cache_dir"]
+    except:
+        text_cache_dir = None
+
+    if text_cache_dir and (regex_exps or cazscan.similarity_index is not None):
+        from textcache import TextCache
+        try:
+            text_cache_size = int(float(_config["scanner"]["text_cache_size"]) * 1024 * 1024)
+        except:
+            text_cache_size = 1024 * 1024 * 1024
+        text_cache = TextCache(text_cache_dir, text_cache_size)
+        cazscan.text_cache = text_cache
+
+    # Aggregate the matches of each service into fixed size summaries instead of reporting them
+    summaries = {}
+    summary_path = None
+    if summarize:
+        from summary import (MatchSummary, write_report, DEFAULT_TOP_FILES, DEFAULT_FOLDER_COUNTERS,
+                             DEFAULT_PRECISION)
+        try:
+            top_files = int(_config["summary"]["top_files"])
+        except:
+            top_files = DEFAULT_TOP_FILES
+        try:
+            folder_counters = int(_config["summary"]["folder_counters"])
+        except:
+            folder_counters = DEFAULT_FOLDER_COUNTERS
+        try:
+            precision = min(16, max(4, int(_config["summary"]["precision"])))
+        except:
+            precision = DEFAULT_PRECISION
+        try:
+            summary_path = _config["summary"]["report"] or None
+        except:
+            summary_path = None
+        for service_type in service_types:
+            summaries[service_type] = MatchSummary(top_files, folder_counters, precision)
+
+    # Threat intel feeds are compiled into a memory mapped store shared by every service
+    iocs = None
+    if ioc_feeds:
+        from ioc import IOCStore, DEFAULT_BITS_PER_ENTRY
+        try:
+            ioc_store = _config["ioc"]["store"] or None
+        except:
+            ioc_store = None
+        try:
+            bloom_bits = max(1, int(_config["ioc"]["bloom_bits"]))
+        except:
+            bloom_bits = DEFAULT_BITS_PER_ENTRY
+        try:
+            iocs = IOCStore.open(ioc_feeds, ioc_store, bloom_bits)
+        except (OSError, ValueError) as ex:
+            logger.error("Unable to load the IOC feeds. {}".format(ex))
+            sys.exit(2)
+        logger.info("Checking hashes against {} IOCs".format(len(iocs)))
+
+    exporter = None
+    if prometheus_path:
+        try:
+            interval = float(_config["scanner"]["metrics_interval"])
+        except:
+            interval = 15.0
+        exporter = PrometheusExporter(metrics, prometheus_path, interval)
+        exporter.start()
+
+    try:
+        batch_size = int(_config["scanner"]["output_batch_size"])
+    except:
+        batch_size = 1000
+
+    try:
+        flush_interval = float(_config["scanner"]["output_flush_interval"])
+    except:
+        flush_interval = 1.0
+
+    sink = open_sink(output_format, output_path, compression, batch_size, flush_interval)
+    # Keep stdout parseable when structured results are written to it
+    status_to_log = (not output_path or output_path == "-") and (output_format != "text" or
+                                                                  compression is not None)
+
+    options = RunOptions(filename=filename,
+                         md5=md5,
+                         sha1=sha1,
+                         expressions=regex_exps,
+                         temp_dir=temp_dir,
+                         async_concurrency=async_concurrency,
+                         checkpoint_dir=checkpoint_dir,
+                         checkpoint_interval=checkpoint_interval,
+                         resume=resume,
+                         shard=shard,
+                         get_dir=get_dir,
+                         plan=plan,
+                         history=history,
+                         iocs=iocs)
+
+    # Run every service at once and merge their output into a single stream
+    results = queue.Queue()
+    with ThreadPoolExecutor(max_workers=len(service_types)) as pool:
+        running = []
+        for service_type in service_types:
+            try:
+                config_fields = _config[service_type]
+            except KeyError:
+                logger.error("No configuration segment found for {}".format(service_type))
+                continue
+
+            running.append(pool.submit(run_service,
+                                       service_type,
+                                       config_fields,
+                                       results,
+                                       options,
+                                       summary=summaries.get(service_type)))
+
+        while running or not results.empty():
+            try:
+                service_type, message, items, query = results.get(timeout=0.5)
+            except queue.Empty:
+                running = [x for x in running if not x.done()]
+                continue
+
+            if query == "summary":
+                if output_format == "jsonl":
+                    sink.write(service_type, items, query)
+                else:
+                    # The report would be lost in the log while stdout carries the results
+                    sink.flush()
+                    for line in items[0].report():
+                        print("[{}] {}".format(service_type, line),
+                              file=sys.stderr if status_to_log else sys.stdout)
+            elif items:
+                sink.write(service_type, items, query)
+            elif status_to_log:
+                logger.info("[{}] {}".format(service_type, message))
+            else:
+                sink.flush()
+                print("[{}] {}".format(service_type, message))
+
+    sink.close()
+
+    for name, stats in pool_stats().items():
+        logger.info("Connection pool {}: {}".format(name, stats))
+
+    if summary_path:
+        write_report(summary_path, summaries)
+
+    if iocs is not None:
+        iocs.close()
+
+    if text_cache:
+        logger.info("Text cache: {}".format(text_cache.stats()))
+
+    if extraction_pool:
+        logger.info("Extraction workers: {}".format(extraction_pool.stats()))
+        extraction_pool.close()
+
+    if exporter:
+        exporter.stop()
+
+    if metrics_path:
+        metrics.write_json(metrics_path)
+
+    if profile_regex and regex_exps:
+        print(cazscan.format_expression_profile(regex_exps))
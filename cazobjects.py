@@ -8,20 +8,41 @@ Created: 08/24/2016
 Creator: Nathan Palmer
 """
 import hashlib
-import re
+import threading
+from regexengine import compile_expression, lint_expression, RE2, REGEX
 
 
 class CazFile:
     """Simple file metadata object."""
 
-    def __init__(self, file_id, name, parent, sha1=None, md5=None, path=None):
+    def __init__(self, file_id, name, parent, sha1=None, md5=None, path=None, size=None,
+                 modified=None, content_hash=None, mime_type=None):
         """CazFile initializer."""
-        self.file_id = str(file_id) if not None else None
-        self.name = str(name) if not None else None
-        self.parent = str(parent) if not None else None
-        self.sha1 = str(sha1) if not None else None
-        self.md5 = str(md5) if not None else None
-        self.path = str(path) if not None else None
+        self.file_id = str(file_id) if file_id is not None else None
+        self.name = str(name) if name is not None else None
+        self.parent = str(parent) if parent is not None else None
+        self.sha1 = str(sha1) if sha1 is not None else None
+        self.md5 = str(md5) if md5 is not None else None
+        self.path = str(path) if path is not None else None
+        self.size = size
+        self.modified = modified
+        # Service specific content hash, such as the Dropbox content_hash
+        self.content_hash = content_hash
+        # MIME type reported by the service, if any
+        self.mime_type = mime_type
+
+    def to_dict(self):
+        """Return the file details as a JSON serializable dictionary."""
+        return {"file_id": self.file_id,
+                "name": self.name,
+                "parent": self.parent,
+                "path": self.path,
+                "md5": self.md5,
+                "sha1": self.sha1,
+                "content_hash": self.content_hash,
+                "size": self.size,
+                "mime_type": self.mime_type,
+                "modified": str(self.modified) if self.modified is not None else None}
 
     def __str__(self):
         """String print helper."""
@@ -38,11 +59,57 @@ SHA1:{} MD5:{}""".format(self.name,
 class CazRegEx:
     """Simple wrapper for a compiled named regular expression."""
 
-    def __init__(self, name, expression):
-        """CazRegEx initializer."""
+    def __init__(self, name, expression, engine=REGEX):
+        """
+        CazRegEx initializer.
+
+        Args:
+            name (str): Rule name reported with each match.
+            expression (str): Regular expression of the rule.
+            engine (str): <Optional> Preferred engine (regex, re2, auto or re). See regexengine.
+        """
         self.name = name
+        self.expression = expression
         # Compile the regex so it can be more efficiently reused
-        self.regex = re.compile(expression)
+        self.engine, self.regex = compile_expression(expression, engine)
+        # Only linear time evaluations can't run away on a single line
+        self.backtracking = self.engine != RE2
+        self.warnings = lint_expression(expression) if self.backtracking else []
+        # Evaluations abandoned for exceeding the time budget of a file
+        self.aborted = 0
+        # Evaluation cost totals, only recorded while profiling
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.evaluations = 0
+        self.bytes = 0
+        self.hits = 0
+        self._profile_lock = threading.Lock()
+
+    def search(self, line, timeout=None):
+        """
+        Search a line, giving up after the timeout when the engine supports one.
+
+        Raises:
+            TimeoutError: The regex engine gave up on the evaluation.
+        """
+        if timeout is not None and self.engine == REGEX:
+            return self.regex.search(line, timeout=max(timeout, 0.001))
+        return self.regex.search(line)
+
+    def record_abort(self):
+        """Count an evaluation abandoned for exceeding its time budget."""
+        with self._profile_lock:
+            self.aborted += 1
+
+    def record(self, seconds, size, hit):
+        """Add the cost of a single evaluation to the profile totals."""
+        with self._profile_lock:
+            self.seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            self.evaluations += 1
+            self.bytes += size
+            if hit:
+                self.hits += 1
 
 
 class CazRegMatch:
@@ -57,6 +124,25 @@ class CazRegMatch:
         self.line_number = line
         self.file_path = file_path
 
+    def to_dict(self):
+        """Return the match as a JSON serializable dictionary."""
+        return {"hash": self.hash,
+                "expression_name": self.expression_name,
+                "location": list(self.location),
+                "line_number": self.line_number,
+                "file_path": self.file_path}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a match saved with to_dict."""
+        res = cls.__new__(cls)
+        res.hash = data["hash"]
+        res.expression_name = data["expression_name"]
+        res.location = tuple(data["location"])
+        res.line_number = data["line_number"]
+        res.file_path = data["file_path"]
+        return res
+
     def __str__(self):
         """String print helper."""
         return "{} detected a match for {} in {} at location {} line {}.".format(self.hash,
@@ -64,3 +150,63 @@ class CazRegMatch:
                                                                                  self.file_path,
                                                                                  self.location,
                                                                                  self.line_number)
+
+
+class CazSimilarMatch:
+    """Simple wrapper for a file similar to a sensitive reference document."""
+
+    def __init__(self, file_path, reference, score):
+        """CazSimilarMatch initializer."""
+        self.file_path = file_path
+        self.reference = reference
+        # Estimated Jaccard similarity of the word shingles, from 0 to 1
+        self.score = score
+
+    def to_dict(self):
+        """Return the match as a JSON serializable dictionary."""
+        return {"file_path": self.file_path,
+                "reference": self.reference,
+                "score": round(self.score, 4)}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a match saved with to_dict."""
+        return cls(data["file_path"], data["reference"], data["score"])
+
+    def __str__(self):
+        """String print helper."""
+        return "{} is {:.0%} similar to reference document {}.".format(self.file_path,
+                                                                      self.score,
+                                                                      self.reference)
+
+
+class CazSkippedFile:
+    """Simple wrapper for a file whose content couldn't be scanned."""
+
+    def __init__(self, file_path, reason):
+        """CazSkippedFile initializer."""
+        self.file_path = file_path
+        self.reason = reason
+
+    def to_dict(self):
+        """Return the skipped file as a JSON serializable dictionary."""
+        return {"file_path": self.file_path,
+                "reason": self.reason}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a skipped file saved with to_dict."""
+        return cls(data["file_path"], data["reason"])
+
+    def __str__(self):
+        """String print helper."""
+        return "Skipped {}. {}".format(self.file_path, self.reason)
+
+
+def match_from_dict(data):
+    """Rebuild a CazRegMatch, CazSimilarMatch or CazSkippedFile saved with to_dict."""
+    if "reference" in data:
+        return CazSimilarMatch.from_dict(data)
+    if "reason" in data:
+        return CazSkippedFile.from_dict(data)
+    return CazRegMatch.from_dict(data)
@@ -11,9 +11,53 @@ Creator: Nathan Palmer
 
 import io
 import os
-import tika
-from tika import parser
+import json
+import hashlib
+import time
+import logging
 import cazobjects
+import archives
+import sniff
+from textcache import content_key
+from extractpool import ExtractionSkipped
+from metrics import metrics, LIST, SNIFF, DOWNLOAD, EXTRACT, MATCH, SIMILARITY, CLEANUP
+logger = logging.getLogger(__name__)
+
+
+_parser = None
+
+# Record the evaluation cost of every expression when enabled
+profile_expressions = False
+
+# Seconds each rule may spend searching a single file. None disables the budget.
+regex_budget = None
+
+# Extracted text is reused from this textcache.TextCache when set
+text_cache = None
+
+# Archive members are scanned individually within these limits. None disables expansion.
+archive_limits = archives.ArchiveLimits()
+
+# Extracted text is also compared to the reference documents in this similarity.MinHashIndex when set
+similarity_index = None
+
+# Text is extracted in the worker processes of this extractpool.ExtractionPool when set
+extraction_pool = None
+
+# Bytes read from the start of each file to skip binaries before the full download. None disables it.
+sniff_size = None
+
+# Prefix of cached text holding the extracted text of each archive member
+ARCHIVE_MARKER = "\x00cazador-archive\x00"
+
+
+def get_parser():
+    """Import the Tika parser on first use so it doesn't slow down startup."""
+    global _parser
+    if _parser is None:
+        from tika import parser
+        _parser = parser
+    return _parser
 
 
 def create_temp_name(temp_dir, file_id):
@@ -22,29 +66,474 @@ def create_temp_name(temp_dir, file_id):
                         "caz_{}".format(os.path.basename(file_id)))
 
 
-def search_content(file_path, expressions):
+def create_unique_temp_name(temp_dir, file_id, name):
+    """Create a temporary file name that can't collide between concurrent downloads."""
+    key = hashlib.sha1(str(file_id).encode('utf-8')).hexdigest()[:16]
+    return create_temp_name(temp_dir, "{}_{}".format(key, os.path.basename(str(name))))
+
+
+def scan_item(service, item, temp_dir, expressions):
+    """
+    Download a single listed file to a temporary location and search its contents.
+
+    Args:
+        service (fileServiceInterface): Handler that listed the file.
+        item (object): Service specific file entry returned by list_files.
+        temp_dir (str): Path to the temporary directory to hold the file.
+        expressions (CazRegExp[]): List of regular expressions for content comparison.
+
+    Returns:
+        List of CazRegMatch entries reported against the file's service path.
+    """
+    service_type = service.get_service_type()
+    info = service.describe_file(item)
+    metrics.observe(LIST, service_type, items=1)
+    matches = scan_cached(service_type, info, expressions)
+    if matches is not None:
+        return finish_item(service, service.checkpoint_key(item), matches)
+
+    if not sniff_item(service, item, info):
+        return finish_item(service, service.checkpoint_key(item), [])
+
+    f_path = create_unique_temp_name(temp_dir, info.file_id, info.name)
+    logger.debug("Processing file {}...{}".format(info.name, f_path))
+    try:
+        service.download_file(item, f_path)
+    except Exception as ex:
+        metrics.observe(DOWNLOAD, service_type, error=True)
+        logger.error("Unable to download file {}. {}".format(info.name, ex))
+        remove_temp_file(f_path, service_type)
+        return finish_item(service, service.checkpoint_key(item), [])
+
+    matches = scan_downloaded(service_type, info, f_path, expressions)
+    return finish_item(service, service.checkpoint_key(item), matches)
+
+
+def finish_item(service, key, matches):
+    """
+    Record a scanned file with the handler's checkpoint.
+
+    When the handler has a summary attached the matches are aggregated into it
+    instead of being kept, so summary scans hold no individual matches.
+
+    Args:
+        service (fileServiceInterface): Handler that listed the file.
+        key (str): Checkpoint key of the file.
+        matches (object[]): Results found in the file.
+
+    Returns:
+        The matches to report for the file.
+    """
+    if service.summary is not None:
+        service.checkpoint.finish(key, matches, summary=service.summary)
+        return []
+    service.checkpoint.finish(key, matches)
+    return matches
+
+
+def should_sniff(info):
+    """Check whether a file is large enough that its leading bytes are read before downloading it."""
+    return bool(sniff_size) and (info.size is None or info.size > sniff_size)
+
+
+def sniff_content(service_type, info, head, seconds=None):
+    """
+    Decide from the leading bytes of a file whether to download and scan it.
+
+    Args:
+        service_type (str): Service the file is stored in.
+        info (CazFile): Description of the file.
+        head (bytes): Leading bytes of the file.
+        seconds (float): <Optional> Time taken to read the bytes.
+
+    Returns:
+        True if the file should be scanned. Skipped files are counted as sniff items.
+    """
+    scan, label = sniff.classify(head)
+    metrics.observe(SNIFF, service_type, seconds, size=len(head), items=0 if scan else 1)
+    if not scan:
+        logger.debug("Skipped file {} holding {} content".format(info.name, label))
+    return scan
+
+
+def sniff_item(service, item, info):
+    """
+    Read the leading bytes of a listed file and decide whether to download and scan it.
+
+    Files the handler can't read in part, or whose bytes couldn't be read, are scanned.
+
+    Args:
+        service (fileServiceInterface): Handler that listed the file.
+        item (object): Service specific file entry returned by list_files.
+        info (CazFile): Description of the file.
+
+    Returns:
+        True if the file should be scanned.
+    """
+    if not should_sniff(info):
+        return True
+
+    service_type = service.get_service_type()
+    start = time.monotonic()
+    try:
+        head = service.read_head(item, sniff_size)
+    except NotImplementedError:
+        return True
+    except Exception as ex:
+        metrics.observe(SNIFF, service_type, time.monotonic() - start, error=True)
+        logger.debug("Unable to sniff file {}. {}".format(info.name, ex))
+        return True
+    if head is None:
+        return True
+    return sniff_content(service_type, info, head, time.monotonic() - start)
+
+
+def service_path(info):
+    """Return the location of a file within its service for reporting matches."""
+    return info.path if info.path and info.path != 'None' else info.name
+
+
+def scan_cached(service_type, info, expressions, key=None):
+    """
+    Search the cached extracted text of a file without downloading it.
+
+    Args:
+        service_type (str): Service the file is stored in.
+        info (CazFile): Description of the file.
+        expressions (CazRegExp[]): List of regular expressions for content comparison.
+        key (str): <Optional> Cache key. Default: the content hash reported by the service
+
+    Returns:
+        List of CazRegMatch entries, or None if the text isn't cached.
+    """
+    key = key or content_key(info)
+    if text_cache is None or not key:
+        return None
+
+    text = text_cache.get(key)
+    if text is None:
+        return None
+
+    logger.debug("Using cached text for {}".format(info.name))
+    path = service_path(info)
+    if text.startswith(ARCHIVE_MARKER):
+        matches = []
+        for member, member_text in json.loads(text[len(ARCHIVE_MARKER):]):
+            matches.extend(analyze_text(member_text, path + member, expressions,
+                                        service_type=service_type))
+        return matches
+    return analyze_text(text, path, expressions, service_type=service_type)
+
+
+def scan_file(service_type, info, f_path, expressions, key=None):
+    """
+    Extract and search a local copy of a file, caching the extracted text.
+
+    Args:
+        service_type (str): Service the file is stored in.
+        info (CazFile): Description of the file.
+        f_path (str): Path of the local copy.
+        expressions (CazRegExp[]): List of regular expressions for content comparison.
+        key (str): <Optional> Cache key. Default: the content hash reported by the service
+
+    Returns:
+        List of CazRegMatch entries reported against the file's service path, or a
+        CazSkippedFile if the content couldn't be extracted.
+    """
+    matches = []
+    key = key or content_key(info)
+    cache = text_cache is not None and key
+    # Report the location within the service instead of the local copy
+    path = service_path(info)
+    if sniff_size and not should_sniff(info):
+        # Files too small to be sniffed before the download are sniffed before extraction
+        try:
+            with open(f_path, 'rb') as f:
+                head = f.read(sniff_size)
+        except OSError:
+            head = None
+        if head is not None and not sniff_content(service_type, info, head):
+            return matches
+    try:
+        members = iter_archive_text(f_path, path, service_type=service_type)
+        if members is not None:
+            cached = []
+            for member, text in members:
+                if isinstance(text, ExtractionSkipped):
+                    matches.append(cazobjects.CazSkippedFile(member, text.reason))
+                    # Don't cache an archive missing a member
+                    cache = False
+                    continue
+                matches.extend(analyze_text(text, member, expressions, service_type=service_type))
+                if cache:
+                    cached.append((member[len(path):], text))
+            if cache:
+                text_cache.put(key, ARCHIVE_MARKER + json.dumps(cached))
+            return matches
+
+        text = extract_text(f_path, service_type=service_type)
+        if cache:
+            text_cache.put(key, text)
+        matches = analyze_text(text, path, expressions, service_type=service_type)
+    except ExtractionSkipped as ex:
+        logger.warning("Skipped file {}. {}".format(info.name, ex.reason))
+        matches.append(cazobjects.CazSkippedFile(path, ex.reason))
+    except Exception as ex:
+        logger.error("Unable to parse content in file {}. {}".format(info.name, ex))
+        matches.append(cazobjects.CazSkippedFile(path, "Unable to parse content. {}".format(ex)))
+
+    return matches
+
+
+def iter_archive_text(f_path, path, service_type=None):
+    """
+    Extract the text of each member when a file is an archive.
+
+    Members are read into memory one at a time and extracted like any other
+    file, so nothing is written to disk. An archive only partly expanded, such as
+    one exceeding an expansion limit, ends with the archive itself reported as
+    skipped, so its truncated text is never cached.
+
+    Args:
+        f_path (str): Path of the local copy of the file.
+        path (str): Location of the file within the service.
+
+    Returns:
+        Generator of (archive!member path, extracted text or ExtractionSkipped), or None
+        if the file isn't an archive that can be expanded.
+    """
+    if archive_limits is None:
+        return None
+
+    with open(f_path, 'rb') as f:
+        if not archives.detect_expandable(f, path):
+            return None
+
+    def expand():
+        count = 0
+        with open(f_path, 'rb') as f:
+            try:
+                for member, data in archives.iter_members(f, path, os.path.getsize(f_path),
+                                                          archive_limits):
+                    count += 1
+                    try:
+                        yield member, extract_buffer(data, service_type=service_type)
+                    except ExtractionSkipped as ex:
+                        logger.warning("Skipped archive member {}. {}".format(member, ex.reason))
+                        yield member, ex
+            except archives.LimitExceeded as ex:
+                logger.warning("Stopped expanding archive {}. {}".format(path, ex))
+                yield path, ExtractionSkipped("archive expansion stopped, {}".format(ex))
+            except Exception as ex:
+                logger.warning("Unable to expand archive {}. {}".format(path, ex))
+                if not count:
+                    # Not an archive that can be expanded, extract it as a single file
+                    yield path, extract_text(f_path, service_type=service_type)
+                else:
+                    yield path, ExtractionSkipped("archive expansion stopped after {} members."
+                                                  " {}".format(count, ex))
+
+    return expand()
+
+
+def scan_downloaded(service_type, info, f_path, expressions):
+    """
+    Search a downloaded temporary copy of a file then remove it.
+
+    Args:
+        service_type (str): Service the file was downloaded from.
+        info (CazFile): Description of the file.
+        f_path (str): Path of the temporary copy.
+        expressions (CazRegExp[]): List of regular expressions for content comparison.
+
+    Returns:
+        List of CazRegMatch entries reported against the file's service path.
+    """
+    try:
+        metrics.observe(DOWNLOAD, service_type, size=os.path.getsize(f_path), items=1)
+    except OSError:
+        pass
+    matches = scan_file(service_type, info, f_path, expressions)
+    remove_temp_file(f_path, service_type)
+    return matches
+
+
+def remove_temp_file(f_path, service_type=None):
+    """Remove a temporary copy if it exists, logging any failure."""
+    try:
+        with metrics.timed(CLEANUP, service_type):
+            if os.path.exists(f_path):
+                os.remove(f_path)
+    except Exception as ex:
+        logger.error("Unable to clean up temporary file {}. {}".format(f_path, ex))
+
+
+def search_content(file_path, expressions, service_type=None):
     """Open a file and search it's contents against a set of RegEx."""
+    return analyze_text(extract_text(file_path, service_type=service_type),
+                         file_path,
+                         expressions,
+                         service_type=service_type)
+
+
+def extract_text(file_path, service_type=None):
+    """
+    Extract the text content of a file.
+
+    Returns:
+        Extracted text. Empty if there is no content that could be extracted.
+
+    Raises:
+        ExtractionSkipped: The extraction worker failed, timed out or ran out of memory.
+    """
+    with metrics.timed(EXTRACT, service_type, size=os.path.getsize(file_path), items=1):
+        if extraction_pool is not None:
+            return extraction_pool.extract_file(file_path)
+        data = get_parser().from_file(file_path)
+    if not data:
+        return ""
+    return data.get('content', None) or ""
+
+
+def extract_buffer(data, service_type=None):
+    """
+    Extract the text content of a file held in memory.
+
+    Returns:
+        Extracted text. Empty if there is no content that could be extracted.
+
+    Raises:
+        ExtractionSkipped: The extraction worker failed, timed out or ran out of memory.
+    """
+    with metrics.timed(EXTRACT, service_type, size=len(data), items=1):
+        if extraction_pool is not None:
+            return extraction_pool.extract_buffer(data)
+        res = get_parser().from_buffer(data)
+    if not res:
+        return ""
+    return res.get('content', None) or ""
+
+
+def analyze_text(text, file_path, expressions, service_type=None):
+    """
+    Search extracted text against a set of RegEx and the similarity index.
+
+    Args:
+        text (str): Extracted text of the file.
+        file_path (str): Path reported with each match.
+        expressions (CazRegExp[]): List of regular expressions for content comparison.
+
+    Returns:
+        List of CazRegMatch and CazSimilarMatch entries.
+    """
+    matches = match_content(text, file_path, expressions, service_type=service_type)
+    if similarity_index is not None and text:
+        with metrics.timed(SIMILARITY, service_type, size=len(text), items=1):
+            for reference, score in similarity_index.query(text):
+                matches.append(cazobjects.CazSimilarMatch(file_path, reference, score))
+    return matches
+
+
+def match_content(text, file_path, expressions, service_type=None):
+    """
+    Search extracted text against a set of RegEx.
+
+    Args:
+        text (str): Extracted text of the file.
+        file_path (str): Path reported with each match.
+        expressions (CazRegExp[]): List of regular expressions for content comparison.
+
+    Returns:
+        List of CazRegMatch entries, and a CazSkippedFile for every rule that exceeded
+        its time budget within the file.
+    """
     matches = []
     count = 0
-    data = parser.from_file(file_path)
-    # Read into an I/O buffer for better readline support
-    if not data:
+    budget = regex_budget
+    spent = {}
+    exhausted = set()
+    if not text:
         # There is no content that could be extracted
         return matches
 
-    content = io.StringIO(data['content'])
+    # Read into an I/O buffer for better readline support
+    content = io.StringIO(text)
     # TODO this may create a very large buffer for larger files
     # We may need to convert this to a while readline() loop
-    for line in content.readlines():
-        count += 1  # count the number of lines
-        if line:
-            for rex in expressions:
-                # Check if the line matches all the expressions
-                res = rex.regex.search(line)
-                if res:
-                    # If there's a match append to the list
-                    matches.append(cazobjects.CazRegMatch(res,
-                                                          file_path,
-                                                          count,
-                                                          rex.name))
+    with metrics.timed(MATCH, service_type, size=len(text)) as totals:
+        for line in content.readlines():
+            count += 1  # count the number of lines
+            if line:
+                for rex in expressions:
+                    # Check if the line matches all the expressions
+                    if exhausted and rex in exhausted:
+                        continue
+                    if profile_expressions or (budget and rex.backtracking):
+                        timed_out = False
+                        start = time.perf_counter()
+                        try:
+                            res = rex.search(line,
+                                             timeout=budget - spent.get(rex, 0.0) if budget else None)
+                        except TimeoutError:
+                            res, timed_out = None, True
+                        elapsed = time.perf_counter() - start
+                        if profile_expressions:
+                            rex.record(elapsed, len(line), res is not None)
+                        if budget:
+                            spent[rex] = spent.get(rex, 0.0) + elapsed
+                            if timed_out or spent[rex] > budget:
+                                # Stop evaluating a runaway rule for the rest of the file
+                                exhausted.add(rex)
+                                rex.record_abort()
+                                reason = "Rule {} exceeded its {} second budget at line {}".format(
+                                    rex.name, budget, count)
+                                logger.warning("{} of {}".format(reason, file_path))
+                                matches.append(cazobjects.CazSkippedFile(file_path, reason))
+                    else:
+                        res = rex.regex.search(line)
+                    if res:
+                        # If there's a match append to the list
+                        matches.append(cazobjects.CazRegMatch(res,
+                                                              file_path,
+                                                              count,
+                                                              rex.name))
+        totals["items"] = count
     return matches
+
+
+def format_expression_profile(expressions):
+    """
+    Build a report of the expressions ranked by the total time spent evaluating them.
+
+    Args:
+        expressions (CazRegExp[]): Expressions evaluated while profiling.
+
+    Returns:
+        Multi-line report string.
+    """
+    total = sum(x.seconds for x in expressions) or 1.0
+    lines = ["Expression profile (ranked by total evaluation time):",
+             "{:>4} {:<24} {:>10} {:>7} {:>12} {:>14} {:>8} {:>12} {:>6} {:>8}".format("Rank",
+                                                                                       "Name",
+                                                                                       "Total(s)",
+                                                                                       "Share",
+                                                                                       "Lines",
+                                                                                       "Bytes",
+                                                                                       "Hits",
+                                                                                       "Worst(ms)",
+                                                                                       "Engine",
+                                                                                       "Aborted")]
+    ranked = sorted(expressions, key=lambda x: x.seconds, reverse=True)
+    for rank, x in enumerate(ranked, 1):
+        lines.append("{:>4} {:<24} {:>10.3f} {:>6.1f}% {:>12} {:>14} {:>8} {:>12.3f} {:>6} {:>8}".format(
+            rank,
+            x.name[:24],
+            x.seconds,
+            100.0 * x.seconds / total,
+            x.evaluations,
+            x.bytes,
+            x.hits,
+            x.max_seconds * 1000,
+            x.engine,
+            x.aborted))
+    return "\n".join(lines)
@@ -0,0 +1,369 @@
+"""
+Cazador scan checkpointing module.
+
+Long running scans periodically save the crawl frontier and the matches found
+so far so an interrupted run can be resumed without crawling the service again.
+
+Handlers describe their crawl as named streams (a bucket, a folder shard, a
+folder, a query) listed one page at a time. Every page is recorded with the
+token used to request it. A stream's frontier is the token of the oldest page
+that still has files waiting to be scanned, so a resumed run re-requests at
+most the pages that were in flight and skips the files already scanned.
+
+The frontier is small and rewritten on every save, but the matches grow with
+the scan, so each save only appends the matches found since the last one to a
+separate file. The frontier records how much of that file it covers, and
+anything written past that point by an interrupted save is dropped on resume.
+
+Created: 10/19/2026
+"""
+
+import os
+import json
+import gzip
+import hashlib
+import logging
+import threading
+from cazobjects import match_from_dict
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_VERSION = 2
+
+
+def scan_fingerprint(expressions, config_fields=None, similarity_index=None):
+    """
+    Return a stable fingerprint of the scan a checkpoint was made for.
+
+    Args:
+        expressions (CazRegEx[]): Rules the matches were found with.
+        config_fields (dict): <Optional> Configuration segment of the service scanned.
+        similarity_index (MinHashIndex): <Optional> Reference documents files were compared to.
+    """
+    h = hashlib.sha1()
+    for x in sorted(expressions or [], key=lambda r: r.name):
+        h.update("{}={}\n".format(x.name, x.expression).encode('utf-8'))
+    if similarity_index is not None:
+        h.update("similarity={}\n".format(similarity_index.threshold).encode('utf-8'))
+        for name in sorted(similarity_index.signatures):
+            h.update("reference={}\n".format(name).encode('utf-8'))
+    for k in sorted(config_fields or {}):
+        h.update("{}={}\n".format(k, config_fields[k]).encode('utf-8'))
+    return h.hexdigest()
+
+
+class NullCheckpoint:
+    """Checkpoint used when checkpointing is disabled. Every call is a no-op."""
+
+    matches = []
+
+    def position(self, stream):
+        return False, None
+
+    def streams(self, prefix=""):
+        return {}
+
+    def discover(self, stream):
+        pass
+
+    def page(self, stream, token, items, key, next_token=None):
+        return items
+
+    def finish(self, key, matches, summary=None):
+        if summary is not None:
+            summary.add(matches)
+
+
+class _Page:
+    """A single listing page awaiting its files to be scanned."""
+
+    __slots__ = ("token", "next_token", "pending", "done")
+
+    def __init__(self, token, next_token):
+        self.token = token
+        self.next_token = next_token
+        self.pending = set()
+        self.done = set()
+
+
+class _Stream:
+    """Listing progress of one stream."""
+
+    def __init__(self, token=None, complete=False, done=None):
+        self.pages = []
+        # Position to continue from once every recorded page has been scanned
+        self.token = token
+        self.exhausted = complete
+        # Files already scanned before the run was resumed
+        self.restored = set(done or [])
+
+    def frontier(self):
+        """Return (complete, token, done keys) describing where to resume this stream."""
+        if self.pages:
+            done = set(self.restored)
+            for p in self.pages:
+                done.update(p.done)
+            return False, self.pages[0].token, done
+        return self.exhausted, self.token, set(self.restored) if not self.exhausted else set()
+
+
+class Checkpoint:
+    """Periodically saved crawl frontier and results of a single service scan."""
+
+    def __init__(self, path, fingerprint=None, interval=60.0):
+        """
+        Initialize a checkpoint.
+
+        Args:
+            path (str): File the checkpoint is saved to. Matches are appended to the
+                        same path with a .matches extension.
+            fingerprint (str): <Optional> Identifies the scan. A saved checkpoint made
+                               for another scan is not resumed.
+            interval (float): <Optional> Seconds between periodic saves.
+        """
+        self.path = path
+        self.matches_path = path + ".matches"
+        self.fingerprint = fingerprint
+        self.interval = interval
+        # Matches restored from an earlier run
+        self.matches = []
+        # Matches found since the last save, and the size of the matches file it covers
+        self._pending = []
+        self._matches_size = 0
+        # Aggregates saved and restored with the checkpoint in summary scans (see summary.MatchSummary)
+        self.summary = None
+        self._streams = {}
+        self._keys = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def load(self):
+        """
+        Load the last saved checkpoint.
+
+        Returns:
+            True if a checkpoint was restored.
+        """
+        if not os.path.exists(self.path):
+            return False
+
+        try:
+            with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as ex:
+            logger.error("Unable to read checkpoint {}. {}".format(self.path, ex))
+            return False
+
+        if data.get("version") != CHECKPOINT_VERSION or data.get("fingerprint") != self.fingerprint:
+            logger.warning("Checkpoint {} was made for a different scan. Starting over.".format(
+                self.path))
+            return False
+
+        size = data.get("matches_size", 0)
+        try:
+            matches = []
+            if size:
+                with open(self.matches_path, 'rb') as f:
+                    # Only the part of the file the frontier was saved with
+                    lines = gzip.decompress(f.read(size)).decode('utf-8').splitlines()
+                matches = [match_from_dict(json.loads(x)) for x in lines if x]
+        except Exception as ex:
+            logger.error("Unable to read checkpoint matches {}. {}".format(self.matches_path, ex))
+            return False
+
+        with self._lock:
+            self._streams = {}
+            for name, s in data.get("streams", {}).items():
+                self._streams[name] = _Stream(s.get("token"), s.get("complete", False),
+                                              s.get("done"))
+            self.matches = matches
+            self._pending = []
+            self._matches_size = size
+            if self.summary is not None and data.get("summary"):
+                self.summary.restore(data["summary"])
+
+        logger.info("Resuming from checkpoint {} with {} streams and {} matches".format(
+            self.path, len(self._streams), len(self.matches)))
+        return True
+
+    def position(self, stream):
+        """
+        Return where a stream should be listed from.
+
+        Returns:
+            Tuple of (complete, token). Complete streams need no further listing and a
+            token of None starts the stream from the beginning.
+        """
+        with self._lock:
+            s = self._streams.get(stream)
+            if s is None:
+                return False, None
+            complete, token, _ = s.frontier()
+            return complete, token
+
+    def streams(self, prefix=""):
+        """
+        Return the known streams starting with a prefix.
+
+        Returns:
+            Dictionary of stream name to (complete, token).
+        """
+        with self._lock:
+            res = {}
+            for name, s in self._streams.items():
+                if name.startswith(prefix):
+                    complete, token, _ = s.frontier()
+                    res[name] = (complete, token)
+            return res
+
+    def discover(self, stream):
+        """Record a stream found while crawling, such as a sub-folder, so it is resumed."""
+        with self._lock:
+            if stream not in self._streams:
+                self._streams[stream] = _Stream()
+
+    def page(self, stream, token, items, key, next_token=None):
+        """
+        Record a listing page.
+
+        Args:
+            stream (str): Name of the stream the page belongs to.
+            token (object): JSON serializable token used to request the page.
+            items (object[]): Service specific file entries to scan from the page.
+            key (func): Returns a unique key for a file entry.
+            next_token (object): <Optional> Token requesting the following page, or None
+                                 if this is the last page of the stream.
+
+        Returns:
+            List of the file entries that still need to be scanned.
+        """
+        with self._lock:
+            s = self._streams.setdefault(stream, _Stream())
+            p = _Page(token, next_token)
+            remaining = []
+            for x in items:
+                k = key(x)
+                if k in s.restored:
+                    p.done.add(k)
+                    continue
+                p.pending.add(k)
+                self._keys[k] = (s, p)
+                remaining.append(x)
+
+            s.pages.append(p)
+            self._advance(s)
+            return remaining
+
+    def finish(self, key, matches, summary=None):
+        """
+        Record a scanned file and the matches found in it.
+
+        Args:
+            key (str): Key of the file, as passed to page.
+            matches (object[]): Results found in the file.
+            summary (MatchSummary): <Optional> Aggregate the matches into this summary instead
+                                    of keeping them. It is updated together with the file's
+                                    position, so a save never records one without the other.
+        """
+        with self._lock:
+            if summary is not None:
+                summary.add(matches)
+            else:
+                self._pending.extend(matches)
+            entry = self._keys.pop(key, None)
+            if entry is None:
+                return
+            s, p = entry
+            p.pending.discard(key)
+            p.done.add(key)
+            self._advance(s)
+
+    def _advance(self, s):
+        """Drop fully scanned pages from the front of a stream."""
+        while s.pages and not s.pages[0].pending:
+            p = s.pages.pop(0)
+            s.token = p.next_token
+            s.exhausted = p.next_token is None
+            # Keys restored from an earlier run are only needed until their page is passed
+            s.restored.difference_update(p.done)
+
+    def _state(self):
+        """Return the frontier and summary as a JSON serializable dictionary. Called with the lock held."""
+        streams = {}
+        for name, s in self._streams.items():
+            complete, token, done = s.frontier()
+            streams[name] = {"complete": complete, "token": token, "done": sorted(done)}
+        return {"version": CHECKPOINT_VERSION,
+                "fingerprint": self.fingerprint,
+                "streams": streams,
+                "summary": self.summary.to_dict() if self.summary is not None else None}
+
+    def save(self):
+        """
+        Append the new matches, then write the frontier, replacing the previous one
+        only once fully written.
+        """
+        # The frontier and the matches are taken together so they describe the same files
+        with self._lock:
+            data = self._state()
+            pending, self._pending = self._pending, []
+
+        try:
+            size = self._matches_size
+            if pending or not size:
+                with open(self.matches_path, 'ab') as f:
+                    # Drop anything an earlier failed save wrote past the saved frontier
+                    f.truncate(size)
+                    f.seek(size)
+                    if pending:
+                        lines = "".join(json.dumps(x.to_dict()) + "\n" for x in pending)
+                        f.write(gzip.compress(lines.encode('utf-8')))
+                    size = f.tell()
+
+            data["matches_size"] = size
+            temp_path = self.path + ".tmp"
+            with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(temp_path, self.path)
+            self._matches_size = size
+        except Exception as ex:
+            with self._lock:
+                self._pending = pending + self._pending
+            logger.error("Unable to save checkpoint {}. {}".format(self.path, ex))
+
+    def start(self):
+        """Start saving the checkpoint periodically in the background."""
+        def run():
+            while not self._stop.wait(self.interval):
+                self.save()
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="checkpoint", daemon=True)
+        self._thread.start()
+
+    def stop(self, completed=False):
+        """
+        Stop the periodic saves.
+
+        Args:
+            completed (bool): <Optional> The scan finished so the checkpoint is removed,
+                              otherwise a final save is made.
+        """
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+        if completed:
+            self.remove()
+        else:
+            self.save()
+
+    def remove(self):
+        """Delete the saved checkpoint and its matches."""
+        for path in (self.path, self.matches_path):
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except Exception as ex:
+                logger.error("Unable to remove checkpoint {}. {}".format(path, ex))
@@ -0,0 +1,161 @@
+"""
+Cazador connection management module.
+
+Handlers build their HTTP clients through this module so connection pools are
+sized to the number of workers using them, connections are kept alive between
+downloads, and SDK clients that are not thread safe get one instance per
+thread. Every pool registers itself so utilization can be reported.
+
+Created: 10/19/2026
+"""
+
+import threading
+import logging
+logger = logging.getLogger(__name__)
+
+# Pool size used when the configuration doesn't size it
+DEFAULT_POOL_SIZE = 16
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def pool_size(config_fields, default=DEFAULT_POOL_SIZE):
+    """
+    Determine the connection pool size for a handler.
+
+    Configuration Fields:
+        pool_size (int): <Optional> Explicit connection pool size
+        workers (int): <Optional> Number of handler workers
+        max_concurrency (int): <Optional> Upper bound of scheduled requests in flight
+    """
+    for field in ("pool_size", "workers", "max_concurrency"):
+        try:
+            return max(1, int(config_fields[field]))
+        except:
+            pass
+    return default
+
+
+def register_pool(name, stats):
+    """
+    Register a connection pool for utilization reporting.
+
+    Args:
+        name (str): Unique pool name.
+        stats (callable): Method returning a dictionary of pool statistics.
+    """
+    with _pools_lock:
+        _pools[name] = stats
+
+
+def pool_stats():
+    """Return the utilization statistics of every registered pool keyed by name."""
+    with _pools_lock:
+        pools = dict(_pools)
+
+    results = {}
+    for name, stats in pools.items():
+        try:
+            results[name] = stats()
+        except Exception as ex:
+            logger.debug("Unable to read pool {} statistics. {}".format(name, ex))
+    return results
+
+
+def urllib3_stats(pool_manager, maxsize):
+    """Summarize the host pools held by a urllib3 PoolManager."""
+    hosts = {}
+    for key in list(pool_manager.pools.keys()):
+        pool = pool_manager.pools.get(key)
+        if pool is None:
+            continue
+        idle = pool.pool.qsize() if pool.pool is not None else 0
+        hosts[pool.host] = {"maxsize": maxsize,
+                            "opened": pool.num_connections,
+                            "requests": pool.num_requests,
+                            "idle": idle}
+    return hosts
+
+
+def requests_session(name, size):
+    """
+    Create a requests Session with keep-alive pools sized to the workers.
+
+    Args:
+        name (str): Pool name used for utilization reporting.
+        size (int): Maximum connections kept open per host.
+
+    Returns:
+        requests.Session
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=size, pool_maxsize=size, pool_block=True)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    register_pool(name, lambda: urllib3_stats(adapter.poolmanager, size))
+    return session
+
+
+def botocore_config(size):
+    """
+    Create a botocore Config with a connection pool sized to the workers.
+
+    botocore's own retries are turned off so throttled requests, such as S3's 503
+    SlowDown, reach the shared request scheduler, which backs off every worker at
+    once instead of each retrying on its own. The scheduler also retries the
+    connection errors, timeouts and 500 InternalError responses botocore would have.
+
+    Args:
+        size (int): Maximum connections kept open per host.
+
+    Returns:
+        botocore.config.Config
+    """
+    from botocore.config import Config
+    return Config(max_pool_connections=size,
+                  retries={'max_attempts': 0, 'mode': 'standard'})
+
+
+def register_boto3_pool(name, resource, size):
+    """Register the connection pool behind a boto3 resource for reporting."""
+    def stats():
+        http = resource.meta.client._endpoint.http_session
+        manager = getattr(http, '_manager', None)
+        if manager is None:
+            # Older botocore vendors a requests session
+            manager = http.adapters['https://'].poolmanager
+        return urllib3_stats(manager, size)
+
+    register_pool(name, stats)
+
+
+class ThreadLocalClient:
+    """Lazily create one client per thread for SDKs that are not thread safe."""
+
+    def __init__(self, name, factory):
+        """
+        ThreadLocalClient initializer.
+
+        Args:
+            name (str): Pool name used for utilization reporting.
+            factory (callable): Method creating a new client for the calling thread.
+        """
+        self.factory = factory
+        self.local = threading.local()
+        self.created = 0
+        self.lock = threading.Lock()
+        register_pool(name, lambda: {"clients": self.created})
+
+    def get(self):
+        """Return the calling thread's client, creating it on first use."""
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.factory()
+            self.local.client = client
+            with self.lock:
+                self.created += 1
+        return client
@@ -0,0 +1,489 @@
+"""
+Cazador isolated text extraction module.
+
+Text is extracted in a pool of worker processes instead of the scanning
+process, so a pathological file can only take down its own worker. Each
+extraction has a wall clock timeout and a resident memory cap enforced by the
+scanning process, which kills the worker and reports the file as skipped with
+the reason. Workers are recycled after a fixed number of files to return any
+memory leaked by the parser.
+
+tika-python only sends requests to a Tika server running in a JVM, so each
+worker starts a Tika server of its own instead of sharing one. The limits apply
+to the worker together with every process it started: the memory cap counts the
+JVM, and a timed out or recycled worker is killed along with its JVM, so no
+other worker is left queued behind a file still being parsed. Workers lead their
+own process group, so the JVM is found even after its worker has crashed.
+
+The JVM's heap is capped below the memory limit, since its default of a quarter
+of physical memory would outgrow the limit on most hosts. A worker starts its
+server before it takes its first file, so Java startup doesn't count against
+the extraction timeout.
+
+Created: 10/19/2026
+"""
+
+import os
+import time
+import queue
+import signal
+import socket
+import threading
+import subprocess
+import multiprocessing
+from urllib.parse import urlparse
+from urllib.request import urlretrieve
+import logging
+logger = logging.getLogger(__name__)
+
+# Kinds of extraction request
+FILE, BUFFER = "file", "buffer"
+
+# Seconds a worker waits for its Tika server to accept connections
+TIKA_STARTUP_TIMEOUT = 120
+
+# Memory left out of a worker's limit for the JVM outside its heap and for the worker itself
+TIKA_HEAP_HEADROOM = 512 * 1024 * 1024
+TIKA_MIN_HEAP = 128 * 1024 * 1024
+
+# Tika server started by this worker process, as (process, endpoint)
+_tika_server = None
+# Memory limit of this worker, used to size its Tika server's heap
+_tika_max_rss = None
+
+
+class ExtractionSkipped(Exception):
+    """Raised when a file's text couldn't be extracted. The reason is reported with the file."""
+
+    def __init__(self, reason):
+        super(ExtractionSkipped, self).__init__(reason)
+        self.reason = reason
+
+
+def process_rss(pid):
+    """
+    Return the resident memory of a process in bytes.
+
+    Uses psutil when it is installed, falling back to /proc on Linux.
+
+    Returns:
+        Resident bytes, or None if it can't be measured on this platform.
+    """
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except ImportError:
+        pass
+    except Exception:
+        return None
+
+    try:
+        with open("/proc/{}/statm".format(pid)) as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def process_tree(pid):
+    """
+    Return the pids of a process and all of its descendants.
+
+    Uses psutil when it is installed, falling back to /proc on Linux.
+
+    Returns:
+        List of pids starting with the process itself.
+    """
+    try:
+        import psutil
+        return [pid] + [x.pid for x in psutil.Process(pid).children(recursive=True)]
+    except ImportError:
+        pass
+    except Exception:
+        return [pid]
+
+    try:
+        names = os.listdir("/proc")
+    except OSError:
+        return [pid]
+    children = {}
+    for name in names:
+        if not name.isdigit():
+            continue
+        try:
+            with open("/proc/{}/stat".format(name)) as f:
+                stat = f.read()
+            # The command name may hold spaces, so the fields are read after its closing paren
+            ppid = int(stat.rpartition(')')[2].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(name))
+
+    tree = []
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, []))
+    return tree
+
+
+def tree_rss(pids):
+    """Return the resident memory of the processes listed by process_tree in bytes, or None."""
+    sizes = [process_rss(x) for x in pids]
+    if sizes[0] is None:
+        return None
+    return sum(x for x in sizes if x)
+
+
+def kill_processes(pids):
+    """Kill a list of processes, ignoring any that already exited."""
+    for pid in pids:
+        try:
+            os.kill(pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+        except OSError:
+            pass
+
+
+def tika_server_jar():
+    """Return the local path of the Tika server jar, downloading it the way tika-python does."""
+    from tika import tika
+    if not urlparse(tika.TikaServerJar).scheme:
+        return os.path.abspath(tika.TikaServerJar)
+    path = os.path.join(tika.TikaJarPath, "tika-server.jar")
+    if not os.path.isfile(path):
+        # Workers starting at once may all download it, so each writes its own copy first
+        temp_path = "{}.{}.tmp".format(path, os.getpid())
+        urlretrieve(tika.TikaServerJar, temp_path)
+        os.replace(temp_path, path)
+    return path
+
+
+def tika_heap(max_rss):
+    """
+    Return the Java heap size of a worker's Tika server.
+
+    Args:
+        max_rss (int): Resident memory in bytes the worker and its Tika server may reach together.
+
+    Returns:
+        Heap size in megabytes, or None to leave the JVM default.
+    """
+    if not max_rss:
+        return None
+    return max(TIKA_MIN_HEAP, max_rss - TIKA_HEAP_HEADROOM) // (1024 * 1024)
+
+
+def _tika_endpoint(max_rss=None):
+    """Return the endpoint of this worker's own Tika server, starting it if needed."""
+    global _tika_server, _tika_max_rss
+    if max_rss is not None:
+        # Kept so a server that exited is restarted with the same heap
+        _tika_max_rss = max_rss
+    if _tika_server is not None and _tika_server[0].poll() is None:
+        return _tika_server[1]
+
+    from tika import tika
+    # Never let tika-python start or reuse the shared server on its default port
+    tika.TikaClientOnly = True
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    command = ["java", "-jar", tika_server_jar(), "--host", "127.0.0.1", "--port", str(port)]
+    heap = tika_heap(_tika_max_rss)
+    if heap:
+        command.insert(1, "-Xmx{}m".format(heap))
+    process = subprocess.Popen(command,
+                               stdin=subprocess.DEVNULL,
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + TIKA_STARTUP_TIMEOUT
+    while True:
+        if process.poll() is not None:
+            raise RuntimeError("Tika server exited with code {}".format(process.returncode))
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            break
+        except OSError:
+            if time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError("Tika server didn't start within {} seconds".format(
+                    TIKA_STARTUP_TIMEOUT))
+            time.sleep(0.5)
+
+    _tika_server = (process, "http://127.0.0.1:{}".format(port))
+    return _tika_server[1]
+
+
+def tika_start(max_rss):
+    """Start this worker's Tika server before it takes any files."""
+    _tika_endpoint(max_rss)
+
+
+def tika_parse(kind, payload):
+    """Extract the text of a file path or buffer with this worker's Tika server."""
+    from tika import parser
+    endpoint = _tika_endpoint()
+    if kind == FILE:
+        data = parser.from_file(payload, serverEndpoint=endpoint)
+    else:
+        data = parser.from_buffer(payload, serverEndpoint=endpoint)
+    if not data:
+        return ""
+    return data.get('content', None) or ""
+
+
+def _worker_main(conn, parse, start, max_rss):
+    """Prepare the parser, then extract the text of every request received until told to stop."""
+    # Interrupts are handled by the scanning process, which stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if hasattr(os, "setpgrp"):
+        # Lead a process group, so the processes started here can be killed even after a crash
+        os.setpgrp()
+    error = None
+    if start:
+        try:
+            start(max_rss)
+        except Exception as ex:
+            error = "{}: {}".format(type(ex).__name__, ex)
+    try:
+        conn.send(("ready", error, tree_rss(process_tree(os.getpid()))))
+    except (EOFError, OSError):
+        return
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            break
+        if request is None:
+            break
+
+        kind, payload = request
+        try:
+            res = ("ok", parse(kind, payload))
+        except Exception as ex:
+            res = ("error", "{}: {}".format(type(ex).__name__, ex))
+        try:
+            conn.send(res + (tree_rss(process_tree(os.getpid())),))
+        except (EOFError, OSError):
+            break
+
+
+class _Worker:
+    """A single extraction process and the pipe used to talk to it."""
+
+    def __init__(self, context, parse, start=None, max_rss=None):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child, parse, start, max_rss),
+                                       daemon=True)
+        self.process.start()
+        child.close()
+        self.files = 0
+        # Set once the worker has reported that its parser is up
+        self.ready = False
+
+    def stop(self, kill=False):
+        """Stop the worker, killing it if it is busy, along with every process it started."""
+        # Collected first, since the worker's children are reparented once it exits
+        children = process_tree(self.process.pid)[1:] if self.process.is_alive() else []
+        try:
+            if kill:
+                self.process.kill() if hasattr(self.process, 'kill') else self.process.terminate()
+            else:
+                self.conn.send(None)
+        except (EOFError, OSError):
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(5)
+        kill_processes(children)
+        if hasattr(os, "killpg"):
+            try:
+                os.killpg(self.process.pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+            except OSError:
+                pass
+        self.conn.close()
+
+
+class ExtractionPool:
+    """Pool of worker processes extracting text with per file limits."""
+
+    def __init__(self, workers=4, timeout=300.0, max_rss=2 * 1024 * 1024 * 1024, max_files=200,
+                 parse=tika_parse, start=tika_start, start_method="spawn", poll_interval=0.2,
+                 startup_timeout=TIKA_STARTUP_TIMEOUT + 30):
+        """
+        Initialize the pool. Workers are started as they are first needed.
+
+        Args:
+            workers (int): <Optional> Maximum number of worker processes.
+            timeout (float): <Optional> Seconds a single extraction may run.
+            max_rss (int): <Optional> Resident memory in bytes a worker and the processes it
+                           started, such as its Tika server, may reach together.
+            max_files (int): <Optional> Files extracted by a worker before it is replaced.
+            parse (func): <Optional> Module level function called in the worker with
+                          (kind, payload) returning the extracted text.
+            start (func): <Optional> Module level function called in a new worker with max_rss
+                          before it takes any files, such as to start its Tika server. None
+                          when the parser needs no preparation.
+            start_method (str): <Optional> multiprocessing start method of the workers.
+            poll_interval (float): <Optional> Seconds between checks of a busy worker.
+            startup_timeout (float): <Optional> Seconds a new worker may take to start its parser.
+        """
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.max_rss = max_rss
+        self.max_files = max_files
+        self.parse = parse
+        self.start = start
+        self.poll_interval = poll_interval
+        self.startup_timeout = startup_timeout
+        self._context = multiprocessing.get_context(start_method)
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = 0
+        self._all = set()
+        self.totals = {"files": 0, "recycled": 0, "timeout": 0, "memory": 0, "error": 0, "crashed": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.totals[name] += 1
+
+    def _acquire(self):
+        """Take an idle worker, starting a new one if the pool isn't full."""
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+
+            with self._lock:
+                start = self._started < self.workers
+                if start:
+                    self._started += 1
+            if start:
+                try:
+                    worker = _Worker(self._context, self.parse, self.start, self.max_rss)
+                except Exception:
+                    with self._lock:
+                        self._started -= 1
+                    raise
+                with self._lock:
+                    self._all.add(worker)
+                return worker
+
+            # Wake up periodically in case a discarded worker freed a slot
+            try:
+                return self._idle.get(timeout=self.poll_interval)
+            except queue.Empty:
+                pass
+
+    def _release(self, worker, rss=None):
+        """Return a worker to the pool, replacing it once it has reached its limits."""
+        worker.files += 1
+        if worker.files >= self.max_files or (rss and self.max_rss and rss > self.max_rss):
+            self._count("recycled")
+            self._discard(worker)
+        else:
+            self._idle.put(worker)
+
+    def _discard(self, worker, kill=False):
+        """Stop a worker so a replacement is started when one is next needed."""
+        with self._lock:
+            self._all.discard(worker)
+            self._started -= 1
+        worker.stop(kill=kill)
+
+    def extract_file(self, path):
+        """Extract the text of a file. Raises ExtractionSkipped if it can't be."""
+        return self._run(FILE, path)
+
+    def extract_buffer(self, data):
+        """Extract the text of a file held in memory. Raises ExtractionSkipped if it can't be."""
+        return self._run(BUFFER, bytes(data))
+
+    def _wait_ready(self, worker):
+        """Wait for a new worker to start its parser. Raises ExtractionSkipped if it can't."""
+        deadline = time.monotonic() + self.startup_timeout if self.startup_timeout else None
+        while not worker.conn.poll(self.poll_interval):
+            if not worker.process.is_alive():
+                self._count("crashed")
+                self._discard(worker, kill=True)
+                raise ExtractionSkipped("extraction worker exited with code {}".format(
+                    worker.process.exitcode))
+            if deadline and time.monotonic() > deadline:
+                self._count("crashed")
+                self._discard(worker, kill=True)
+                raise ExtractionSkipped("extraction worker didn't start within {} seconds".format(
+                    self.startup_timeout))
+        try:
+            status, error, rss = worker.conn.recv()
+        except (EOFError, OSError):
+            status, error = "ready", "exited with code {}".format(worker.process.exitcode)
+        if error:
+            self._count("crashed")
+            self._discard(worker, kill=True)
+            raise ExtractionSkipped("extraction worker failed to start. {}".format(error))
+        worker.ready = True
+
+    def _run(self, kind, payload):
+        self._count("files")
+        worker = self._acquire()
+        if not worker.ready:
+            self._wait_ready(worker)
+        try:
+            worker.conn.send((kind, payload))
+        except (EOFError, OSError) as ex:
+            self._count("crashed")
+            self._discard(worker, kill=True)
+            raise ExtractionSkipped("extraction worker unavailable. {}".format(ex))
+
+        deadline = time.monotonic() + self.timeout if self.timeout else None
+        while True:
+            if worker.conn.poll(self.poll_interval):
+                try:
+                    status, value, rss = worker.conn.recv()
+                except (EOFError, OSError):
+                    self._count("crashed")
+                    self._discard(worker, kill=True)
+                    raise ExtractionSkipped("extraction worker exited with code {}".format(
+                        worker.process.exitcode))
+                self._release(worker, rss)
+                if status == "error":
+                    self._count("error")
+                    raise ExtractionSkipped("extraction failed. {}".format(value))
+                return value
+
+            if not worker.process.is_alive():
+                self._count("crashed")
+                self._discard(worker, kill=True)
+                raise ExtractionSkipped("extraction worker exited with code {}".format(
+                    worker.process.exitcode))
+
+            if deadline and time.monotonic() > deadline:
+                self._count("timeout")
+                self._discard(worker, kill=True)
+                raise ExtractionSkipped("extraction timed out after {} seconds".format(self.timeout))
+
+            if self.max_rss:
+                rss = tree_rss(process_tree(worker.process.pid))
+                if rss and rss > self.max_rss:
+                    self._count("memory")
+                    self._discard(worker, kill=True)
+                    raise ExtractionSkipped("extraction exceeded {} MB of memory".format(
+                        self.max_rss // (1024 * 1024)))
+
+    def stats(self):
+        """Return a dictionary of the pool totals."""
+        with self._lock:
+            res = dict(self.totals)
+            res["workers"] = self._started
+        return res
+
+    def close(self):
+        """Stop every worker."""
+        with self._lock:
+            workers = list(self._all)
+            self._all.clear()
+            self._started = 0
+        for worker in workers:
+            worker.stop()
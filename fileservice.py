@@ -8,7 +8,12 @@ Created: 08/11/2016
 Creator: Nathan Palmer
 """
 
+import os
+import logging
 from abc import ABCMeta, abstractmethod
+from checkpoint import NullCheckpoint
+from transfer import evidence_path, DEFAULT_CHUNK_SIZE, DEFAULT_WORKERS
+logger = logging.getLogger(__name__)
 
 
 class fileServiceInterface(metaclass=ABCMeta):
@@ -17,8 +22,26 @@ class fileServiceInterface(metaclass=ABCMeta):
     Initializers for derived classes are required to accept the following arguments:
         config_fields (dict): Configuration dictionary loaded from file.
         logging        (log): Standard python logging interface
+
+    Handlers record their listing progress against the checkpoint attribute so an
+    interrupted scan can be resumed. It is a no-op unless a checkpoint is attached.
     """
 
+    checkpoint = NullCheckpoint()
+    # Only files owned by this shard are scanned when set (see sharding.Shard)
+    shard = None
+    # Parallel ranged requests and their size used by fetch_file (see transfer)
+    download_workers = DEFAULT_WORKERS
+    download_chunk_size = DEFAULT_CHUNK_SIZE
+    # Bytes per request when download_file splits large files, used to plan scans
+    download_part_size = None
+    # Listed files are scanned best score first when set (see priority.PriorityScheduler)
+    priority = None
+    # Matches are aggregated instead of reported when set (see summary.MatchSummary)
+    summary = None
+    # Hash crawls of find_file also report files listed in this ioc.IOCStore when set
+    iocs = None
+
     @staticmethod
     @abstractmethod
     def get_service_type():
@@ -54,6 +77,94 @@ class fileServiceInterface(metaclass=ABCMeta):
 
         return results
 
+    def describe_file(self, item):
+        """
+        Describe a listed file without making any additional service requests.
+
+        Args:
+            item (object): Service specific file entry returned by list_files.
+
+        Returns:
+            cazobject.CazFile
+        """
+        raise NotImplementedError
+
+    def checkpoint_key(self, item):
+        """
+        Return a key identifying a listed file within the checkpoint.
+
+        Args:
+            item (object): Service specific file entry returned by list_files.
+
+        Returns:
+            Unique key string for the file.
+        """
+        return self.describe_file(item).file_id
+
+    def record_page(self, stream, token, items, next_token=None):
+        """
+        Filter a listing page to the files owned by this shard and record it with the checkpoint.
+
+        Args:
+            stream (str): Name of the listing stream the page belongs to.
+            token (object): Token used to request the page.
+            items (object[]): Service specific file entries from the page.
+            next_token (object): <Optional> Token requesting the following page, if any.
+
+        Returns:
+            List of the file entries to scan.
+        """
+        if self.shard:
+            items = [x for x in items if self.shard.owns(self.checkpoint_key(x))]
+        return self.checkpoint.page(stream, token, items, self.checkpoint_key, next_token)
+
+    def list_files(self):
+        """
+        Walk the configured locations of the service.
+
+        Returns:
+            Generator of the service specific file entries that are candidates for scanning.
+        """
+        raise NotImplementedError
+
+    def schedule(self, items):
+        """
+        Order listed files for scanning by the priority scheduler, if one is attached.
+
+        Args:
+            items (iterable): Service specific file entries returned by list_files.
+
+        Returns:
+            Iterable of the same entries, highest priority first.
+        """
+        if self.priority is None:
+            return items
+        return self.priority.order(items, self.describe_file)
+
+    def read_head(self, item, size):
+        """
+        Read the leading bytes of a listed file without downloading all of it.
+
+        Args:
+            item (object): Service specific file entry returned by list_files.
+            size (int): Number of bytes to read.
+
+        Returns:
+            Up to size bytes from the start of the file, or None if the file can't be read
+            in part (e.g. it has no downloadable content).
+        """
+        raise NotImplementedError
+
+    def download_file(self, item, f_path):
+        """
+        Download the contents of a listed file.
+
+        Args:
+            item (object): Service specific file entry returned by list_files.
+            f_path (str): Local path to write the file contents to.
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def scan_files(self, temp_dir, expressions):
         """
@@ -87,8 +198,17 @@ class fileServiceInterface(metaclass=ABCMeta):
         """
         raise NotImplementedError
 
-    @abstractmethod
-    def get_file(self, name=None, md5=None, sha1=None):
+    def fetch_file(self, info, f_path):
+        """
+        Download a verified copy of a found file, resuming any partial copy.
+
+        Args:
+            info (CazFile): File returned by find_file.
+            f_path (str): Local path to save the copy to.
+        """
+        raise NotImplementedError
+
+    def get_file(self, name=None, md5=None, sha1=None, dest_dir=None):
         """
         Search for a file by name or hash and download a copy.
 
@@ -103,8 +223,31 @@ class fileServiceInterface(metaclass=ABCMeta):
             name (string): Filename to find.
             md5 (string): MD5 hash of the file to find.
             sha1 (string): SHA1 hash of the file to find.
+            dest_dir (string): <Optional> Directory to save the copies to. Default: working directory
 
         Returns:
-            List of files matching the request parameters.
+            List of (CazFile, local path) for each file matching the request parameters.
+            Files that couldn't be downloaded or verified are logged and left out.
         """
-        raise NotImplementedError
+        matches = []
+        for query in ({"name": name}, {"md5": md5}, {"sha1": sha1}):
+            if not matches and list(query.values())[0]:
+                matches = self.find_file(**query)
+
+        if not matches:
+            raise FileNotFoundError("No file found matching name {} md5 {} sha1 {}".format(name,
+                                                                                           md5,
+                                                                                           sha1))
+
+        dest_dir = dest_dir or os.getcwd()
+        os.makedirs(dest_dir, exist_ok=True)
+        results = []
+        for info in matches:
+            f_path = evidence_path(dest_dir, info)
+            try:
+                self.fetch_file(info, f_path)
+                results.append((info, f_path))
+            except Exception as ex:
+                logger.error("Unable to download a copy of {}. {}".format(info.name, ex))
+
+        return results
@@ -0,0 +1,244 @@
+"""
+Cazador S3 Inventory module.
+
+Listing a bucket of hundreds of millions of objects with ListObjectsV2 takes a
+request per thousand keys. An S3 Inventory report already holds the key, size,
+ETag and modified time of every object, so buckets with a report are listed by
+streaming its rows instead. CSV reports are decompressed and read row by row,
+and ORC and Parquet reports are read in column batches projected onto the
+columns the scan needs (requires pyarrow).
+
+Reports are read from a local copy or from their destination bucket. The
+location may name a manifest.json, or a folder or s3:// prefix holding dated
+reports, in which case the newest manifest found is used.
+
+Created: 10/19/2026
+"""
+
+import os
+import io
+import csv
+import gzip
+import json
+import datetime
+import tempfile
+from contextlib import closing
+from urllib.parse import unquote_plus
+import logging
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+CSV, ORC, PARQUET = "CSV", "ORC", "PARQUET"
+
+# Rows recorded with the checkpoint as a single listing page
+DEFAULT_BATCH_SIZE = 1000
+
+# Report fields used by the scan, by CSV schema name and by ORC/Parquet column name
+_CSV_FIELDS = {"Bucket": "bucket", "Key": "key", "Size": "size", "LastModifiedDate": "last_modified_date",
+               "ETag": "e_tag", "IsLatest": "is_latest", "IsDeleteMarker": "is_delete_marker"}
+_COLUMNS = tuple(_CSV_FIELDS.values())
+
+
+def _split_s3(location):
+    """Split an s3://bucket/key location into (bucket, key)."""
+    bucket, _, key = location[len("s3://"):].partition('/')
+    return bucket, key
+
+
+def _parse_time(value):
+    """Convert a CSV LastModifiedDate into a datetime, leaving anything unexpected as is."""
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%fZ").replace(
+            tzinfo=datetime.timezone.utc)
+    except (TypeError, ValueError):
+        return value or None
+
+
+def _true(value):
+    """Read a boolean report field, which CSV reports hold as text."""
+    if isinstance(value, str):
+        return value.lower() == "true"
+    return bool(value)
+
+
+class InventoryReport:
+    """Streams the object entries of an S3 Inventory report."""
+
+    def __init__(self, location, s3_client=None, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Load the manifest of a report.
+
+        Args:
+            location (str): Local path or s3:// location of a manifest.json, or of a folder or
+                            prefix holding dated reports.
+            s3_client (botocore client): <Optional> Client used to read reports stored in S3.
+            batch_size (int): <Optional> Rows yielded per page.
+
+        Raises:
+            FileNotFoundError: No manifest was found at the location.
+            ValueError: The manifest is for an unsupported report format.
+        """
+        self.s3_client = s3_client
+        self.batch_size = max(1, batch_size)
+        self.location = self._resolve(location)
+        self.manifest = json.loads(self._read(self.location).decode('utf-8'))
+
+        self.bucket = self.manifest["sourceBucket"]
+        self.file_format = self.manifest.get("fileFormat", CSV).upper()
+        if self.file_format not in (CSV, ORC, PARQUET):
+            raise ValueError("Unsupported inventory report format {}".format(self.file_format))
+        # The destination bucket is given as an ARN
+        self.destination = self.manifest.get("destinationBucket", "").split(":::")[-1]
+        self.files = [f["key"] for f in self.manifest.get("files", [])]
+        self.schema = [x.strip() for x in self.manifest.get("fileSchema", "").split(',')]
+        logger.info("Listing bucket {} from the {} inventory report {} ({} files)".format(
+            self.bucket, self.file_format, self.location, len(self.files)))
+
+    def _resolve(self, location):
+        """Return the location of the manifest, choosing the newest report under a folder."""
+        if location.startswith("s3://"):
+            bucket, key = _split_s3(location)
+            if key.endswith(MANIFEST_NAME):
+                return location
+            manifests = []
+            paginator = self.s3_client.get_paginator("list_objects_v2")
+            for page in paginator.paginate(Bucket=bucket, Prefix=key):
+                manifests.extend(x["Key"] for x in page.get("Contents", [])
+                                 if x["Key"].endswith("/" + MANIFEST_NAME))
+            if not manifests:
+                raise FileNotFoundError("No inventory manifest found under {}".format(location))
+            # Reports are stored in folders named by their creation time
+            return "s3://{}/{}".format(bucket, max(manifests))
+
+        if os.path.isfile(location):
+            return location
+        manifests = []
+        for dir_path, _, file_names in os.walk(location):
+            if MANIFEST_NAME in file_names:
+                manifests.append(os.path.join(dir_path, MANIFEST_NAME))
+        if not manifests:
+            raise FileNotFoundError("No inventory manifest found under {}".format(location))
+        return max(manifests)
+
+    def _read(self, location):
+        """Read the whole of a small local or S3 file."""
+        if location.startswith("s3://"):
+            bucket, key = _split_s3(location)
+            return self.s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+        with open(location, 'rb') as f:
+            return f.read()
+
+    def _local_path(self, key):
+        """
+        Find a data file of a local copy of a report.
+
+        The data file keys are relative to the destination bucket, so the longest
+        trailing part of the key found under the manifest folder or its parents is used.
+        """
+        parts = key.split('/')
+        folder = os.path.dirname(os.path.abspath(self.location))
+        while True:
+            for i in range(len(parts)):
+                candidate = os.path.join(folder, *parts[i:])
+                if os.path.isfile(candidate):
+                    return candidate
+            parent = os.path.dirname(folder)
+            if parent == folder:
+                raise FileNotFoundError("Inventory data file {} not found near {}".format(
+                    key, self.location))
+            folder = parent
+
+    def _open(self, key):
+        """Open a data file of the report as a binary file object."""
+        if not self.location.startswith("s3://"):
+            return open(self._local_path(key), 'rb')
+
+        body = self.s3_client.get_object(Bucket=self.destination, Key=key)["Body"]
+        if self.file_format == CSV:
+            return body
+        # Columnar files are read out of order, so they are spooled to a local file first
+        f = tempfile.TemporaryFile()
+        for chunk in iter(lambda: body.read(1024 * 1024), b""):
+            f.write(chunk)
+        f.seek(0)
+        return f
+
+    def _csv_rows(self, f):
+        """Yield a dictionary of the scan fields of every CSV row."""
+        index = {_CSV_FIELDS[name]: i for i, name in enumerate(self.schema) if name in _CSV_FIELDS}
+        text = io.TextIOWrapper(gzip.GzipFile(fileobj=f), encoding='utf-8', newline='')
+        for row in csv.reader(text):
+            yield {column: row[i] if i < len(row) else None for column, i in index.items()}
+
+    def _columnar_rows(self, f):
+        """Yield a dictionary of the scan fields of every ORC or Parquet row."""
+        try:
+            if self.file_format == PARQUET:
+                import pyarrow.parquet as pq
+            else:
+                import pyarrow.orc as orc
+        except ImportError:
+            raise ImportError("pyarrow is required to read {} inventory reports".format(self.file_format))
+
+        if self.file_format == PARQUET:
+            reader = pq.ParquetFile(f)
+            columns = [x for x in _COLUMNS if x in reader.schema_arrow.names]
+            batches = reader.iter_batches(batch_size=self.batch_size, columns=columns)
+        else:
+            reader = orc.ORCFile(f)
+            columns = [x for x in _COLUMNS if x in reader.schema.names]
+            batches = (reader.read_stripe(i, columns=columns) for i in range(reader.nstripes))
+
+        for batch in batches:
+            data = {name: batch.column(name).to_pylist() for name in columns}
+            for i in range(batch.num_rows):
+                yield {name: values[i] for name, values in data.items()}
+
+    def _entries(self, key, skip=0):
+        """Yield the ListObjectsV2 style entry of every current object in a data file."""
+        with closing(self._open(key)) as f:
+            rows = self._csv_rows(f) if self.file_format == CSV else self._columnar_rows(f)
+            for number, row in enumerate(rows):
+                if number < skip:
+                    continue
+                if _true(row.get("is_delete_marker")) or not _true(row.get("is_latest", True)):
+                    # Versioned reports also list delete markers and older versions
+                    yield None
+                    continue
+
+                obj_key = row["key"]
+                modified = row.get("last_modified_date")
+                size = row.get("size")
+                if self.file_format == CSV:
+                    # CSV reports URL encode the keys
+                    obj_key = unquote_plus(obj_key)
+                    modified = _parse_time(modified)
+                    size = int(size) if size else None
+                yield {"Key": obj_key,
+                       "Bucket": self.bucket,
+                       "Size": size,
+                       "ETag": row.get("e_tag") or None,
+                       "LastModified": modified}
+
+    def pages(self, token=None):
+        """
+        Yield (token, object entries, next token) for each batch of rows in the report.
+
+        Args:
+            token (list): <Optional> [data file index, row] to continue reading from.
+        """
+        start_file, start_row = token if token else (0, 0)
+        for file_index in range(start_file, len(self.files)):
+            row = start_row if file_index == start_file else 0
+            page_token = [file_index, row]
+            batch = []
+            for entry in self._entries(self.files[file_index], skip=row):
+                row += 1
+                if entry is not None:
+                    batch.append(entry)
+                if row - page_token[1] >= self.batch_size:
+                    yield page_token, batch, [file_index, row]
+                    page_token = [file_index, row]
+                    batch = []
+            next_token = [file_index + 1, 0] if file_index + 1 < len(self.files) else None
+            yield page_token, batch, next_token
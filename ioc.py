@@ -0,0 +1,336 @@
+"""
+Cazador threat intel IOC module.
+
+Threat intel feeds can list tens of millions of known bad MD5 and SHA1 values,
+which would take gigabytes as a set of hex strings. The feeds are compiled once
+into a store file holding each kind of digest as a sorted array of raw bytes
+(16 bytes per MD5, 20 per SHA1) followed by a Bloom filter over all of them.
+The store is memory mapped, so only the pages a lookup touches are read and
+several processes share a single copy in the page cache.
+
+Lookups check the Bloom filter first, which turns away almost every unlisted
+digest after reading a bit or two, and binary search the sorted array only for
+the rest. Batches of digests, such as a listing page, are searched in sorted
+order within a narrowing window of the array.
+
+The header records a digest of the feed files the store was built from, and
+the store is rebuilt whenever a feed is newer than it or a different set of
+feeds is asked for. Feeds are read as text
+and every 32 or 40 character hex value found is taken as an MD5 or SHA1, so
+plain lists, CSV exports and STIX indicator dumps all work.
+
+Created: 10/19/2026
+"""
+
+import os
+import re
+import math
+import mmap
+import heapq
+import struct
+import hashlib
+import tempfile
+import logging
+logger = logging.getLogger(__name__)
+
+MAGIC = b"CAZIOC\x00\x00"
+STORE_VERSION = 2
+# magic, version, Bloom hash count, MD5 count, SHA1 count, Bloom filter bits, feed list digest
+_HEADER = struct.Struct("<8sIIQQQ20s")
+HEADER_SIZE = 64
+
+MD5, SHA1 = "md5", "sha1"
+DIGEST_SIZE = {MD5: 16, SHA1: 20}
+_KINDS = (MD5, SHA1)
+
+# Bloom filter bits per digest. 10 bits with 7 hashes turns away about 99% of unlisted digests.
+DEFAULT_BITS_PER_ENTRY = 10
+
+# Digests sorted in memory at once while building the store
+DEFAULT_RUN_SIZE = 1000000
+
+_HEX = re.compile(r"(?<![0-9A-Fa-f])(?:[0-9A-Fa-f]{40}|[0-9A-Fa-f]{32})(?![0-9A-Fa-f])")
+
+
+def _bloom_positions(digest, hashes, bits):
+    """Return the Bloom filter bits of a digest, derived from the digest bytes themselves."""
+    h1 = int.from_bytes(digest[:8], "little")
+    h2 = int.from_bytes(digest[8:16], "little") | 1
+    return [(h1 + i * h2) % bits for i in range(hashes)]
+
+
+def _parse(value):
+    """Return the (kind, raw digest) of a hex MD5 or SHA1, or None for anything else."""
+    if not value:
+        return None
+    value = value.strip().strip('"')
+    if len(value) == 32:
+        kind = MD5
+    elif len(value) == 40:
+        kind = SHA1
+    else:
+        return None
+    try:
+        return kind, bytes.fromhex(value)
+    except ValueError:
+        return None
+
+
+def read_feed(path):
+    """
+    Yield the (kind, raw digest) of every MD5 and SHA1 hex value in a feed file.
+
+    Args:
+        path (str): Text feed. Lines may hold other fields around the hashes.
+    """
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            if line.startswith('#'):
+                continue
+            for value in _HEX.findall(line):
+                yield _parse(value)
+
+
+def feeds_digest(feeds):
+    """Return the SHA1 of a set of feed files, identifying the feeds a store was built from."""
+    paths = sorted(set(os.path.abspath(x) for x in feeds))
+    return hashlib.sha1("\n".join(paths).encode('utf-8')).digest()
+
+
+def _write_run(digests, folder):
+    """Sort a batch of digests into a temporary run file, returning its path."""
+    digests.sort()
+    fd, path = tempfile.mkstemp(prefix="cazioc_", suffix=".run", dir=folder)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(b"".join(digests))
+    return path
+
+
+def _read_run(path, size):
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(size * 65536)
+            if not chunk:
+                break
+            for i in range(0, len(chunk), size):
+                yield chunk[i:i + size]
+
+
+def build_store(feeds, path, bits_per_entry=DEFAULT_BITS_PER_ENTRY, run_size=DEFAULT_RUN_SIZE):
+    """
+    Compile threat intel feeds into a store file.
+
+    The digests are sorted in runs that are merged from disk, so feeds of any size
+    are built within a fixed amount of memory besides the Bloom filter.
+
+    Args:
+        feeds (str[]): Feed files to read.
+        path (str): Store file to write.
+        bits_per_entry (int): <Optional> Bloom filter bits per digest.
+        run_size (int): <Optional> Digests sorted in memory at once.
+
+    Returns:
+        Dictionary of unique digests written by kind.
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    runs = {x: [] for x in _KINDS}
+    pending = {x: [] for x in _KINDS}
+    total = 0
+    try:
+        for feed in feeds:
+            for kind, digest in read_feed(feed):
+                pending[kind].append(digest)
+                total += 1
+                if len(pending[kind]) >= run_size:
+                    runs[kind].append(_write_run(pending[kind], folder))
+                    pending[kind] = []
+        for kind in _KINDS:
+            if pending[kind]:
+                runs[kind].append(_write_run(pending[kind], folder))
+        pending = None
+
+        # Sized for every digest read, so duplicates only lower the false positive rate
+        bits = max(64, total * bits_per_entry)
+        hashes = max(1, int(round(bits_per_entry * math.log(2))))
+        bloom = bytearray((bits + 7) // 8)
+        counts = {}
+
+        temp_path = path + ".tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(b"\x00" * HEADER_SIZE)
+            for kind in _KINDS:
+                size = DIGEST_SIZE[kind]
+                count = 0
+                last = None
+                buf = []
+                for digest in heapq.merge(*[_read_run(x, size) for x in runs[kind]]):
+                    if digest == last:
+                        continue
+                    last = digest
+                    count += 1
+                    for p in _bloom_positions(digest, hashes, bits):
+                        bloom[p >> 3] |= 1 << (p & 7)
+                    buf.append(digest)
+                    if len(buf) >= 65536:
+                        f.write(b"".join(buf))
+                        buf = []
+                f.write(b"".join(buf))
+                counts[kind] = count
+            f.write(bloom)
+            f.seek(0)
+            f.write(_HEADER.pack(MAGIC, STORE_VERSION, hashes, counts[MD5], counts[SHA1], bits,
+                                 feeds_digest(feeds)))
+        os.replace(temp_path, path)
+    finally:
+        for kind_runs in runs.values():
+            for x in kind_runs:
+                os.remove(x)
+
+    logger.info("Built IOC store {} with {} MD5 and {} SHA1 digests from {} feed values".format(
+        path, counts[MD5], counts[SHA1], total))
+    return counts
+
+
+class IOCStore:
+    """Memory mapped set of known bad MD5 and SHA1 digests."""
+
+    def __init__(self, path):
+        """
+        Open a store written by build_store.
+
+        Args:
+            path (str): Store file.
+
+        Raises:
+            ValueError: The file isn't a store of this version.
+        """
+        self.path = path
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < HEADER_SIZE:
+            self._file.close()
+            raise ValueError("{} is not an IOC store".format(path))
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.hashes, md5_count, sha1_count, self.bits, self.feed_digest = \
+            _HEADER.unpack_from(self._mm)
+        if magic != MAGIC or version != STORE_VERSION:
+            self.close()
+            raise ValueError("{} is not a version {} IOC store".format(path, STORE_VERSION))
+
+        self.counts = {MD5: md5_count, SHA1: sha1_count}
+        self._offsets = {MD5: HEADER_SIZE, SHA1: HEADER_SIZE + md5_count * DIGEST_SIZE[MD5]}
+        self._bloom = self._offsets[SHA1] + sha1_count * DIGEST_SIZE[SHA1]
+
+    @classmethod
+    def open(cls, feeds, path=None, bits_per_entry=DEFAULT_BITS_PER_ENTRY):
+        """
+        Open the store compiled from a set of feeds, building it if any feed is newer
+        or it was built from other feeds.
+
+        Args:
+            feeds (str[]): Feed files.
+            path (str): <Optional> Store file. Default: the first feed with a .cazioc extension
+            bits_per_entry (int): <Optional> Bloom filter bits per digest when building.
+        """
+        path = path or feeds[0] + ".cazioc"
+        try:
+            built = os.path.getmtime(path)
+        except OSError:
+            built = None
+        if built is not None and not any(os.path.getmtime(x) > built for x in feeds):
+            try:
+                store = cls(path)
+            except ValueError:
+                # Written by an older version
+                store = None
+            if store is not None and store.feed_digest == feeds_digest(feeds):
+                return store
+            if store is not None:
+                store.close()
+            logger.info("IOC store {} was built from other feeds. Rebuilding.".format(path))
+        build_store(feeds, path, bits_per_entry)
+        return cls(path)
+
+    def __len__(self):
+        return self.counts[MD5] + self.counts[SHA1]
+
+    def _maybe(self, digest):
+        """Check the Bloom filter. False means the digest is certainly not listed."""
+        mm, base = self._mm, self._bloom
+        for p in _bloom_positions(digest, self.hashes, self.bits):
+            if not mm[base + (p >> 3)] >> (p & 7) & 1:
+                return False
+        return True
+
+    def _search(self, kind, digest, lo=0):
+        """Return the index of the first listed digest not below this one, searching from lo."""
+        size = DIGEST_SIZE[kind]
+        offset = self._offsets[kind]
+        mm = self._mm
+        hi = self.counts[kind]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = offset + mid * size
+            if mm[start:start + size] < digest:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _at(self, kind, index):
+        size = DIGEST_SIZE[kind]
+        start = self._offsets[kind] + index * size
+        return self._mm[start:start + size]
+
+    def contains(self, value):
+        """
+        Check whether a hex MD5 or SHA1 is listed.
+
+        Args:
+            value (str): Hex digest. Anything else, such as a multipart S3 ETag, isn't listed.
+        """
+        parsed = _parse(value)
+        if parsed is None:
+            return False
+        kind, digest = parsed
+        if not self.counts[kind] or not self._maybe(digest):
+            return False
+        i = self._search(kind, digest)
+        return i < self.counts[kind] and self._at(kind, i) == digest
+
+    def contains_many(self, values):
+        """
+        Check a batch of hex digests at once.
+
+        Digests passing the Bloom filter are searched in sorted order, each search
+        starting where the previous one ended, so a batch reads the array front to back.
+
+        Args:
+            values (str[]): Hex digests. None and other values are never listed.
+
+        Returns:
+            List of flags in the order of the values.
+        """
+        res = [False] * len(values)
+        candidates = {x: [] for x in _KINDS}
+        for i, value in enumerate(values):
+            parsed = _parse(value)
+            if parsed is None:
+                continue
+            kind, digest = parsed
+            if self.counts[kind] and self._maybe(digest):
+                candidates[kind].append((digest, i))
+
+        for kind, found in candidates.items():
+            lo = 0
+            for digest, i in sorted(found):
+                lo = self._search(kind, digest, lo)
+                if lo >= self.counts[kind]:
+                    break
+                res[i] = self._at(kind, lo) == digest
+        return res
+
+    def close(self):
+        """Unmap the store."""
+        self._mm.close()
+        self._file.close()
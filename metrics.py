@@ -0,0 +1,210 @@
+"""
+Cazador run instrumentation module.
+
+Every stage of a crawl or scan (list, search, metadata, download, extract,
+match and cleanup) records its call count, bytes, items, errors and a latency
+histogram per service. The totals can be written as a JSON summary at the end
+of a run, or periodically as a Prometheus textfile during long scans.
+
+Created: 10/19/2026
+"""
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# Stage names recorded by the handlers and scanner
+LIST = "list"
+SEARCH = "search"
+METADATA = "metadata"
+SNIFF = "sniff"
+DOWNLOAD = "download"
+EXTRACT = "extract"
+MATCH = "match"
+SIMILARITY = "similarity"
+CLEANUP = "cleanup"
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+                   300.0)
+
+
+class StageMetrics:
+    """Totals and latency histogram of a single stage for one service."""
+
+    def __init__(self):
+        """StageMetrics initializer."""
+        self.calls = 0
+        self.errors = 0
+        self.bytes = 0
+        self.items = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+    def observe(self, seconds=None, size=0, items=0, error=False):
+        """Add a single observation."""
+        self.bytes += size
+        self.items += items
+        if error:
+            self.errors += 1
+        if seconds is not None:
+            self.calls += 1
+            self.seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    self.buckets[i] += 1
+                    break
+
+    def to_dict(self):
+        """Summarize the stage for the JSON report."""
+        return {"calls": self.calls,
+                "errors": self.errors,
+                "bytes": self.bytes,
+                "items": self.items,
+                "seconds": round(self.seconds, 6),
+                "mean_seconds": round(self.seconds / self.calls, 6) if self.calls else 0.0,
+                "max_seconds": round(self.max_seconds, 6),
+                "histogram": {str(b): c for b, c in zip(LATENCY_BUCKETS, self.buckets)}}
+
+
+class MetricsRegistry:
+    """Thread safe collection of StageMetrics keyed by (service, stage)."""
+
+    def __init__(self):
+        """MetricsRegistry initializer."""
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.started = time.time()
+
+    def observe(self, stage, service, seconds=None, size=0, items=0, error=False):
+        """
+        Record an observation of a stage.
+
+        Args:
+            stage (str): Stage name.
+            service (str): Service type label.
+            seconds (float): <Optional> Latency of the call. Omit to only add totals.
+            size (int): <Optional> Bytes handled.
+            items (int): <Optional> Items handled.
+            error (bool): <Optional> The call failed.
+        """
+        key = ((service or "unknown").lower(), stage)
+        with self.lock:
+            if key not in self.stages:
+                self.stages[key] = StageMetrics()
+            self.stages[key].observe(seconds, size, items, error)
+
+    @contextmanager
+    def timed(self, stage, service, size=0, items=0):
+        """
+        Time a block of work as one call of a stage.
+
+        Exceptions raised inside the block are counted as errors and re-raised.
+        The yielded dictionary can be updated with 'size' and 'items' totals.
+        """
+        totals = {"size": size, "items": items}
+        start = time.monotonic()
+        try:
+            yield totals
+        except Exception:
+            self.observe(stage, service, time.monotonic() - start, totals["size"],
+                         totals["items"], error=True)
+            raise
+        self.observe(stage, service, time.monotonic() - start, totals["size"], totals["items"])
+
+    def summary(self):
+        """Return the run totals as a dictionary."""
+        with self.lock:
+            services = {}
+            for (service, stage), m in sorted(self.stages.items()):
+                services.setdefault(service, {})[stage] = m.to_dict()
+        return {"started": self.started,
+                "elapsed_seconds": round(time.time() - self.started, 3),
+                "services": services}
+
+    def write_json(self, path):
+        """Write the JSON summary of the run."""
+        _atomic_write(path, json.dumps(self.summary(), indent=2, sort_keys=True))
+
+    def prometheus_text(self):
+        """Render the run totals in the Prometheus text exposition format."""
+        lines = ["# HELP cazador_stage_seconds Latency of each stage call.",
+                 "# TYPE cazador_stage_seconds histogram"]
+        with self.lock:
+            stages = sorted(self.stages.items())
+            for (service, stage), m in stages:
+                labels = 'service="{}",stage="{}"'.format(service, stage)
+                total = 0
+                for bound, count in zip(LATENCY_BUCKETS, m.buckets):
+                    total += count
+                    lines.append('cazador_stage_seconds_bucket{{{},le="{}"}} {}'.format(labels,
+                                                                                        bound,
+                                                                                        total))
+                lines.append('cazador_stage_seconds_bucket{{{},le="+Inf"}} {}'.format(labels,
+                                                                                      m.calls))
+                lines.append("cazador_stage_seconds_sum{{{}}} {}".format(labels, m.seconds))
+                lines.append("cazador_stage_seconds_count{{{}}} {}".format(labels, m.calls))
+
+            for name, attr, text in (("errors", "errors", "Failed stage calls."),
+                                     ("bytes", "bytes", "Bytes handled by the stage."),
+                                     ("items", "items", "Items handled by the stage.")):
+                lines.append("# HELP cazador_stage_{}_total {}".format(name, text))
+                lines.append("# TYPE cazador_stage_{}_total counter".format(name))
+                for (service, stage), m in stages:
+                    lines.append('cazador_stage_{}_total{{service="{}",stage="{}"}} {}'.format(
+                        name, service, stage, getattr(m, attr)))
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Write the Prometheus textfile for the node exporter collector."""
+        _atomic_write(path, self.prometheus_text())
+
+
+def _atomic_write(path, text):
+    """Replace a file in one step so readers never see a partial write."""
+    temp_path = "{}.tmp".format(path)
+    with open(temp_path, 'w') as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+
+class PrometheusExporter:
+    """Background thread periodically rewriting a Prometheus textfile."""
+
+    def __init__(self, registry, path, interval=15.0):
+        """
+        PrometheusExporter initializer.
+
+        Args:
+            registry (MetricsRegistry): Metrics to export.
+            path (str): Textfile path to write.
+            interval (float): <Optional> Seconds between writes.
+        """
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.registry.write_prometheus(self.path)
+
+    def start(self):
+        """Start exporting."""
+        self.thread.start()
+
+    def stop(self):
+        """Stop exporting and write the final totals."""
+        self.stopped.set()
+        self.thread.join()
+        self.registry.write_prometheus(self.path)
+
+
+# Process wide registry used by the handlers and scanner
+metrics = MetricsRegistry()
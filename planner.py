@@ -0,0 +1,264 @@
+"""
+Cazador scan planning module.
+
+A plan runs only the listing phase of a scan (or reads the S3 Inventory report
+configured in its place) through the same shard, checkpoint and folder filters,
+and totals what the full scan would have to download: file counts and bytes,
+a breakdown by file type, the files whose text is already cached, and the API
+requests the scan would make.
+
+The wall time is estimated from the throughput measured by earlier scans,
+which record their files, bytes and worker seconds per service in a small
+history file. A scan is assumed to be bound by whichever of its file rate,
+byte rate or request rate limit runs out first.
+
+Created: 10/19/2026
+"""
+
+import os
+import json
+import math
+import time
+import threading
+import logging
+logger = logging.getLogger(__name__)
+
+# Weight kept by the earlier runs each time a scan is recorded in the history
+HISTORY_DECAY = 0.5
+
+# File types listed individually in the plan report
+REPORT_TYPES = 15
+
+
+def format_bytes(size):
+    """Format a byte count for the plan report."""
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if size < 1024:
+            break
+        size /= 1024.0
+    else:
+        unit = "PB"
+    return "{} B".format(int(size)) if unit == "B" else "{:.1f} {}".format(size, unit)
+
+
+def format_duration(seconds):
+    """Format a duration for the plan report."""
+    seconds = int(round(seconds))
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if days:
+        return "{}d {}h {}m".format(days, hours, minutes)
+    if hours:
+        return "{}h {}m".format(hours, minutes)
+    return "{}m {}s".format(minutes, seconds)
+
+
+class ThroughputHistory:
+    """Scan throughput measured per service by earlier runs."""
+
+    def __init__(self, path):
+        """
+        Initialize the history.
+
+        Args:
+            path (str): JSON file holding the history.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Return the recorded totals by lowercase service type."""
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def record(self, service_type, files, size, seconds, concurrency):
+        """
+        Add the totals of a completed scan, decaying the weight of earlier runs.
+
+        Args:
+            service_type (str): Service scanned.
+            files (int): Files listed for scanning.
+            size (int): Bytes downloaded and extracted.
+            seconds (float): Wall time of the scan.
+            concurrency (int): Files scanned at once.
+        """
+        if not files or seconds <= 0:
+            return
+        with self._lock:
+            history = self.load()
+            key = service_type.lower()
+            old = history.get(key, {})
+            history[key] = {
+                "files": old.get("files", 0) * HISTORY_DECAY + files,
+                "bytes": old.get("bytes", 0) * HISTORY_DECAY + size,
+                "worker_seconds": old.get("worker_seconds", 0) * HISTORY_DECAY +
+                seconds * max(1, concurrency),
+                "runs": old.get("runs", 0) + 1,
+                "updated": time.time()}
+            temp_path = self.path + ".tmp"
+            try:
+                with open(temp_path, 'w') as f:
+                    json.dump(history, f, indent=2, sort_keys=True)
+                os.replace(temp_path, self.path)
+            except OSError as ex:
+                logger.warning("Unable to save the scan throughput history {}. {}".format(self.path, ex))
+
+    def rates(self, service_type):
+        """
+        Return the measured (files, bytes) per worker second of a service.
+
+        Returns:
+            Tuple of rates, or None if no scan of the service has been recorded.
+        """
+        entry = self.load().get(service_type.lower())
+        if not entry or not entry.get("worker_seconds"):
+            return None
+        return (entry["files"] / entry["worker_seconds"],
+                entry["bytes"] / entry["worker_seconds"])
+
+
+class ScanPlan:
+    """Totals of the files a scan of one service would process."""
+
+    def __init__(self, service_type, concurrency=1, sniff_size=None, part_size=None):
+        """
+        Initialize an empty plan.
+
+        Args:
+            service_type (str): Service being planned.
+            concurrency (int): <Optional> Files the scan processes at once.
+            sniff_size (int): <Optional> Bytes sniffed before downloading larger files.
+            part_size (int): <Optional> Bytes per download request, if downloads are split.
+        """
+        self.service_type = service_type
+        self.concurrency = max(1, concurrency)
+        self.sniff_size = sniff_size
+        self.part_size = part_size
+        self.files = 0
+        self.bytes = 0
+        self.unknown_size = 0
+        self.cached_files = 0
+        self.cached_bytes = 0
+        self.types = {}
+        self.requests = {"sniff": 0, "download": 0}
+        self.listing_requests = {}
+        self.listing_seconds = 0.0
+
+    def add(self, info, cached=False):
+        """
+        Add a listed file.
+
+        Args:
+            info (CazFile): Description of the file.
+            cached (bool): <Optional> The file's text is cached, so it won't be downloaded.
+        """
+        size = info.size or 0
+        self.files += 1
+        self.bytes += size
+        if info.size is None:
+            self.unknown_size += 1
+
+        ext = os.path.splitext(info.name or "")[1].lower() or "(none)"
+        entry = self.types.setdefault(ext, [0, 0])
+        entry[0] += 1
+        entry[1] += size
+
+        if cached:
+            self.cached_files += 1
+            self.cached_bytes += size
+            return
+        if self.sniff_size and (info.size is None or info.size > self.sniff_size):
+            self.requests["sniff"] += 1
+        if self.part_size and size:
+            self.requests["download"] += int(math.ceil(size / float(self.part_size)))
+        else:
+            self.requests["download"] += 1
+
+    def estimate_seconds(self, rates=None, request_rates=None):
+        """
+        Estimate the wall time of the scan.
+
+        Args:
+            rates (tuple): <Optional> Measured (files, bytes) per worker second.
+            request_rates (dict): <Optional> Requests per second allowed by endpoint class.
+
+        Returns:
+            Estimated seconds, or None if there is nothing to base it on.
+        """
+        bounds = []
+        files = self.files - self.cached_files
+        size = self.bytes - self.cached_bytes
+        if rates:
+            file_rate, byte_rate = rates
+            if file_rate:
+                bounds.append(files / (file_rate * self.concurrency))
+            if byte_rate:
+                bounds.append(size / (byte_rate * self.concurrency))
+        if request_rates and request_rates.get("download"):
+            # Sniffs are ranged downloads, so they draw from the same request budget
+            bounds.append((self.requests["download"] + self.requests["sniff"]) /
+                          request_rates["download"])
+        if not bounds:
+            return None
+        # The listing overlaps the downloads, but the scan can't end before it does
+        return max(bounds + [self.listing_seconds])
+
+    def to_dict(self, rates=None, request_rates=None):
+        """Return the plan as a JSON serializable dictionary."""
+        return {"service": self.service_type,
+                "files": self.files,
+                "bytes": self.bytes,
+                "unknown_size": self.unknown_size,
+                "cached_files": self.cached_files,
+                "cached_bytes": self.cached_bytes,
+                "types": {k: {"files": v[0], "bytes": v[1]} for k, v in self.types.items()},
+                "requests": dict(self.listing_requests, **self.requests),
+                "listing_seconds": round(self.listing_seconds, 3),
+                "concurrency": self.concurrency,
+                "estimated_seconds": self.estimate_seconds(rates, request_rates)}
+
+    def report(self, rates=None, request_rates=None):
+        """
+        Format the plan for the console.
+
+        Args:
+            rates (tuple): <Optional> Measured (files, bytes) per worker second.
+            request_rates (dict): <Optional> Requests per second allowed by endpoint class.
+
+        Returns:
+            List of report lines.
+        """
+        lines = ["Plan: {} files, {}".format(self.files, format_bytes(self.bytes))]
+        if self.unknown_size:
+            lines.append("  {} files without a reported size".format(self.unknown_size))
+        if self.cached_files:
+            lines.append("  {} files ({}) matched from the text cache without downloading".format(
+                self.cached_files, format_bytes(self.cached_bytes)))
+
+        lines.append("  By type:")
+        types = sorted(self.types.items(), key=lambda x: (-x[1][1], -x[1][0], x[0]))
+        for ext, (count, size) in types[:REPORT_TYPES]:
+            lines.append("    {:<12} {:>10} files {:>12}".format(ext, count, format_bytes(size)))
+        rest = types[REPORT_TYPES:]
+        if rest:
+            lines.append("    {:<12} {:>10} files {:>12}".format(
+                "({} more)".format(len(rest)), sum(x[1][0] for x in rest),
+                format_bytes(sum(x[1][1] for x in rest))))
+
+        requests = dict(self.listing_requests, **self.requests)
+        lines.append("  API requests: " + ", ".join("{} {}".format(k, v)
+                                                    for k, v in sorted(requests.items()) if v))
+        lines.append("  Listing took {}".format(format_duration(self.listing_seconds)))
+
+        estimate = self.estimate_seconds(rates, request_rates)
+        if estimate is None:
+            lines.append("  No throughput measured by an earlier scan to estimate the wall time")
+        else:
+            lines.append("  Estimated wall time {} with {} files at once{}".format(
+                format_duration(estimate), self.concurrency,
+                "" if rates else " (request rate limit only, no earlier scan measured)"))
+        return lines
@@ -0,0 +1,252 @@
+"""
+Cazador scan priority module.
+
+Listed files are scored and scanned best first instead of in listing order, so
+the files most likely to hold a finding are downloaded in the first minutes of
+a scan. The listing runs ahead on its own thread into a bounded heap and the
+scan always takes the highest scoring file listed so far.
+
+A file's score adds the weights of its extension, MIME type and any keywords in
+its path, a bonus for recently modified files that halves every half life, and
+a penalty for every factor of ten in size so cheap files go first.
+
+Created: 10/19/2026
+"""
+
+import os
+import math
+import time
+import heapq
+import datetime
+import itertools
+import mimetypes
+import threading
+import logging
+from concurrent.futures import FIRST_COMPLETED, wait
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXTENSIONS = {
+    ".pem": 10.0, ".key": 10.0, ".p12": 10.0, ".pfx": 10.0, ".kdbx": 10.0, ".ppk": 10.0,
+    ".env": 9.0, ".tfstate": 9.0, ".ovpn": 8.0, ".rdp": 6.0,
+    ".sql": 7.0, ".bak": 6.0, ".dump": 6.0, ".csv": 6.0, ".xlsx": 5.0, ".xls": 5.0,
+    ".json": 4.0, ".yml": 4.0, ".yaml": 4.0, ".ini": 4.0, ".conf": 4.0, ".config": 4.0,
+    ".ps1": 4.0, ".sh": 3.0, ".docx": 4.0, ".doc": 4.0, ".pdf": 3.0, ".txt": 3.0,
+    ".zip": 2.0, ".eml": 3.0, ".msg": 3.0,
+    ".jpg": -5.0, ".jpeg": -5.0, ".png": -5.0, ".gif": -5.0, ".mp4": -8.0, ".mov": -8.0,
+    ".mp3": -8.0, ".iso": -8.0,
+}
+
+DEFAULT_MIME_TYPES = {"text/*": 2.0, "application/pdf": 1.0, "image/*": -3.0, "video/*": -5.0,
+                      "audio/*": -5.0}
+
+DEFAULT_KEYWORDS = {"password": 8.0, "passwd": 8.0, "secret": 8.0, "credential": 8.0,
+                    "private": 5.0, "confidential": 6.0, "ssn": 6.0, "payroll": 5.0,
+                    "finance": 4.0, "invoice": 3.0, "backup": 3.0, "export": 3.0, "hr": 2.0,
+                    "customer": 3.0, "token": 5.0, "id_rsa": 10.0}
+
+
+def parse_weights(value):
+    """
+    Parse a weight list from the configuration.
+
+    Args:
+        value (str): Semicolon separated name:weight pairs. e.g. .pem:10;.csv:5
+
+    Returns:
+        Dictionary of lowercase names to float weights.
+    """
+    weights = {}
+    for entry in value.split(';'):
+        if not entry.strip():
+            continue
+        name, _, weight = entry.rpartition(':')
+        weights[name.strip().lower()] = float(weight)
+    return weights
+
+
+def bounded_map(pool, operation, items, in_flight=None):
+    """
+    Run an operation against every item on a thread pool, keeping a limited number submitted.
+
+    Submitting every item up front would queue them inside the pool in listing order,
+    so the scheduler would no longer choose what runs next.
+
+    Args:
+        pool (Executor): Pool running the operation.
+        operation (func): Method called with each item.
+        items (iterable): Items to run the operation against.
+        in_flight (int): <Optional> Items submitted at once. Unlimited if None.
+
+    Returns:
+        Generator of the operation results in completion order.
+    """
+    pending = set()
+    for item in items:
+        if in_flight and len(pending) >= in_flight:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                yield fut.result()
+        pending.add(pool.submit(operation, item))
+    while pending:
+        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for fut in finished:
+            yield fut.result()
+
+
+def _timestamp(value):
+    """Convert a modified time reported by a service into epoch seconds, or None."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return value.timestamp()
+    try:
+        from dateutil import parser as date_parser
+        return _timestamp(date_parser.parse(str(value)))
+    except Exception:
+        return None
+
+
+class PriorityScorer:
+    """Scores a described file by how likely it is to hold a finding."""
+
+    def __init__(self, extensions=None, mime_types=None, keywords=None, recency_weight=5.0,
+                 recency_half_life=30.0, size_weight=1.0):
+        """
+        Initialize the scorer.
+
+        Args:
+            extensions (dict): <Optional> Weight of each lowercase file extension, including the dot.
+            mime_types (dict): <Optional> Weight of each MIME type. type/* matches a whole type.
+            keywords (dict): <Optional> Weight of each keyword found in the lowercase path.
+            recency_weight (float): <Optional> Bonus of a file modified now.
+            recency_half_life (float): <Optional> Days for the recency bonus to halve.
+            size_weight (float): <Optional> Penalty for every factor of ten in bytes.
+        """
+        self.extensions = DEFAULT_EXTENSIONS if extensions is None else extensions
+        self.mime_types = DEFAULT_MIME_TYPES if mime_types is None else mime_types
+        self.keywords = DEFAULT_KEYWORDS if keywords is None else keywords
+        self.recency_weight = recency_weight
+        self.recency_half_life = recency_half_life
+        self.size_weight = size_weight
+
+    def score(self, info, now=None):
+        """
+        Score a file. Higher scores are scanned first.
+
+        Args:
+            info (CazFile): Description of the listed file.
+            now (float): <Optional> Epoch seconds recency is measured from.
+        """
+        name = (info.name or "").lower()
+        path = (info.path or name).lower()
+        score = 0.0
+
+        ext = os.path.splitext(name)[1]
+        score += self.extensions.get(ext, 0.0)
+
+        mime = getattr(info, 'mime_type', None) or mimetypes.guess_type(name)[0]
+        if mime:
+            score += self.mime_types.get(mime,
+                                         self.mime_types.get(mime.split('/')[0] + "/*", 0.0))
+
+        for keyword, weight in self.keywords.items():
+            if keyword in path:
+                score += weight
+
+        modified = _timestamp(info.modified)
+        if modified is not None and self.recency_weight:
+            age = max(0.0, ((now or time.time()) - modified) / 86400.0)
+            score += self.recency_weight * 0.5 ** (age / self.recency_half_life)
+
+        if info.size and self.size_weight:
+            score -= self.size_weight * math.log10(info.size)
+
+        return score
+
+
+class PriorityScheduler:
+    """Reorders a listing so the highest scoring file listed so far is scanned next."""
+
+    def __init__(self, scorer=None, max_pending=10000, warmup=2.0):
+        """
+        Initialize the scheduler.
+
+        Args:
+            scorer (PriorityScorer): <Optional> Scorer of the listed files.
+            max_pending (int): <Optional> Listed files held waiting to be scanned. The listing
+                               pauses while the heap is full.
+            warmup (float): <Optional> Seconds the listing may run ahead before the first file
+                            is handed out, unless the heap fills or the listing ends sooner.
+        """
+        self.scorer = scorer or PriorityScorer()
+        self.max_pending = max(1, max_pending)
+        self.warmup = warmup
+
+    def order(self, items, describe):
+        """
+        Yield listed entries best score first while the listing continues in the background.
+
+        Args:
+            items (iterable): Service specific file entries from list_files.
+            describe (func): Returns the CazFile of a listed entry.
+
+        Returns:
+            Generator of the same entries in priority order.
+        """
+        heap = []
+        counter = itertools.count()
+        cond = threading.Condition()
+        state = {"done": False, "stop": False, "error": None}
+
+        def fill():
+            try:
+                for item in items:
+                    try:
+                        score = self.scorer.score(describe(item))
+                    except Exception as ex:
+                        logger.debug("Unable to score listed file. {}".format(ex))
+                        score = 0.0
+                    with cond:
+                        while len(heap) >= self.max_pending and not state["stop"]:
+                            cond.wait()
+                        if state["stop"]:
+                            return
+                        # Ties keep the listing order
+                        heapq.heappush(heap, (-score, next(counter), item))
+                        cond.notify_all()
+            except BaseException as ex:
+                state["error"] = ex
+            finally:
+                with cond:
+                    state["done"] = True
+                    cond.notify_all()
+
+        thread = threading.Thread(target=fill, name="priority-listing", daemon=True)
+        thread.start()
+        try:
+            with cond:
+                deadline = time.monotonic() + (self.warmup or 0)
+                while len(heap) < self.max_pending and not state["done"]:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    cond.wait(remaining)
+            while True:
+                with cond:
+                    while not heap and not state["done"]:
+                        cond.wait()
+                    if not heap:
+                        break
+                    item = heapq.heappop(heap)[2]
+                    cond.notify_all()
+                yield item
+            if state["error"] is not None:
+                raise state["error"]
+        finally:
+            with cond:
+                state["stop"] = True
+                cond.notify_all()
@@ -0,0 +1,489 @@
+"""
+Cazador request scheduling module.
+
+Every service API call made by a handler is routed through a RequestScheduler.
+The scheduler paces requests with a token bucket per endpoint class, adapts the
+number of requests in flight to throttle responses (additive increase,
+multiplicative decrease) and retries throttled calls with jittered backoff,
+honoring any Retry-After supplied by the service. Transient failures, such as
+500/502/504 responses, connection resets and timeouts, are retried with the same
+backoff without lowering the concurrency limit.
+
+Schedulers are shared per service type so concurrent handlers of the same
+service draw from the same budget.
+
+Created: 10/19/2026
+"""
+
+import time
+import random
+import asyncio
+import threading
+import logging
+from metrics import metrics
+logger = logging.getLogger(__name__)
+
+# Endpoint classes used by the handlers
+LIST = "list"
+SEARCH = "search"
+METADATA = "metadata"
+DOWNLOAD = "download"
+
+# Default requests per second for each service and endpoint class
+DEFAULT_RATES = {
+    "amazons3": {LIST: 50.0, SEARCH: 50.0, METADATA: 100.0, DOWNLOAD: 500.0},
+    "box": {LIST: 10.0, SEARCH: 5.0, METADATA: 10.0, DOWNLOAD: 10.0},
+    "dropbox": {LIST: 10.0, SEARCH: 5.0, METADATA: 10.0, DOWNLOAD: 10.0},
+    "googledrive": {LIST: 10.0, SEARCH: 10.0, METADATA: 10.0, DOWNLOAD: 10.0},
+}
+DEFAULT_RATE = 20.0
+
+# Error codes reported by the services when throttling
+THROTTLE_CODES = ("throttling", "throttlingexception", "slowdown", "requestlimitexceeded",
+                  "toomanyrequestsexception", "ratelimitexceeded", "userratelimitexceeded",
+                  "too_many_requests", "rate_limit_exceeded")
+
+# Status codes and error codes of server side failures worth retrying
+TRANSIENT_STATUS = (500, 502, 504)
+TRANSIENT_CODES = ("internalerror", "internal_error", "serviceunavailable", "requesttimeout",
+                   "requesttimeoutexception", "backenderror", "internal_server_error")
+
+# Connection and timeout exceptions raised by the service SDKs and their HTTP libraries.
+# Matched by class name so the optional SDKs are not imported here.
+TRANSIENT_EXCEPTIONS = ("ConnectionError", "TimeoutError", "timeout", "Timeout",
+                        "ConnectTimeout", "ReadTimeout", "ReadTimeoutError",
+                        "ConnectTimeoutError", "EndpointConnectionError",
+                        "ConnectionClosedError", "ProtocolError", "IncompleteRead",
+                        "RemoteDisconnected", "ChunkedEncodingError",
+                        "ClientConnectionError", "ServerDisconnectedError",
+                        "ServerTimeoutError", "InternalServerError")
+
+
+class TokenBucket:
+    """Thread safe token bucket refilled at a fixed rate."""
+
+    def __init__(self, rate, burst=None):
+        """
+        TokenBucket initializer.
+
+        Args:
+            rate (float): Tokens added per second.
+            burst (float): <Optional> Bucket capacity. Defaults to one second of tokens.
+        """
+        self.rate = float(rate)
+        self.capacity = float(burst) if burst else max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token and return how long the caller must wait before using it."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        """Block until a token is available."""
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+
+
+class AdaptiveLimit:
+    """Concurrency limit adjusted with additive increase, multiplicative decrease."""
+
+    def __init__(self, initial, maximum, minimum=1):
+        """
+        AdaptiveLimit initializer.
+
+        Args:
+            initial (int): Starting number of requests allowed in flight.
+            maximum (int): Upper bound of requests allowed in flight.
+            minimum (int): <Optional> Lower bound of requests allowed in flight.
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.in_flight = 0
+        self.condition = threading.Condition()
+        # (event loop, future) of coroutines waiting for a slot
+        self._waiters = []
+
+    def raise_maximum(self, maximum):
+        """Raise the upper bound, starting the limit at a quarter of it if it is lower."""
+        with self.condition:
+            if maximum <= self.maximum:
+                return
+            self.maximum = maximum
+            self.limit = max(self.limit, float(max(self.minimum, maximum // 4)))
+            self._wake()
+            self.condition.notify_all()
+
+    def try_acquire(self):
+        """Take a slot if one is free without blocking."""
+        with self.condition:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self):
+        """Block until a slot is free."""
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    async def acquire_async(self):
+        """Wait for a free slot without blocking the event loop."""
+        loop = asyncio.get_event_loop()
+        while True:
+            with self.condition:
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                waiter = loop.create_future()
+                self._waiters.append((loop, waiter))
+            try:
+                await waiter
+            except BaseException:
+                with self.condition:
+                    if (loop, waiter) in self._waiters:
+                        self._waiters.remove((loop, waiter))
+                    else:
+                        # Pass the wakeup on so the freed slot isn't left unused
+                        self._wake()
+                raise
+
+    def _wake(self):
+        """Wake a waiting coroutine for each free slot. Called with the condition held."""
+        for _ in range(min(len(self._waiters), int(self.limit) - self.in_flight)):
+            loop, waiter = self._waiters.pop(0)
+            try:
+                # Slots may be released from any thread, so the future is resolved on its own loop
+                loop.call_soon_threadsafe(_resolve, waiter)
+            except RuntimeError:
+                # The waiter's loop was closed
+                pass
+
+    def release(self, throttled=False):
+        """Return a slot and adjust the limit from the outcome of the request."""
+        with self.condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit / 2)
+            else:
+                # Grow by roughly one slot per window of successful requests
+                self.limit = min(self.maximum, self.limit + 1.0 / max(1.0, self.limit))
+            self._wake()
+            self.condition.notify_all()
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def _headers_of(ex):
+    """Find the response headers attached to a service exception."""
+    headers = getattr(ex, 'headers', None)
+    if headers is None:
+        # googleapiclient HttpError
+        headers = getattr(ex, 'resp', None)
+    if headers is None:
+        # botocore ClientError
+        response = getattr(ex, 'response', None)
+        if isinstance(response, dict):
+            headers = response.get('ResponseMetadata', {}).get('HTTPHeaders', None)
+    return headers
+
+
+def _status_of(ex):
+    """Find the HTTP status code attached to a service exception."""
+    for attr in ('status', 'status_code', 'http_status'):
+        value = getattr(ex, attr, None)
+        if isinstance(value, int):
+            return value
+
+    resp = getattr(ex, 'resp', None)
+    if resp is not None and getattr(resp, 'status', None) is not None:
+        return int(resp.status)
+
+    response = getattr(ex, 'response', None)
+    if isinstance(response, dict):
+        return response.get('ResponseMetadata', {}).get('HTTPStatusCode', None)
+    return None
+
+
+def throttle_delay(ex):
+    """
+    Determine whether an exception is a throttle response.
+
+    Args:
+        ex (Exception): Exception raised by a service call.
+
+    Returns:
+        None when the exception is not a throttle, otherwise the Retry-After
+        delay in seconds requested by the service (0 if none was supplied).
+    """
+    # Dropbox RateLimitError carries the backoff directly
+    backoff = getattr(ex, 'backoff', None)
+    if backoff is not None and type(ex).__name__ == "RateLimitError":
+        return float(backoff or 0)
+
+    status = _status_of(ex)
+    # Drive reports user rate limits as a 403 with the reason in the body
+    text = (str(ex) + str(getattr(ex, 'content', ''))).lower().replace(' ', '')
+    code = ""
+    response = getattr(ex, 'response', None)
+    if isinstance(response, dict):
+        code = str(response.get('Error', {}).get('Code', "")).lower()
+
+    throttled = status in (429, 503) or code in THROTTLE_CODES or \
+        (status == 403 and any(x in text for x in THROTTLE_CODES))
+    if not throttled:
+        return None
+
+    headers = _headers_of(ex)
+    try:
+        return float(headers.get('retry-after', headers.get('Retry-After', 0)) or 0)
+    except Exception:
+        return 0.0
+
+
+def is_transient(ex):
+    """
+    Determine whether an exception is a transient failure worth retrying.
+
+    Args:
+        ex (Exception): Exception raised by a service call.
+
+    Returns:
+        True for server errors, connection resets and timeouts.
+    """
+    if any(cls.__name__ in TRANSIENT_EXCEPTIONS for cls in type(ex).__mro__):
+        return True
+
+    status = _status_of(ex)
+    if status in TRANSIENT_STATUS:
+        return True
+
+    response = getattr(ex, 'response', None)
+    if isinstance(response, dict):
+        code = str(response.get('Error', {}).get('Code', "")).lower()
+        return code in TRANSIENT_CODES
+    return False
+
+
+class RequestScheduler:
+    """Pace, bound and retry the API calls of one service."""
+
+    def __init__(self, service_type, rates=None, burst=None, max_concurrency=64,
+                 max_retries=8, base_delay=0.5, max_delay=60.0):
+        """
+        RequestScheduler initializer.
+
+        Args:
+            service_type (str): Service type the scheduler is pacing.
+            rates (dict): <Optional> Requests per second by endpoint class.
+            burst (float): <Optional> Token bucket capacity for every endpoint class.
+            max_concurrency (int): <Optional> Upper bound of requests in flight.
+            max_retries (int): <Optional> Throttle or transient error retries before the error is raised.
+            base_delay (float): <Optional> First backoff delay in seconds.
+            max_delay (float): <Optional> Largest backoff delay in seconds.
+        """
+        self.service_type = service_type
+        self.rates = rates or {}
+        self.burst = burst
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.limit = AdaptiveLimit(max(1, max_concurrency // 4), max_concurrency)
+        self.throttled = 0
+
+    def ensure_concurrency(self, concurrency):
+        """
+        Raise the upper bound of requests in flight to a handler's concurrency.
+
+        Args:
+            concurrency (int): Requests the handler keeps in flight, such as --async.
+        """
+        if concurrency > self.limit.maximum:
+            logger.info("Raising the {} request concurrency limit to {}".format(self.service_type,
+                                                                              concurrency))
+            self.limit.raise_maximum(concurrency)
+
+    def bucket(self, endpoint):
+        """Return the token bucket for an endpoint class."""
+        with self.lock:
+            if endpoint not in self.buckets:
+                self.buckets[endpoint] = TokenBucket(self.rates.get(endpoint, DEFAULT_RATE),
+                                                     self.burst)
+            return self.buckets[endpoint]
+
+    def _backoff(self, attempt, retry_after):
+        """Full jitter exponential backoff, never shorter than Retry-After."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        return max(delay, retry_after or 0)
+
+    def _throttled(self, endpoint, attempt, ex, retry_after):
+        with self.lock:
+            self.throttled += 1
+        metrics.observe("throttled", self.service_type, items=1)
+        if attempt >= self.max_retries:
+            logger.error("{} {} request still throttled after {} retries.".format(
+                self.service_type, endpoint, attempt))
+            raise ex
+        delay = self._backoff(attempt, retry_after)
+        logger.warning("{} {} request throttled. Retrying in {:.2f}s".format(self.service_type,
+                                                                            endpoint,
+                                                                            delay))
+        return delay
+
+    def _transient(self, endpoint, attempt, ex):
+        metrics.observe("transient", self.service_type, items=1)
+        if attempt >= self.max_retries:
+            logger.error("{} {} request still failing after {} retries.".format(
+                self.service_type, endpoint, attempt))
+            raise ex
+        delay = self._backoff(attempt, 0)
+        logger.warning("{} {} request failed ({}). Retrying in {:.2f}s".format(self.service_type,
+                                                                              endpoint,
+                                                                              type(ex).__name__,
+                                                                              delay))
+        return delay
+
+    def _retry_delay(self, endpoint, attempt, ex):
+        """
+        Release the slot of a failed call and return how long to wait before retrying it.
+
+        Raises the exception when it should not be retried.
+        """
+        retry_after = throttle_delay(ex)
+        self.limit.release(throttled=retry_after is not None)
+        if retry_after is not None:
+            return self._throttled(endpoint, attempt, ex, retry_after)
+        if is_transient(ex):
+            return self._transient(endpoint, attempt, ex)
+        raise ex
+
+    def call(self, endpoint, func, *args, **kwargs):
+        """
+        Run a blocking service call through the scheduler.
+
+        Args:
+            endpoint (str): Endpoint class of the call (list, search, metadata, download).
+            func (callable): Service call to make.
+
+        Returns:
+            The result of the service call.
+        """
+        attempt = 0
+        while True:
+            self.limit.acquire()
+            self.bucket(endpoint).acquire()
+            start = time.monotonic()
+            try:
+                res = func(*args, **kwargs)
+            except Exception as ex:
+                metrics.observe(endpoint, self.service_type, time.monotonic() - start, error=True)
+                time.sleep(self._retry_delay(endpoint, attempt, ex))
+                attempt += 1
+                continue
+
+            metrics.observe(endpoint, self.service_type, time.monotonic() - start)
+            self.limit.release()
+            return res
+
+    async def call_async(self, endpoint, func, *args, **kwargs):
+        """
+        Run an asynchronous service call through the scheduler.
+
+        Args:
+            endpoint (str): Endpoint class of the call (list, search, metadata, download).
+            func (coroutine function): Service call to make.
+
+        Returns:
+            The result of the service call.
+        """
+        attempt = 0
+        while True:
+            await self.limit.acquire_async()
+            wait = self.bucket(endpoint).reserve()
+            if wait:
+                await asyncio.sleep(wait)
+            start = time.monotonic()
+            try:
+                res = await func(*args, **kwargs)
+            except Exception as ex:
+                metrics.observe(endpoint, self.service_type, time.monotonic() - start, error=True)
+                await asyncio.sleep(self._retry_delay(endpoint, attempt, ex))
+                attempt += 1
+                continue
+
+            metrics.observe(endpoint, self.service_type, time.monotonic() - start)
+            self.limit.release()
+            return res
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(service_type, config_fields=None):
+    """
+    Return the process wide scheduler for a service type.
+
+    The first handler of a service type configures the scheduler.
+
+    Configuration Fields:
+        rate (float): <Optional> Requests per second for every endpoint class
+        rate_<endpoint> (float): <Optional> Requests per second for one endpoint class
+        burst (float): <Optional> Token bucket capacity
+        max_concurrency (int): <Optional> Upper bound of requests in flight (Default: 64)
+        max_retries (int): <Optional> Throttle and transient error retries before failing (Default: 8)
+    """
+    key = service_type.lower()
+    with _schedulers_lock:
+        if key not in _schedulers:
+            config_fields = config_fields or {}
+            rates = dict(DEFAULT_RATES.get(key, {}))
+            try:
+                rate = float(config_fields["rate"])
+                rates = {x: rate for x in (LIST, SEARCH, METADATA, DOWNLOAD)}
+            except:
+                pass
+            for endpoint in (LIST, SEARCH, METADATA, DOWNLOAD):
+                try:
+                    rates[endpoint] = float(config_fields["rate_" + endpoint])
+                except:
+                    pass
+
+            try:
+                burst = float(config_fields["burst"])
+            except:
+                burst = None
+
+            try:
+                max_concurrency = int(config_fields["max_concurrency"])
+            except:
+                max_concurrency = 64
+
+            try:
+                max_retries = int(config_fields["max_retries"])
+            except:
+                max_retries = 8
+
+            _schedulers[key] = RequestScheduler(key,
+                                                rates=rates,
+                                                burst=burst,
+                                                max_concurrency=max_concurrency,
+                                                max_retries=max_retries)
+        return _schedulers[key]
@@ -0,0 +1,256 @@
+"""
+Cazador regular expression engine module.
+
+[regex] rules are compiled with the regex module by default, which matches like
+the re module, Unicode classes included, but whose evaluations can be given a
+timeout. The backtracking re module is the fallback when regex isn't installed.
+
+The linear time re2 engine is opt-in, with regex and then re as its fallbacks for
+the rules it can't express. re2 matches differently: \w, \d, \s and \b only
+cover ASCII, so \w+ finds "caf" in "café" and \d skips non-ASCII digits.
+
+Rules left on a backtracking engine are linted when they are loaded for the
+constructs prone to catastrophic backtracking: nested quantifiers, quantified
+alternations whose branches overlap and adjacent quantifiers over overlapping
+characters.
+
+Created: 10/19/2026
+"""
+
+import re
+import string
+import logging
+logger = logging.getLogger(__name__)
+
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:
+    import sre_parse
+    import sre_constants
+
+RE2, REGEX, RE = "re2", "regex", "re"
+ENGINES = ("auto", RE2, REGEX, RE)
+
+# Characters used to approximate which characters a pattern element can match
+_SAMPLE = string.printable + "é "
+
+_CATEGORIES = {
+    sre_constants.CATEGORY_DIGIT: r"\d",
+    sre_constants.CATEGORY_NOT_DIGIT: r"\D",
+    sre_constants.CATEGORY_SPACE: r"\s",
+    sre_constants.CATEGORY_NOT_SPACE: r"\S",
+    sre_constants.CATEGORY_WORD: r"\w",
+    sre_constants.CATEGORY_NOT_WORD: r"\W",
+}
+
+_REPEATS = tuple(x for x in (getattr(sre_constants, "MAX_REPEAT", None),
+                             getattr(sre_constants, "MIN_REPEAT", None),
+                             getattr(sre_constants, "POSSESSIVE_REPEAT", None)) if x is not None)
+
+
+def _load_engine(name):
+    """Import an engine module, or return None if it isn't installed."""
+    if name == RE:
+        return re
+    try:
+        if name == RE2:
+            import re2
+            return re2
+        if name == REGEX:
+            import regex
+            return regex
+    except ImportError:
+        return None
+    raise ValueError("Unknown regex engine {}. Expected one of {}".format(name, ", ".join(ENGINES)))
+
+
+def compile_expression(expression, engine=REGEX):
+    """
+    Compile a rule with the first engine that can express it.
+
+    Args:
+        expression (str): Regular expression of the rule.
+        engine (str): <Optional> Naming an engine tries it before falling back to regex
+                      and then re. auto is the same as re2.
+
+    Returns:
+        Tuple of (engine name, compiled pattern).
+
+    Raises:
+        re.error: The expression isn't valid.
+    """
+    # Fall back to regex before re so the evaluations can still be given a timeout
+    candidates = (RE2, REGEX) if engine == "auto" else (engine, REGEX)
+    for name in candidates:
+        if name == RE:
+            break
+        module = _load_engine(name)
+        if module is None:
+            continue
+        try:
+            if name == RE2:
+                # Rules re2 can't express are expected, so its own error log is silenced
+                options = module.Options()
+                options.log_errors = False
+                return name, module.compile(expression, options)
+            return name, module.compile(expression)
+        except Exception as ex:
+            logger.debug("The {} engine can't compile {}. {}".format(name, expression, ex))
+    return RE, re.compile(expression)
+
+
+def _charset(op, av):
+    """Return the sample characters a single character element can match, or None."""
+    if op == sre_constants.LITERAL:
+        return {chr(av)}
+    if op == sre_constants.NOT_LITERAL:
+        return set(_SAMPLE) - {chr(av)}
+    if op == sre_constants.ANY:
+        return set(_SAMPLE)
+    if op == sre_constants.IN:
+        chars = set()
+        negate = False
+        for item_op, item_av in av:
+            if item_op == sre_constants.NEGATE:
+                negate = True
+            elif item_op == sre_constants.LITERAL:
+                chars.add(chr(item_av))
+            elif item_op == sre_constants.RANGE:
+                chars.update(c for c in _SAMPLE if item_av[0] <= ord(c) <= item_av[1])
+            elif item_op == sre_constants.CATEGORY and item_av in _CATEGORIES:
+                chars.update(c for c in _SAMPLE if re.match(_CATEGORIES[item_av], c))
+            else:
+                return set(_SAMPLE)
+        return set(_SAMPLE) - chars if negate else chars
+    return None
+
+
+def _edge(pattern, last=False):
+    """Return the sample characters the start, or the end, of a parsed pattern can match."""
+    items = list(pattern)
+    if last:
+        items.reverse()
+    for index, (op, av) in enumerate(items):
+        chars = _charset(op, av)
+        if chars is not None:
+            return chars
+        if op in _REPEATS:
+            chars = _edge(av[2], last)
+            if not av[0]:
+                # An optional element lets the next element start (or end) the match too
+                rest = items[index + 1:]
+                chars = chars | _edge(reversed(rest) if last else rest, last)
+            return chars
+        if op == sre_constants.SUBPATTERN:
+            return _edge(av[-1], last)
+        if op == sre_constants.BRANCH:
+            res = set()
+            for branch in av[1]:
+                res |= _edge(branch, last)
+            return res
+        if op in (sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            continue
+        return set(_SAMPLE)
+    return set()
+
+
+def _has_variable_repeat(pattern):
+    """Check whether a parsed pattern contains an unbounded quantifier."""
+    for op, av in pattern:
+        if op in _REPEATS:
+            if av[1] == sre_constants.MAXREPEAT and av[0] != av[1]:
+                return True
+            if _has_variable_repeat(av[2]):
+                return True
+        elif op == sre_constants.SUBPATTERN:
+            if _has_variable_repeat(av[-1]):
+                return True
+        elif op == sre_constants.BRANCH:
+            if any(_has_variable_repeat(b) for b in av[1]):
+                return True
+    return False
+
+
+def _single_charset(pattern):
+    """Return the characters matched by a pattern made of a single character element."""
+    items = list(pattern)
+    if len(items) == 1:
+        op, av = items[0]
+        if op == sre_constants.SUBPATTERN:
+            return _single_charset(av[-1])
+        return _charset(op, av)
+    return None
+
+
+def _overlapping_alternation(body):
+    """
+    Check whether a repeated body ends in an alternation whose branches can match alike.
+
+    sre_parse moves a prefix shared by every branch in front of the alternation, so
+    (a|ab) is parsed as a(|b). A branch left empty by that means one alternative is
+    a prefix of another, which is as ambiguous as branches starting alike.
+    """
+    items = list(body)
+    while len(items) == 1 and items[0][0] == sre_constants.SUBPATTERN:
+        items = list(items[0][1][-1])
+    if not items or items[-1][0] != sre_constants.BRANCH:
+        return False
+    branches = [list(b) for b in items[-1][1][1]]
+    if len(branches) < 2:
+        return False
+    if any(not b for b in branches):
+        return True
+    firsts = [_edge(b) for b in branches]
+    return any(firsts[i] & firsts[j] for i in range(len(firsts)) for j in range(i + 1, len(firsts)))
+
+
+def _lint(pattern, warnings):
+    previous = None
+    for op, av in pattern:
+        if op in _REPEATS:
+            low, high, body = av
+            unbounded = high == sre_constants.MAXREPEAT
+            # Repeating a variable length body is only ambiguous when one repetition
+            # can end with the characters the next one starts with
+            if unbounded and _has_variable_repeat(body) and _edge(body, last=True) & _edge(body):
+                warnings.append("nested quantifiers such as (a+)+")
+            if unbounded:
+                if _overlapping_alternation(body):
+                    warnings.append("quantified alternation with overlapping branches"
+                                    " such as (a|ab)*")
+                if previous is not None:
+                    current = _single_charset(body)
+                    if current and previous & current:
+                        warnings.append("adjacent quantifiers over overlapping characters"
+                                        " such as .*.*")
+                previous = _single_charset(body)
+            else:
+                previous = None
+            _lint(body, warnings)
+        else:
+            previous = None
+            if op == sre_constants.SUBPATTERN:
+                _lint(av[-1], warnings)
+            elif op == sre_constants.BRANCH:
+                for b in av[1]:
+                    _lint(b, warnings)
+
+
+def lint_expression(expression):
+    """
+    Flag the constructs of a rule prone to catastrophic backtracking.
+
+    Args:
+        expression (str): Regular expression of the rule.
+
+    Returns:
+        List of unique warning strings. Empty if nothing was found.
+    """
+    try:
+        parsed = sre_parse.parse(expression)
+    except Exception:
+        return []
+    warnings = []
+    _lint(parsed, warnings)
+    return list(dict.fromkeys(warnings))
@@ -0,0 +1,58 @@
+"""
+Cazador file service handler registry.
+
+Handler modules pull in large cloud SDKs, so they are only imported once a
+service of their type is requested. Each entry maps the lowercase service type
+to the module and handler class implementing it.
+"""
+
+import os
+import importlib
+import logging
+logger = logging.getLogger(__name__)
+
+knownServiceModules = {
+    "amazons3": ("services.amazons3", "amazonS3Handler"),
+    "box": ("services.box", "boxHandler"),
+    "dropbox": ("services.dropbox", "dropboxHandler"),
+    "googledrive": ("services.googledrive", "googledriveHandler"),
+    "localfs": ("services.localfs", "localfsHandler"),
+}
+
+
+def get_service_types():
+    """Return the lowercase type of every registered service without importing them."""
+    return sorted(knownServiceModules.keys())
+
+
+def load_service(fs_type):
+    """
+    Import the handler class for a service type.
+
+    Service types missing from the registry fall back to importing every module
+    in this package and matching the loaded fileServiceInterface subclasses.
+
+    Args:
+        fs_type (string): Type of service to load
+
+    Returns:
+        fileServiceInterface subclass handling the service type.
+    """
+    key = fs_type.lower()
+    if key in knownServiceModules:
+        module_name, class_name = knownServiceModules[key]
+        return getattr(importlib.import_module(module_name), class_name)
+
+    import pkgutil
+    for _, name, _ in pkgutil.iter_modules([os.path.dirname(__file__)]):
+        try:
+            importlib.import_module('services.' + name)
+        except Exception as ex:
+            logger.error("Failed to import {}: {}".format(name, ex))
+
+    from fileservice import fileServiceInterface
+    for srv in fileServiceInterface.__subclasses__():
+        if srv.get_service_type().lower() == key:
+            return srv
+
+    raise ValueError("Unsupported file service type: {}".format(fs_type))
@@ -7,7 +7,11 @@ Creator: Nathan Palmer
 import os
 from fileservice import fileServiceInterface
 from cazobjects import CazFile
-from cazscan import search_content, create_temp_name
+from cazscan import scan_item
+from ratelimit import get_scheduler, LIST, METADATA, DOWNLOAD
+from transfer import download_ranges, s3_etag_hasher
+from inventory import InventoryReport
+from connections import pool_size, botocore_config, register_boto3_pool
 import boto3
 import botocore
 import logging
@@ -17,6 +21,9 @@ logger = logging.getLogger(__name__)
 class amazonS3Handler(fileServiceInterface):
     """Amazon cloud service handler."""
 
+    # download_file fetches large objects in parts of this size (the s3transfer default)
+    download_part_size = 8 * 1024 * 1024
+
     def __init__(self, config_fields):
         """
         Initialize the Amazon S3 handler using configuration dictionary fields.
@@ -30,11 +37,21 @@ class amazonS3Handler(fileServiceInterface):
             region (str): Repository region code
             buckets (str): Semicolon separated list of buckets to search
             filename_crawl (bool): Support failing back to a filename wildcard crawl
+            inventory (str): <Optional> Semicolon separated list of S3 Inventory manifests, or
+                             folders/prefixes of dated reports, used to list their source buckets
+            rate, burst, max_concurrency, max_retries: <Optional> Request scheduling (see ratelimit)
+            pool_size (int): <Optional> Connections kept open (Default: workers or max_concurrency)
         """
+        self.region = config_fields["region"]
+        self.access_key_id = config_fields["access_key_id"]
+        self.secret_key = config_fields["secret_key"]
+        size = pool_size(config_fields)
         self.client = boto3.resource("s3",
                                      region_name=config_fields["region"],
                                      aws_access_key_id=config_fields["access_key_id"],
-                                     aws_secret_access_key=config_fields["secret_key"])
+                                     aws_secret_access_key=config_fields["secret_key"],
+                                     config=botocore_config(size))
+        register_boto3_pool("amazons3", self.client, size)
 
         self.buckets = []
         raw_buckets = config_fields["buckets"].split(';')
@@ -49,6 +66,21 @@ class amazonS3Handler(fileServiceInterface):
             # Default to perform filename crawl as a fallback
             self.filename_crawl = True
 
+        # Buckets with an inventory report are listed from the report instead of ListObjectsV2
+        self.inventories = {}
+        try:
+            raw_inventories = config_fields["inventory"].split(';')
+        except:
+            raw_inventories = []
+        for location in raw_inventories:
+            if location:
+                report = InventoryReport(location, self.client.meta.client)
+                self.inventories[report.bucket] = report
+                if report.bucket not in self.buckets:
+                    self.buckets.append(report.bucket)
+
+        self.scheduler = get_scheduler(self.get_service_type(), config_fields)
+
     @staticmethod
     def get_service_type():
         """Return the type of file service (Amazon)."""
@@ -58,10 +90,96 @@ class amazonS3Handler(fileServiceInterface):
         """Convert the file details into a CazFile."""
         return CazFile(item.key,
                        os.path.basename(item.key),
-                       None,
+                       item.bucket_name,
                        md5=item.e_tag.strip('"'),
                        path=item.key)
 
+    def describe_file(self, item):
+        """Describe a listed object entry without requesting the object details."""
+        return CazFile(item['Key'],
+                       os.path.basename(item['Key']),
+                       item['Bucket'],
+                       md5=item['ETag'].strip('"') if item.get('ETag') else None,
+                       path=item['Key'],
+                       size=item.get('Size', None),
+                       modified=item.get('LastModified', None))
+
+    def checkpoint_key(self, item):
+        """Return the bucket qualified key of a listed object entry."""
+        return "{}/{}".format(item['Bucket'], item['Key'])
+
+    def _list_bucket_pages(self, bucket_name, token=None):
+        """Yield (token, object entries, next token) for each listing page of a bucket.
+
+        Buckets with an inventory report are read from the report, whose tokens
+        are positions within the report.
+
+        Args:
+            bucket_name (str): Bucket to list.
+            token (str): <Optional> Continuation token to start listing from.
+        """
+        if bucket_name in self.inventories:
+            yield from self.inventories[bucket_name].pages(token)
+            return
+
+        s3 = self.client.meta.client
+        kwargs = {"Bucket": bucket_name}
+        while True:
+            if token:
+                kwargs["ContinuationToken"] = token
+            page = self.scheduler.call(LIST, s3.list_objects_v2, **kwargs)
+            objs = page.get('Contents', [])
+            for obj in objs:
+                obj['Bucket'] = bucket_name
+
+            next_token = page['NextContinuationToken'] if page.get('IsTruncated', False) else None
+            yield token, objs, next_token
+
+            if not next_token:
+                break
+            token = next_token
+
+    def _list_bucket(self, bucket_name):
+        """Yield every object entry in a bucket one listing page at a time."""
+        for token, objs, next_token in self._list_bucket_pages(bucket_name):
+            for obj in objs:
+                yield obj
+
+    def list_files(self):
+        """Yield the entry of every object in the configured buckets.
+
+        Each bucket's continuation token is recorded with the checkpoint so an
+        interrupted scan resumes from the last page in progress.
+        """
+        for b in self.buckets:
+            stream = "bucket:{}".format(b)
+            complete, token = self.checkpoint.position(stream)
+            if complete:
+                continue
+
+            for token, objs, next_token in self._list_bucket_pages(b, token):
+                # Skip folder placeholders
+                objs = [x for x in objs if not (x['Key'].endswith('/') and not x.get('Size', 0))]
+                for obj in self.record_page(stream, token, objs, next_token):
+                    yield obj
+
+    def download_file(self, item, f_path):
+        """Download a listed object to a local path."""
+        self.scheduler.call(DOWNLOAD,
+                            self.client.meta.client.download_file,
+                            item['Bucket'],
+                            item['Key'],
+                            f_path)
+
+    def read_head(self, item, size):
+        """Read the leading bytes of a listed object with a ranged GET."""
+        res = self.scheduler.call(DOWNLOAD,
+                                  self.client.meta.client.get_object,
+                                  Bucket=item['Bucket'],
+                                  Key=item['Key'],
+                                  Range="bytes=0-{}".format(size - 1))
+        return res['Body'].read()
+
     def _find_object_by_lambda(self, bucket, func, find_one=False):
         """Crawl the contents of a bucket to find an object that passes the supplied function.
 
@@ -71,9 +189,9 @@ class amazonS3Handler(fileServiceInterface):
             find_one (bool): <Optional> Exit the processing loop after finding the first result.
         """
         matches = []
-        for obj in bucket.objects.all():
+        for obj in self._list_bucket(bucket.name):
             if func(obj):
-                matches.append(self.convert_file(obj))
+                matches.append(self.describe_file(obj))
                 if find_one:
                     # Exit out after first match
                     break
@@ -81,15 +199,27 @@ class amazonS3Handler(fileServiceInterface):
         return matches
 
     def _find_object_by_etag(self, bucket, tag=None, alt_tag=None, find_one=False):
-        """Crawl the contents of a bucket to find the object with a specific tag."""
-        if not tag and not alt_tag:
+        """Crawl the contents of a bucket to find the objects with a specific tag or a listed IOC.
+
+        The ETags of each listing page are checked against the IOC store as a single batch.
+        """
+        if not tag and not alt_tag and self.iocs is None:
             raise ValueError("No valid search tag specified.")
 
-        def find_by_tag(obj):
-            etag = obj.e_tag.strip('"')
-            return (tag and etag == tag) or (alt_tag and etag == alt_tag)
+        matches = []
+        for token, objs, next_token in self._list_bucket_pages(bucket.name):
+            etags = [(x.get('ETag') or '').strip('"') for x in objs]
+            if self.iocs is not None:
+                listed = self.iocs.contains_many(etags)
+            else:
+                listed = [False] * len(etags)
+            for obj, etag, ioc in zip(objs, etags, listed):
+                if ioc or (tag and etag == tag) or (alt_tag and etag == alt_tag):
+                    matches.append(self.describe_file(obj))
+                    if find_one:
+                        return matches
 
-        return self._find_object_by_lambda(bucket, find_by_tag, find_one=find_one)
+        return matches
 
     def _find_object_by_name_wildcard(self, bucket, name, find_one=True):
         if not name:
@@ -98,7 +228,7 @@ class amazonS3Handler(fileServiceInterface):
         def find_by_contains_name(obj):
             # S3 object names will contain the full path as the key
             # The easiest comparison is look for any match in a file path
-            return name in obj.key
+            return name in obj['Key']
 
         return self._find_object_by_lambda(bucket, find_by_contains_name, find_one=find_one)
 
@@ -116,7 +246,7 @@ class amazonS3Handler(fileServiceInterface):
             if name:
                 try:
                     obj = s3_bucket.Object(name)
-                    obj.load()  # Pull the object summary details
+                    self.scheduler.call(METADATA, obj.load)  # Pull the object summary details
                     matches.append(self.convert_file(obj))
                 except botocore.exceptions.ClientError as e:
                     # 404 indicates not found
@@ -126,7 +256,7 @@ class amazonS3Handler(fileServiceInterface):
                         # Try to find a match by crawl
                         matches.extend(self._find_object_by_name_wildcard(s3_bucket, name))
 
-            if md5 or sha1:
+            if md5 or sha1 or self.iocs is not None:
                 logger.debug("Checking for hash {} and {}".format(md5, sha1))
                 matches.extend(self._find_object_by_etag(s3_bucket, tag=md5, alt_tag=sha1))
 
@@ -141,31 +271,51 @@ class amazonS3Handler(fileServiceInterface):
         """
         matches = []
         # Walk through the object and download files
-        for b in self.buckets:
-            s3_bucket = self.client.Bucket(b)
-            for obj_sum in s3_bucket.objects.all():
-                obj = self.client.Object(obj_sum.bucket_name, obj_sum.key)
-                if obj.content_type == "binary/octet-stream":
-                    # Skip folders
-                    continue
-                f_path = create_temp_name(temp_dir, obj_sum.key)
-                logger.debug("Processing file {}...{}".format(obj_sum.key, f_path))
-                obj.download_file(f_path)
-                try:
-                    matches.extend(search_content(f_path, expressions))
-                except Exception as ex:
-                    logger.error("Unable to parse content in file {}. {}".format(obj_sum.key, ex))
-
-                try:
-                    os.remove(f_path)
-                except Exception as ex:
-                    logger.error("Unable to clean up temprary file {}. {}".format(f_path, ex))
+        for obj_sum in self.schedule(self.list_files()):
+            matches.extend(scan_item(self, obj_sum, temp_dir, expressions))
 
         return matches
 
-    def get_file(self, name=None, md5=None, sha1=None):
-        """Get a file from Amazon using the name or hashes."""
-        raise NotImplementedError
+    def fetch_file(self, info, f_path):
+        """
+        Download a verified copy of a found object with parallel ranged GETs.
+
+        Multipart uploads are verified against their ETag by hashing in blocks of
+        the original part size. Objects encrypted with KMS or customer keys don't
+        have an MD5 ETag and are saved without verification.
+        """
+        s3 = self.client.meta.client
+        bucket, key = info.parent, info.file_id
+        head = self.scheduler.call(METADATA, s3.head_object, Bucket=bucket, Key=key)
+        etag = head['ETag'].strip('"')
+
+        hasher = None
+        if head.get('ServerSideEncryption') == 'aws:kms' or head.get('SSECustomerAlgorithm'):
+            logger.warning("Unable to verify encrypted object {}. Its ETag is not a hash.".format(key))
+        elif '-' in etag:
+            part = self.scheduler.call(METADATA, s3.head_object, Bucket=bucket, Key=key, PartNumber=1)
+            hasher = s3_etag_hasher(part['ContentLength'])
+        else:
+            hasher = s3_etag_hasher()
+
+        def fetch_range(start, end):
+            # IfMatch fails the range if the object changes part way through the download
+            res = self.scheduler.call(DOWNLOAD,
+                                      s3.get_object,
+                                      Bucket=bucket,
+                                      Key=key,
+                                      Range="bytes={}-{}".format(start, end - 1),
+                                      IfMatch=head['ETag'])
+            return res['Body'].iter_chunks(1024 * 1024)
+
+        download_ranges(f_path,
+                        head['ContentLength'],
+                        fetch_range,
+                        hasher=hasher,
+                        expected=etag if hasher else None,
+                        identity=etag,
+                        chunk_size=self.download_chunk_size,
+                        workers=self.download_workers)
 
 
 # Register our handler
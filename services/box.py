@@ -6,8 +6,12 @@ Creator: Nathan Palmer
 
 from fileservice import fileServiceInterface
 from cazobjects import CazFile
-from cazscan import search_content, create_temp_name
-import os
+from cazscan import scan_item
+from checkpoint import NullCheckpoint
+from ratelimit import get_scheduler, LIST, SEARCH, METADATA, DOWNLOAD
+from connections import pool_size, requests_session
+from transfer import download_ranges, ContentHasher
+from boxsdk.network.default_network import DefaultNetwork
 from boxsdk import OAuth2
 import boxsdk
 import logging
@@ -17,6 +21,10 @@ import webbrowser
 from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, make_server
 logger = logging.getLogger(__name__)
 
+# Fields requested for folder listings. Size and modification time let files be
+# skipped or resumed without downloading them first.
+LIST_FIELDS = ['name', 'sha1', 'size', 'modified_at']
+
 
 class boxHandler(fileServiceInterface):
     """Box cloud service handler."""
@@ -35,6 +43,13 @@ class boxHandler(fileServiceInterface):
         def stop(self):
             self._server.shutdown()
 
+    class PooledNetwork(DefaultNetwork):
+        """Box network layer sending every request through a shared keep-alive session."""
+
+        def __init__(self, session):
+            super(boxHandler.PooledNetwork, self).__init__()
+            self._session = session
+
     def __init__(self, config_fields):
         """
         Initialize the Box handler using configuration dictionary fields.
@@ -49,7 +64,11 @@ class boxHandler(fileServiceInterface):
             local_auth_port (str): Local port to use for OAuth redirection
             client_id (str): Client Id to use for OAuth validation
             client_secret (str): Client secret to use for OAuth validation
+        Request Scheduling Fields:
+            rate, burst, max_concurrency, max_retries: <Optional> See ratelimit.get_scheduler
+            pool_size (int): <Optional> Connections kept open (Default: max_concurrency)
         """
+        network = boxHandler.PooledNetwork(requests_session("box", pool_size(config_fields)))
         auth_code = {}
         auth_code_available = Event()
         local_oauth_redirect = bottle.Bottle()
@@ -63,7 +82,8 @@ class boxHandler(fileServiceInterface):
             access_token = config_fields["access_token"]
             oauth = OAuth2(client_id="",
                            client_secret="",
-                           access_token=access_token)
+                           access_token=access_token,
+                           network_layer=network)
         except:
             # If we don't have an access_token perform OAuth validation
             try:
@@ -81,7 +101,8 @@ class boxHandler(fileServiceInterface):
             server_thread.start()
 
             oauth = OAuth2(client_id=config_fields["client_id"],
-                           client_secret=config_fields["client_secret"])
+                           client_secret=config_fields["client_secret"],
+                           network_layer=network)
 
             auth_url, csrf_token = oauth.get_authorization_url('http://{}:{}'.format(host,
                                                                                      port))
@@ -93,7 +114,9 @@ class boxHandler(fileServiceInterface):
             assert auth_code['state'] == csrf_token
             access_token, refresh_token = oauth.authenticate(auth_code['auth_code'])
 
-        self.client = boxsdk.Client(oauth)
+        self.oauth = oauth
+        self.client = boxsdk.Client(oauth, network_layer=network)
+        self.scheduler = get_scheduler(self.get_service_type(), config_fields)
 
         self.folders = []
         try:
@@ -121,7 +144,10 @@ class boxHandler(fileServiceInterface):
             path_entr = item.path_collection["entries"]
         except:
             # Some of the items don't have it... try a direct request
-            pc = item.get(['path_collection', 'id', 'parent', 'name', 'sha1'])
+            pc = self.scheduler.call(METADATA,
+                                     item.get,
+                                     ['path_collection', 'id', 'parent', 'name', 'sha1', 'size',
+                                      'modified_at'])
             if pc:
                 item = pc
 
@@ -133,7 +159,9 @@ class boxHandler(fileServiceInterface):
                           item.name,
                           item.parent,
                           sha1=item.sha1,
-                          path=m_path)
+                          path=m_path,
+                          size=getattr(item, 'size', None),
+                          modified=getattr(item, 'modified_at', None))
         except Exception as ex:
             logger.error("Unable to translate result item. {}".format(ex))
             caz = None
@@ -145,7 +173,12 @@ class boxHandler(fileServiceInterface):
         for f in self.folders:
             # Build a set of Box Folder entries for searching
             if not f == '':
-                bfs = self.client.search(f, limit=1, offset=0, result_type="folder")
+                bfs = self.scheduler.call(SEARCH,
+                                          self.client.search,
+                                          f,
+                                          limit=1,
+                                          offset=0,
+                                          result_type="folder")
 
                 for x in bfs:
                     box_folders.append(x)
@@ -155,13 +188,29 @@ class boxHandler(fileServiceInterface):
                 box_folders.append(self.client.folder('0'))
         return box_folders
 
-    def _walk_directories_with_function(self, operation, folder_ids):
-        """Crawl the contents of the repository passing each result an operation.
+    def _walk_directories(self, folder_ids, record=False):
+        """Crawl the contents of the repository yielding every file found.
+
+        See _walk_directory_pages for the arguments.
+        """
+        for files in self._walk_directory_pages(folder_ids, record=record):
+            for x in files:
+                yield x
+
+    def _walk_directory_pages(self, folder_ids, record=False):
+        """Crawl the contents of the repository yielding the files of every folder listing page.
 
         This operation walks through the entire heirarchy and may be expensive and
         time consuming based on the size and depth of the repository.
+
+        Args:
+            folder_ids (Folder[]): Box folders to start the crawl from.
+            record (bool): <Optional> Record every folder page and sub-folder found with the
+                           checkpoint, only yielding the files owned by this shard.
         """
-        processed_fids = []
+        checkpoint = self.checkpoint if record else NullCheckpoint()
+        processed_fids = set()
+        queued_fids = set(x._object_id for x in folder_ids)
 
         # api limit on results
         limit = 1000
@@ -175,40 +224,110 @@ class boxHandler(fileServiceInterface):
                 # Don't double work if we already processed the ID
                 logger.error("FID {} already processed".format(fid))
                 continue
-            # box_folder = self.client.folder(fid)
-            offset = 0
+
+            stream = "folder:{}".format(fid)
+            complete, offset = checkpoint.position(stream)
+            if complete:
+                # Scanned by an earlier run, its sub-folders were restored with the checkpoint
+                processed_fids.add(fid)
+                continue
+            offset = offset or 0
 
             while True:
-                items = box_folder.get_items(limit, offset=offset)
+                items = self.scheduler.call(LIST, box_folder.get_items, limit, offset=offset,
+                                            fields=LIST_FIELDS)
                 logger.debug("Analyzing {} items in folder id {}. Total analyzed {}".format(len(items),
                                                                                             fid,
                                                                                             offset))
+                files = []
                 for x in items:
                     if x.type == 'folder':
-                        if x.id not in processed_fids:
+                        if x.id not in processed_fids and x.id not in queued_fids:
+                            queued_fids.add(x.id)
                             folder_ids.append(x)
+                            checkpoint.discover("folder:{}".format(x.id))
                     elif x.type == 'file':
-                        operation(x)
+                        files.append(x)
 
-                if len(items) < limit:
+                # If we received a set smaller than the limit... we are done
+                next_offset = offset + limit if len(items) >= limit else None
+                if record:
+                    files = self.record_page(stream, offset, files, next_offset)
+                if files:
+                    yield files
+
+                if next_offset is None:
                     logger.debug("Finished folder {} processing".format(fid))
-                    # If we received a set smaller than the limit... we are done
                     break
                 else:
                     logger.debug("Retrieving more items from folder {}".format(fid))
-                    offset += limit
+                    offset = next_offset
+
+            processed_fids.add(fid)
+
+    def _walk_directories_with_function(self, operation, folder_ids):
+        """Crawl the contents of the repository passing each result an operation.
 
-            processed_fids.append(fid)
+        This operation walks through the entire heirarchy and may be expensive and
+        time consuming based on the size and depth of the repository.
+        """
+        for x in self._walk_directories(folder_ids):
+            operation(x)
+
+    def describe_file(self, item):
+        """Describe a listed file without requesting the full file details."""
+        return CazFile(item.id,
+                       item.name,
+                       None,
+                       sha1=item.sha1,
+                       path=item.name,
+                       size=getattr(item, 'size', None),
+                       modified=getattr(item, 'modified_at', None))
+
+    def list_files(self):
+        """Yield every file within the configured folders.
+
+        The folder queue and the folders already walked are recorded with the
+        checkpoint so an interrupted scan resumes without walking them again.
+        """
+        folders = self._build_folder_list()
+        known = set(x._object_id for x in folders)
+        for stream, (complete, token) in self.checkpoint.streams("folder:").items():
+            fid = stream.split(':', 1)[1]
+            if not complete and fid not in known:
+                known.add(fid)
+                folders.append(self.client.folder(fid))
+
+        return self._walk_directories(folders, record=True)
+
+    def download_file(self, item, f_path):
+        """Download a listed file to a local path."""
+        def download():
+            with open(f_path, 'wb') as f:
+                item.download_to(f)
+
+        self.scheduler.call(DOWNLOAD, download)
+
+    def read_head(self, item, size):
+        """Read the leading bytes of a listed file with a byte range request."""
+        res = self.scheduler.call(DOWNLOAD,
+                                  self.client.make_request,
+                                  'GET',
+                                  item.get_url('content'),
+                                  headers={'Range': "bytes=0-{}".format(size - 1)},
+                                  expect_json_response=False)
+        return res.content[:size]
 
     def _find_by_sha1(self, sha1, folder_ids):
-        """Crawl the contents of the repository to find the object based on SHA1.
+        """Crawl the contents of the repository to find the object based on SHA1, or any listed IOC.
 
         This operation walks through the entire heirarchy and may be expensive and
         time consuming based on the size and depth of the repository. This type of
         operation is a last ditch effort due to limited support for direct hash
-        searching.
+        searching. The SHA1s of each listing page are checked against the IOC store
+        as a single batch.
         """
-        if not sha1:
+        if not sha1 and self.iocs is None:
             raise ValueError("No valid search hash specified.")
 
         logger.warn("Box does not officially support SHA1 searching."
@@ -216,12 +335,15 @@ class boxHandler(fileServiceInterface):
                     " file metadata.")
 
         matches = []
-
-        def check_file_sha1(box_obj):
-            if box_obj.sha1 == sha1:
-                matches.append(self.convert_file(box_obj))
-
-        self._walk_directories_with_function(check_file_sha1, folder_ids)
+        for files in self._walk_directory_pages(folder_ids):
+            hashes = [x.sha1 for x in files]
+            if self.iocs is not None:
+                listed = self.iocs.contains_many(hashes)
+            else:
+                listed = [False] * len(hashes)
+            for box_obj, check, ioc in zip(files, hashes, listed):
+                if ioc or (sha1 and check == sha1):
+                    matches.append(self.convert_file(box_obj))
 
         return matches
 
@@ -229,23 +351,28 @@ class boxHandler(fileServiceInterface):
         """Find one or more files using the name and/or hash in Box."""
         matches = []
 
-        if not name and not sha1 and md5:
+        if not name and not sha1 and md5 and self.iocs is None:
             logger.error("Box does not support MD5 hash searching.")
             return matches
 
-        if not name and not sha1:
+        if not name and not sha1 and self.iocs is None:
             logger.error("No valid search criteria supplied.")
             return matches
 
         box_folders = self._build_folder_list()
 
         if name:
-            res = self.client.search(name, limit=200, offset=0, ancestor_folders=box_folders)
+            res = self.scheduler.call(SEARCH,
+                                      self.client.search,
+                                      name,
+                                      limit=200,
+                                      offset=0,
+                                      ancestor_folders=box_folders)
             # matches were found
             for m in res:
                 matches.append(self.convert_file(m))
 
-        if sha1:
+        if sha1 or self.iocs is not None:
             # add any matches to the existing list
             matches.extend(self._find_by_sha1(sha1, box_folders))
 
@@ -260,31 +387,37 @@ class boxHandler(fileServiceInterface):
         """
         matches = []
 
-        box_folders = self._build_folder_list()
-
-        def check_contents(box_obj):
-            f_path = create_temp_name(temp_dir, box_obj.name)
-            logger.debug("Processing file {}...{}".format(box_obj.name, f_path))
-            f = open(f_path, 'wb')
-            box_obj.download_to(f)
-            f.close()
-            try:
-                matches.extend(search_content(f_path, expressions))
-            except Exception as ex:
-                logger.error("Unable to parse content in file {}. {}".format(box_obj.name, ex))
-
-            try:
-                os.remove(f_path)
-            except Exception as ex:
-                logger.error("Unable to clean up temprary file {}. {}".format(f_path, ex))
-
-        self._walk_directories_with_function(check_contents, box_folders)
+        for box_obj in self.schedule(self.list_files()):
+            matches.extend(scan_item(self, box_obj, temp_dir, expressions))
 
         return matches
 
-    def get_file(self, name=None, md5=None, sha1=None):
-        """Get a file from Box using the name or hashes."""
-        raise NotImplementedError
+    def fetch_file(self, info, f_path):
+        """Download a verified copy of a found file with parallel byte range requests."""
+        box_file = self.scheduler.call(METADATA,
+                                       self.client.file(info.file_id).get,
+                                       fields=['name', 'size', 'sha1'])
+
+        url = box_file.get_url('content')
+
+        def fetch_range(start, end):
+            # Ranged requests are made directly since older SDKs don't accept a byte range
+            res = self.scheduler.call(DOWNLOAD,
+                                      self.client.make_request,
+                                      'GET',
+                                      url,
+                                      headers={'Range': "bytes={}-{}".format(start, end - 1)},
+                                      expect_json_response=False)
+            return [res.content]
+
+        download_ranges(f_path,
+                        box_file.size,
+                        fetch_range,
+                        hasher=ContentHasher("sha1"),
+                        expected=box_file.sha1,
+                        identity=box_file.sha1,
+                        chunk_size=self.download_chunk_size,
+                        workers=self.download_workers)
 
 
 # Register our handler
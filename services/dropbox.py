@@ -8,12 +8,17 @@ Created: 08/17/2016
 Creator: Nathan Palmer
 """
 
-import os
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from fileservice import fileServiceInterface
 from cazobjects import CazFile
-from cazscan import search_content, create_temp_name
+from cazscan import scan_item
+from ratelimit import get_scheduler, LIST, SEARCH, METADATA, DOWNLOAD
+from connections import pool_size, requests_session
+from transfer import download_stream, dropbox_hasher
+from priority import bounded_map
 import dropbox
-from dropbox.files import FileMetadata
+from dropbox.files import FileMetadata, FolderMetadata
 import logging
 
 logger = logging.getLogger(__name__)
@@ -31,8 +36,15 @@ class dropboxHandler(fileServiceInterface):
 
         Configuration Fields:
             access_token (str): Repository access token
+            folders (str): <Optional> Semicolon separated list of folders to search
+            workers (int): <Optional> Number of concurrent listing/download workers (Default: 8)
+            list_limit (int): <Optional> Entries requested per listing call (Default: 2000)
+            shard_depth (int): <Optional> Folder depth to split into concurrent listings (Default: 1)
+            rate, burst, max_concurrency, max_retries: <Optional> Request scheduling (see ratelimit)
+            pool_size (int): <Optional> Connections kept open (Default: twice the workers)
         """
-        self.client = dropbox.Dropbox(config_fields["access_token"])
+        self.access_token = config_fields["access_token"]
+        self.scheduler = get_scheduler(self.get_service_type(), config_fields)
 
         self.folders = []
         try:
@@ -47,6 +59,28 @@ class dropboxHandler(fileServiceInterface):
         except:
             self.folders.append('')
 
+        try:
+            self.workers = max(1, int(config_fields["workers"]))
+        except:
+            self.workers = 8
+
+        try:
+            self.list_limit = min(2000, max(1, int(config_fields["list_limit"])))
+        except:
+            self.list_limit = 2000
+
+        try:
+            self.shard_depth = max(0, int(config_fields["shard_depth"]))
+        except:
+            self.shard_depth = 1
+
+        # Listing and download workers share one keep-alive pool.
+        # Rate limits are retried by the shared request scheduler instead of the SDK.
+        session = requests_session("dropbox", max(pool_size(config_fields), 2 * self.workers))
+        self.client = dropbox.Dropbox(self.access_token,
+                                      max_retries_on_rate_limit=0,
+                                      session=session)
+
     @staticmethod
     def get_service_type():
         """Return the type of file service (Dropbox)."""
@@ -62,28 +96,219 @@ class dropboxHandler(fileServiceInterface):
 
     def find_file(self, name=None, md5=None, sha1=None):
         """Find one or more files using the name and/or hash in Dropbox."""
+        if not name and self.iocs is not None:
+            # The content_hash Dropbox reports can't be compared to MD5 or SHA1 indicators
+            logger.error("Dropbox does not report MD5 or SHA1 hashes to check IOCs against.")
+            return []
+
         if not name and (md5 or sha1):
             """Dropbox doesn't support hash searching at this time."""
             logger.error("Dropbox does not currently support hash searching.")
             raise ValueError("Dropbox does not support hash only searching.")
 
-        matches = []
         # TODO: https://www.dropbox.com/developers/reference/content-hash
-        for f in self.folders:
+        def search_folder(f):
+            found = []
             start = 0
             while True:
-                res = self.client.files_search(f, name, start=start)
+                res = self.scheduler.call(SEARCH, self.client.files_search, f, name, start=start)
                 if len(res.matches):
                     # matches were found
                     for m in res.matches:
-                        matches.append(self.convert_file(m))
+                        found.append(self.convert_file(m))
                 if res.more:
                     start = res.start
                 else:
                     break
+            return found
+
+        matches = []
+        # Run the name search across all configured folders at once
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for found in pool.map(search_folder, self.folders):
+                matches.extend(found)
 
         return matches
 
+    def _list_folder_pages(self, path, recursive, cursor=None):
+        """Yield (cursor, entries, next cursor) for each page of a folder listing.
+
+        Args:
+            path (str): Dropbox folder path to list.
+            recursive (bool): List the entire folder tree.
+            cursor (str): <Optional> Cursor of an earlier listing to continue from.
+        """
+        if cursor:
+            res = self.scheduler.call(LIST, self.client.files_list_folder_continue, cursor)
+        else:
+            res = self.scheduler.call(LIST,
+                                      self.client.files_list_folder,
+                                      path,
+                                      recursive=recursive,
+                                      limit=self.list_limit)
+        while True:
+            next_cursor = res.cursor if res.has_more else None
+            yield cursor, res.entries, next_cursor
+
+            if not next_cursor:
+                break
+            # Get the next set
+            cursor = next_cursor
+            res = self.scheduler.call(LIST, self.client.files_list_folder_continue, cursor)
+
+    def _list_folder(self, path, recursive):
+        """Yield every entry of a folder listing, following the cursor until exhausted."""
+        for cursor, entries, next_cursor in self._list_folder_pages(path, recursive):
+            for x in entries:
+                yield x
+
+    def _shard_folder(self, path, depth):
+        """Split a folder into its direct files and sub-folders to list independently.
+
+        Args:
+            path (str): Dropbox folder path to split.
+            depth (int): Number of folder levels to expand before listing recursively.
+
+        Returns:
+            Tuple of (FileMetadata list, folder path list to list recursively)
+        """
+        if depth <= 0:
+            return [], [path]
+
+        files = []
+        shards = []
+        for x in self._list_folder(path, False):
+            if isinstance(x, FileMetadata):
+                files.append(x)
+            elif isinstance(x, FolderMetadata):
+                sub_files, sub_shards = self._shard_folder(x.path_lower, depth - 1)
+                files.extend(sub_files)
+                shards.extend(sub_shards)
+
+        return files, shards
+
+    def describe_file(self, item):
+        """Describe a listed FileMetadata entry."""
+        return CazFile(item.id,
+                       item.name,
+                       item.parent_shared_folder_id,
+                       path=item.path_display,
+                       size=item.size,
+                       modified=item.server_modified,
+                       content_hash=item.content_hash)
+
+    def list_files(self):
+        """Yield every file in the configured folders.
+
+        Configured folders are split into sub-folder shards which are listed
+        concurrently in the background while the files found are yielded. Each
+        shard's cursor is recorded with the checkpoint so an interrupted scan
+        resumes from the last page in progress.
+        """
+        found = queue.Queue()
+        finished = object()
+
+        def shard(f):
+            stream = "split:{}".format(f)
+            complete, token = self.checkpoint.position(stream)
+            if complete:
+                # Split by an earlier run, its shards were restored with the checkpoint
+                return []
+            try:
+                files, sub_shards = self._shard_folder(f, self.shard_depth)
+                for p in sub_shards:
+                    self.checkpoint.discover("shard:{}".format(p))
+                for x in self.record_page(stream, None, files):
+                    found.put(x)
+                return sub_shards
+            except Exception as ex:
+                logger.error("Unable to process folder {}. {}".format(f, ex))
+                return []
+
+        def list_shard(path):
+            stream = "shard:{}".format(path)
+            complete, cursor = self.checkpoint.position(stream)
+            if complete:
+                return
+            try:
+                for cursor, entries, next_cursor in self._list_folder_pages(path, True, cursor):
+                    files = [x for x in entries if isinstance(x, FileMetadata)]
+                    for x in self.record_page(stream, cursor, files, next_cursor):
+                        found.put(x)
+            except Exception as ex:
+                logger.error("Unable to process folder {}. {}".format(path, ex))
+
+        def run_listing():
+            try:
+                with ThreadPoolExecutor(max_workers=self.workers) as list_pool:
+                    shards = []
+                    for sub_shards in list_pool.map(shard, self.folders):
+                        shards.extend(sub_shards)
+
+                    # Include shards restored from a checkpoint
+                    for stream in self.checkpoint.streams("shard:"):
+                        p = stream.split(':', 1)[1]
+                        if p not in shards:
+                            shards.append(p)
+
+                    logger.debug("Listing {} folder shards".format(len(shards)))
+                    for fut in as_completed([list_pool.submit(list_shard, p) for p in shards]):
+                        fut.result()
+            finally:
+                found.put(finished)
+
+        with ThreadPoolExecutor(max_workers=1) as runner:
+            runner.submit(run_listing)
+            while True:
+                x = found.get()
+                if x is finished:
+                    break
+                yield x
+
+    def download_file(self, item, f_path):
+        """Download a listed FileMetadata entry to a local path."""
+        self.scheduler.call(DOWNLOAD, self.client.files_download_to_file, f_path, item.path_display)
+
+    def read_head(self, item, size):
+        """
+        Read the leading bytes of a listed FileMetadata entry.
+
+        The SDK doesn't expose ranged downloads, so the download is closed once
+        enough of it has been read.
+        """
+        res_md, res = self.scheduler.call(DOWNLOAD, self.client.files_download, item.path_display)
+        head = b""
+        try:
+            for data in res.iter_content(size):
+                head += data
+                if len(head) >= size:
+                    break
+        finally:
+            res.close()
+        return head[:size]
+
+    def _walk_files_with_function(self, operation):
+        """Run an operation against every file in the configured folders.
+
+        Each file listed is handed to a worker pool so the listing never waits
+        on the operation. With a priority scheduler attached the listing runs
+        ahead in the scheduler instead and only a few files are handed over at a
+        time, so the best file listed so far is always the next one started.
+
+        Args:
+            operation (func): Method called with each FileMetadata returning a list of results.
+
+        Returns:
+            Combined list of the operation results.
+        """
+        results = []
+        in_flight = 2 * self.workers if self.priority is not None else None
+        with ThreadPoolExecutor(max_workers=self.workers) as work_pool:
+            for res in bounded_map(work_pool, operation, self.schedule(self.list_files()), in_flight):
+                results.extend(res)
+
+        return results
+
     def scan_files(self, temp_dir, expressions):
         """
         Scan all files for any content matches.
@@ -91,47 +316,42 @@ class dropboxHandler(fileServiceInterface):
         Args:
             expressions (CazRegExp[]) List of regular expressions for content comparison
         """
-        matches = []
+        return self._walk_files_with_function(lambda x: scan_item(self, x, temp_dir, expressions))
 
-        for f in self.folders:
-            try:
-                res = self.client.files_list_folder(f, recursive=True)
-
-                while True:
-                    for x in res.entries:
-                        # DBX FileMetadata/FolderMetadata
-                        if isinstance(x, FileMetadata):
-                            f_path = create_temp_name(temp_dir, x.name)
-                            try:
-                                # If it's a file... download and process
-                                self.client.files_download_to_file(f_path, x.path_display)
-                                logger.debug("Processing file {}...{}".format(x.name, f_path))
-                                matches.extend(search_content(f_path, expressions))
-                            except Exception as ex:
-                                logger.error("Unable to parse contents in file {}. {}".format(x.name,
-                                                                                              ex))
-
-                            try:
-                                # Clean up the temporary file
-                                os.remove(f_path)
-                            except Exception as ex:
-                                logger.error("Unable to clean up temporary file {}. {}".format(f_path,
-                                                                                               ex))
-
-                    if not res.has_more:
-                        break
-                    else:
-                        # Get the next set
-                        res = self.client.files_list_folder_continue(res.cursor)
+    def fetch_file(self, info, f_path):
+        """
+        Download a verified copy of a found file as a single stream.
 
-            except Exception as ex:
-                logger.error("Unable to process folder {}. {}".format(f, ex))
+        The SDK doesn't expose ranged downloads, so resuming a partial copy
+        requests the file again and skips the bytes already written.
+        """
+        md = self.scheduler.call(METADATA, self.client.files_get_metadata, info.path or info.file_id)
 
-        return matches
+        def fetch_stream(offset):
+            res_md, res = self.scheduler.call(DOWNLOAD, self.client.files_download, md.path_lower,
+                                              rev=md.rev)
+
+            def body():
+                skip = offset
+                try:
+                    for data in res.iter_content(1024 * 1024):
+                        if skip:
+                            if len(data) <= skip:
+                                skip -= len(data)
+                                continue
+                            data, skip = data[skip:], 0
+                        yield data
+                finally:
+                    res.close()
+
+            return body()
 
-    def get_file(self, name=None, md5=None, sha1=None):
-        """Get a file from Dropbox using the name or hashes."""
-        raise NotImplementedError
+        download_stream(f_path,
+                        md.size,
+                        fetch_stream,
+                        hasher=dropbox_hasher(),
+                        expected=md.content_hash,
+                        identity=md.rev)
 
 
 # Register our handler
@@ -6,7 +6,10 @@ Creator: Nathan Palmer
 
 from fileservice import fileServiceInterface
 from cazobjects import CazFile
-from cazscan import search_content, create_temp_name
+from cazscan import scan_item
+from ratelimit import get_scheduler, LIST, METADATA, DOWNLOAD
+from connections import ThreadLocalClient
+from transfer import download_ranges, ContentHasher
 import logging
 logger = logging.getLogger(__name__)
 
@@ -47,6 +50,8 @@ class googledriveHandler(fileServiceInterface):
             client_id (str): Client Id to use for OAuth validation
             client_secret (str): Client secret to use for OAuth validation
             cred_file (str): Full filepath to store credentials used for access.
+        Request Scheduling Fields:
+            rate, burst, max_concurrency, max_retries: <Optional> See ratelimit.get_scheduler
         """
         flow = OAuth2WebServerFlow(config_fields["client_id"],
                                    config_fields["client_secret"],
@@ -65,9 +70,25 @@ class googledriveHandler(fileServiceInterface):
 
         # Create an httplib2.Http object to handle our HTTP requests, and authorize it
         # using the credentials.authorize() function.
+        self.credentials = credentials
         http = httplib2.Http()
         http = credentials.authorize(http)
-        self.client = discovery.build('drive', 'v3', http=http)
+        root_client = discovery.build('drive', 'v3', http=http)
+
+        # Neither httplib2 nor the discovery client are thread safe. Every thread
+        # gets its own authorized connection built from the same discovery document
+        # and keeps it alive between requests.
+        def build_client():
+            return discovery.build_from_document(root_client._rootDesc,
+                                                 http=credentials.authorize(httplib2.Http()))
+
+        self._clients = ThreadLocalClient("googledrive", build_client)
+        self.scheduler = get_scheduler(self.get_service_type(), config_fields)
+
+    @property
+    def client(self):
+        """Return the Drive client owned by the calling thread."""
+        return self._clients.get()
 
     @staticmethod
     def get_service_type():
@@ -81,32 +102,48 @@ class googledriveHandler(fileServiceInterface):
                        item.get('parents', None),
                        md5=item.get('md5Checksum', None))
 
+    def _iter_file_search_pages(self,
+                                query,
+                                fields="nextPageToken, files(id, name, kind, mimeType, md5Checksum, parents, shared)",
+                                page_token=""):
+        """Yield (page token, file entries, next page token) for every page returned by a query."""
+        nextPage = page_token or ""
+
+        while nextPage is not None:
+            request = self.client.files().list(pageSize=1000,
+                                               q=query,
+                                               fields=fields,
+                                               pageToken=nextPage,
+                                               spaces="drive")
+            results = self.scheduler.call(LIST, request.execute)
+            items = results.get('files', [])
+            token = nextPage
+            try:
+                nextPage = results.get('nextPageToken', None)
+            except:
+                nextPage = None
+
+            if not items:
+                logger.debug('No files found.')
+            else:
+                logger.debug('{} Files found.'.format(len(items)))
+            yield token, items, nextPage
+
+    def _iter_file_search_query(self,
+                                query,
+                                fields="nextPageToken, files(id, name, kind, mimeType, md5Checksum, parents, shared)"):
+        """Yield every file entry returned by a query, following the page token."""
+        for token, items, next_token in self._iter_file_search_pages(query, fields=fields):
+            for item in items:
+                yield item
+
     def _run_file_search_query(self,
                                query,
                                item_check,
                                fields="nextPageToken, files(id, name, kind, mimeType, md5Checksum, parents, shared)"):
-        nextPage = ""
         try:
-            nextPage = ""
-
-            while nextPage is not None:
-                results = self.client.files().list(pageSize=1000,
-                                                   q=query,
-                                                   fields=fields,
-                                                   pageToken=nextPage,
-                                                   spaces="drive").execute()
-                items = results.get('files', [])
-                try:
-                    nextPage = results.get('nextPageToken', None)
-                except:
-                    nextPage = None
-
-                if not items:
-                    logger.debug('No files found.')
-                else:
-                    logger.debug('{} Files found.'.format(len(items)))
-                    for item in items:
-                        item_check(item)
+            for item in self._iter_file_search_query(query, fields=fields):
+                item_check(item)
 
         except AccessTokenRefreshError:
             # The AccessTokenRefreshError exception is raised if the credentials
@@ -114,36 +151,112 @@ class googledriveHandler(fileServiceInterface):
             logger.error('Unable to execute command. The access tokens have been'
                          ' revoked by the user or have expired.')
 
+    def describe_file(self, item):
+        """Describe a listed file entry."""
+        return CazFile(item.get('id', None),
+                       item.get('name', None),
+                       item.get('parents', None),
+                       md5=item.get('md5Checksum', None),
+                       path=item.get('name', None),
+                       size=int(item['size']) if 'size' in item else None,
+                       modified=item.get('modifiedTime', None),
+                       mime_type=item.get('mimeType', None))
+
+    def list_files(self):
+        """Yield every unshared file entry visible to the account.
+
+        The page token is recorded with the checkpoint so an interrupted scan
+        resumes from the last page in progress.
+        """
+        fields = ("nextPageToken, files(id, name, kind, mimeType, md5Checksum, parents, shared,"
+                  " size, modifiedTime)")
+
+        def include(item):
+            if item.get('mimeType') == self.FOLDER_MIME:
+                return False
+
+            shared = item.get('shared', None)
+            if shared is None or shared:
+                return False
+
+            # only process files
+            return bool(item.get('id', None) and item.get('name', None))
+
+        complete, token = self.checkpoint.position("files")
+        if complete:
+            return
+
+        try:
+            for token, items, next_token in self._iter_file_search_pages("", fields=fields,
+                                                                         page_token=token):
+                for item in self.record_page("files",
+                                             token,
+                                             [x for x in items if include(x)],
+                                             next_token):
+                    yield item
+
+        except AccessTokenRefreshError:
+            logger.error('Unable to execute command. The access tokens have been'
+                         ' revoked by the user or have expired.')
+
+    def download_file(self, item, f_path):
+        """Download a listed file entry to a local path."""
+        with open(f_path, 'wb') as f:
+            request = self.client.files().get_media(fileId=item['id'])
+            downloader = MediaIoBaseDownload(f, request)
+            done = False
+            while done is False:
+                status, done = self.scheduler.call(DOWNLOAD, downloader.next_chunk)
+
+    def read_head(self, item, size):
+        """Read the leading bytes of a listed file with a ranged media request."""
+        if 'size' not in item:
+            # Google documents have no stored content to read
+            return None
+        request = self.client.files().get_media(fileId=item['id'])
+        request.headers['Range'] = "bytes=0-{}".format(size - 1)
+        return self.scheduler.call(DOWNLOAD, request.execute)[:size]
+
     def _find_by_md5(self, md5):
-        """Crawl the contents of the repository to find the object based on the tags.
+        """Crawl the contents of the repository to find the object based on the tags, or any listed IOC.
 
         This operation walks through the entire heirarchy and may be expensive and
         time consuming based on the size and depth of the repository. This type of
         operation is a last ditch effort due to limited support for direct hash
-        searching.
+        searching. The MD5s of each listing page are checked against the IOC store
+        as a single batch.
         """
-        if not md5:
+        if not md5 and self.iocs is None:
             raise ValueError("No valid search hash specified.")
 
         matches = []
+        try:
+            for token, items, next_token in self._iter_file_search_pages(""):
+                hashes = [x.get('md5Checksum', None) for x in items]
+                if self.iocs is not None:
+                    listed = self.iocs.contains_many(hashes)
+                else:
+                    listed = [False] * len(hashes)
+                for item, check, ioc in zip(items, hashes, listed):
+                    if ioc or (md5 and check == md5):
+                        matches.append(self.convert_file(item))
 
-        def md5_item_check(item):
-            check = item.get('md5Checksum', None)
-            if check == md5:
-                matches.append(self.convert_file(item))
-
-        self._run_file_search_query("", md5_item_check)
+        except AccessTokenRefreshError:
+            # The AccessTokenRefreshError exception is raised if the credentials
+            # have been revoked by the user or they have expired.
+            logger.error('Unable to execute command. The access tokens have been'
+                         ' revoked by the user or have expired.')
         return matches
 
     def find_file(self, name=None, md5=None, sha1=None):
         """Find one or more files using the name and/or hash in Google Drive."""
         matches = []
 
-        if not name and not md5 and sha1:
+        if not name and not md5 and sha1 and self.iocs is None:
             logger.error("Google Drive does not support SHA1 hash searching.")
             return matches
 
-        if md5:
+        if md5 or self.iocs is not None:
             logger.warn("Google Drive does not officially support MD5 searching."
                         " This operation will walk your entire heirarchy comparing"
                         " file metadata.")
@@ -161,7 +274,7 @@ class googledriveHandler(fileServiceInterface):
             logger.error('Unable to execute command. The access tokens have been'
                          ' revoked by the user or have expired.')
 
-        if md5:
+        if md5 or self.iocs is not None:
             matches.extend(self._find_by_md5(md5))
 
         return matches
@@ -175,49 +288,34 @@ class googledriveHandler(fileServiceInterface):
         """
         matches = []
 
-        def scan_item_contents(item):
-            if item.get('mimType') == self.FOLDER_MIME:
-                return
-
-            shared = item.get('shared', None)
-            if shared is None or shared:
-                return
-            # only process files
-            file_id = item.get('id', None)
-            name = item.get('name', None)
-            available = True
-            if file_id and name:
-                f_path = create_temp_name(temp_dir, name)
-                logger.warning("Processing file {}...{}".format(name, f_path))
-                f = open(f_path, 'wb')
-                try:
-                    request = self.client.files().get_media(fileId=file_id)
-                    downloader = MediaIoBaseDownload(f, request)
-                    done = False
-                    while done is False:
-                        status, done = downloader.next_chunk()
-                except Exception as ex:
-                    logger.error("Unable to download file {}. {}".format(name, ex))
-                    available = False
-                f.close()
-                if available:
-                    try:
-                        matches.extend(search_content(f_path, expressions))
-                    except Exception as ex:
-                        logger.error("Unable to parse content in file {}. {}".format(name, ex))
-
-                try:
-                    os.remove(f_path)
-                except Exception as ex:
-                    logger.error("Unable to clean up temprary file {}. {}".format(f_path, ex))
-
-        self._run_file_search_query("", scan_item_contents)
+        for item in self.schedule(self.list_files()):
+            matches.extend(scan_item(self, item, temp_dir, expressions))
 
         return matches
 
-    def get_file(self, name=None, md5=None, sha1=None):
-        """Get a file from Google Drive using the name or hashes."""
-        raise NotImplementedError
+    def fetch_file(self, info, f_path):
+        """Download a verified copy of a found file with parallel chunked media requests."""
+        meta = self.scheduler.call(METADATA,
+                                   self.client.files().get(fileId=info.file_id,
+                                                           fields="size, md5Checksum").execute)
+        if 'size' not in meta:
+            raise ValueError("{} is a Google document without downloadable content".format(info.name))
+
+        def fetch_range(start, end):
+            # Every worker thread requests its chunk through its own client
+            request = self.client.files().get_media(fileId=info.file_id)
+            request.headers['Range'] = "bytes={}-{}".format(start, end - 1)
+            return [self.scheduler.call(DOWNLOAD, request.execute)]
+
+        md5 = meta.get('md5Checksum', None)
+        download_ranges(f_path,
+                        int(meta['size']),
+                        fetch_range,
+                        hasher=ContentHasher("md5"),
+                        expected=md5,
+                        identity=md5,
+                        chunk_size=self.download_chunk_size,
+                        workers=self.download_workers)
 
 
 # Register our handler
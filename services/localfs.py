@@ -0,0 +1,303 @@
+"""File service implementation for local and mounted (NFS/SMB) file systems.
+
+Directories are read with os.scandir across a thread pool, and file hashes are
+computed in parallel with large buffered or memory mapped reads. Files are
+scanned in place, so no temporary copies are made.
+
+Created: 10/19/2026
+"""
+
+import os
+import mmap
+import shutil
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from fileservice import fileServiceInterface
+from cazobjects import CazFile
+from cazscan import scan_cached, scan_file, sniff_item, finish_item
+from metrics import metrics, LIST
+from transfer import download_ranges, ContentHasher
+from priority import bounded_map
+logger = logging.getLogger(__name__)
+
+
+class localfsHandler(fileServiceInterface):
+    """Local and mounted file system handler."""
+
+    def __init__(self, config_fields):
+        """
+        Initialize the local file system handler using configuration dictionary fields.
+
+        Args:
+            config_fields (dict): String dictionary from the configuration segment
+
+        Configuration Fields:
+            paths (str): Semicolon separated list of directories to search
+            workers (int): <Optional> Number of concurrent directory/scan workers (Default: 16)
+            hash_workers (int): <Optional> Number of concurrent hashing workers (Default: workers)
+            follow_symlinks (bool): <Optional> Follow symbolic links while walking (Default: false)
+            read_size (int): <Optional> Buffered read size in bytes when hashing (Default: 1MB)
+            mmap_threshold (int): <Optional> Hash files at least this large via mmap (Default: 64MB)
+        """
+        self.paths = []
+        for p in config_fields["paths"].split(';'):
+            if p:
+                # Only add paths that are not null or empty strings
+                self.paths.append(os.path.abspath(os.path.expanduser(p)))
+
+        try:
+            self.workers = max(1, int(config_fields["workers"]))
+        except:
+            self.workers = 16
+
+        try:
+            self.hash_workers = max(1, int(config_fields["hash_workers"]))
+        except:
+            self.hash_workers = self.workers
+
+        try:
+            self.follow_symlinks = config_fields["follow_symlinks"].lower() == 'true'
+        except:
+            self.follow_symlinks = False
+
+        try:
+            self.read_size = max(4096, int(config_fields["read_size"]))
+        except:
+            self.read_size = 1024 * 1024
+
+        try:
+            self.mmap_threshold = int(config_fields["mmap_threshold"])
+        except:
+            self.mmap_threshold = 64 * 1024 * 1024
+
+    @staticmethod
+    def get_service_type():
+        """Return the type of file service (Local file system)."""
+        return "LocalFS"
+
+    def convert_file(self, item):
+        """Convert a file path into a CazFile."""
+        return self.describe_file(item)
+
+    def describe_file(self, item):
+        """Describe a listed file path."""
+        try:
+            st = os.stat(item)
+            size, modified = st.st_size, st.st_mtime
+        except OSError:
+            size, modified = None, None
+        return CazFile(item,
+                       os.path.basename(item),
+                       os.path.dirname(item),
+                       path=item,
+                       size=size,
+                       modified=modified)
+
+    def _scan_directory(self, path):
+        """Read a single directory returning its (files, sub-directories)."""
+        files = []
+        folders = []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=self.follow_symlinks):
+                            folders.append(entry.path)
+                        elif entry.is_file(follow_symlinks=self.follow_symlinks):
+                            files.append(entry.path)
+                    except OSError as ex:
+                        logger.error("Unable to read entry {}. {}".format(entry.path, ex))
+        except OSError as ex:
+            logger.error("Unable to process folder {}. {}".format(path, ex))
+        return files, folders
+
+    def checkpoint_key(self, item):
+        """Return the path of a listed file."""
+        return item
+
+    def list_files(self):
+        """Yield every file path under the configured paths.
+
+        Each directory is read by a separate worker so deep and wide trees on
+        high latency mounts are walked concurrently. Directories are recorded
+        with the checkpoint so an interrupted scan doesn't walk them again.
+        """
+        visited = set()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = {}
+
+            def submit(path):
+                real = os.path.realpath(path) if self.follow_symlinks else path
+                if real in visited:
+                    # Guard against symbolic link loops
+                    return
+                visited.add(real)
+                complete, token = self.checkpoint.position("dir:{}".format(path))
+                if not complete:
+                    pending[pool.submit(self._scan_directory, path)] = path
+
+            for p in self.paths:
+                if os.path.isfile(p):
+                    for x in self.record_page("file:{}".format(p), None, [p]):
+                        yield x
+                else:
+                    submit(p)
+
+            # Include directories restored from a checkpoint
+            for stream, (complete, token) in self.checkpoint.streams("dir:").items():
+                if not complete:
+                    submit(stream.split(':', 1)[1])
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    path = pending.pop(fut)
+                    files, folders = fut.result()
+                    for f in folders:
+                        self.checkpoint.discover("dir:{}".format(f))
+                        submit(f)
+                    for f in self.record_page("dir:{}".format(path), None, files):
+                        yield f
+
+    def download_file(self, item, f_path):
+        """Copy a listed file to a local path."""
+        shutil.copyfile(item, f_path)
+
+    def read_head(self, item, size):
+        """Read the leading bytes of a listed file."""
+        with open(item, 'rb') as f:
+            return f.read(size)
+
+    def hash_file(self, path, algorithms=("md5", "sha1")):
+        """
+        Hash a file with one or more algorithms in a single read pass.
+
+        Large files are memory mapped, smaller ones read in large buffered chunks.
+
+        Returns:
+            Dictionary of hex digests keyed by algorithm name.
+        """
+        hashes = {x: hashlib.new(x) for x in algorithms}
+        with open(path, 'rb', buffering=0) as f:
+            size = os.fstat(f.fileno()).st_size
+            if size and size >= self.mmap_threshold:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    for h in hashes.values():
+                        h.update(m)
+            else:
+                buf = bytearray(self.read_size)
+                view = memoryview(buf)
+                while True:
+                    n = f.readinto(buf)
+                    if not n:
+                        break
+                    for h in hashes.values():
+                        h.update(view[:n])
+
+        return {k: h.hexdigest() for k, h in hashes.items()}
+
+    def _find_by_hash(self, md5=None, sha1=None):
+        """Hash every file in parallel comparing against the requested digests and any listed IOCs."""
+        # Files are also hashed with every algorithm the IOC store lists digests of
+        algorithms = tuple(x for x, v in (("md5", md5), ("sha1", sha1))
+                           if v or (self.iocs is not None and self.iocs.counts[x]))
+
+        def check(path):
+            try:
+                digests = self.hash_file(path, algorithms)
+            except OSError as ex:
+                logger.error("Unable to hash file {}. {}".format(path, ex))
+                return None
+            if (md5 and digests.get("md5") == md5) or (sha1 and digests.get("sha1") == sha1) or \
+                    (self.iocs is not None and any(self.iocs.contains_many(list(digests.values())))):
+                caz = self.describe_file(path)
+                caz.md5 = digests.get("md5", None)
+                caz.sha1 = digests.get("sha1", None)
+                return caz
+            return None
+
+        matches = []
+        with ThreadPoolExecutor(max_workers=self.hash_workers) as pool:
+            for res in pool.map(check, self.list_files()):
+                if res:
+                    matches.append(res)
+        return matches
+
+    def find_file(self, name=None, md5=None, sha1=None):
+        """Find one or more files using the name and/or hash on the file system."""
+        matches = []
+        # Python hash digests are lowercase
+        md5 = md5.lower() if md5 else None
+        sha1 = sha1.lower() if sha1 else None
+
+        if name:
+            for path in self.list_files():
+                if name in os.path.basename(path):
+                    matches.append(self.describe_file(path))
+
+        if md5 or sha1 or self.iocs is not None:
+            matches.extend(self._find_by_hash(md5=md5, sha1=sha1))
+
+        return matches
+
+    def scan_files(self, temp_dir, expressions):
+        """
+        Scan all files for any content matches.
+
+        Files are scanned in place so temp_dir is unused.
+
+        Args:
+            expressions (CazRegExp[]) List of regular expressions for content comparison
+        """
+        service_type = self.get_service_type()
+
+        def check_contents(path):
+            metrics.observe(LIST, service_type, items=1)
+            info = self.describe_file(path)
+            # Local files have no stored hash so the path, size and modified time are used
+            key = "local:{}:{}:{}".format(path, info.size, info.modified)
+            res = scan_cached(service_type, info, expressions, key=key)
+            if res is None and not sniff_item(self, path, info):
+                res = []
+            if res is None:
+                res = scan_file(service_type, info, path, expressions, key=key)
+            return finish_item(self, path, res)
+
+        matches = []
+        # Only a few files are queued ahead of the scan so the scheduler picks what runs next
+        in_flight = 2 * self.workers if self.priority is not None else None
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for res in bounded_map(pool, check_contents, self.schedule(self.list_files()), in_flight):
+                matches.extend(res)
+        return matches
+
+    def fetch_file(self, info, f_path):
+        """Copy a found file in parallel ranges, verified against any hash found for it."""
+        st = os.stat(info.path)
+
+        def fetch_range(start, end):
+            with open(info.path, 'rb') as f:
+                f.seek(start)
+                remaining = end - start
+                while remaining:
+                    data = f.read(min(self.read_size, remaining))
+                    if not data:
+                        break
+                    remaining -= len(data)
+                    yield data
+
+        algorithm = "sha1" if info.sha1 else "md5"
+        expected = info.sha1 or info.md5
+        download_ranges(f_path,
+                        st.st_size,
+                        fetch_range,
+                        hasher=ContentHasher(algorithm) if expected else None,
+                        expected=expected,
+                        identity="{}:{}".format(st.st_size, st.st_mtime),
+                        chunk_size=self.download_chunk_size,
+                        workers=self.download_workers)
+
+
+# Register our handler
+fileServiceInterface.register(localfsHandler)
@@ -0,0 +1,61 @@
+"""
+Cazador scan sharding module.
+
+Splits a scan across independent processes without a coordinator. Every
+process lists the same locations, but only downloads and scans the files whose
+key hashes into its own shard, so N processes cover a service with no overlap.
+
+Created: 10/19/2026
+"""
+
+import hashlib
+
+
+class Shard:
+    """Ownership test for one of a fixed number of shards."""
+
+    def __init__(self, index, count):
+        """
+        Initialize a shard.
+
+        Args:
+            index (int): Zero based index of this shard.
+            count (int): Total number of shards.
+        """
+        if count < 1 or not 0 <= index < count:
+            raise ValueError("Shard index must be within 0 and {}".format(count - 1))
+        self.index = index
+        self.count = count
+
+    @staticmethod
+    def parse(spec):
+        """
+        Parse a shard specification.
+
+        Args:
+            spec (str): Shard in 'index/count' form. e.g. 0/4
+
+        Returns:
+            Shard
+        """
+        try:
+            index, count = [int(x) for x in spec.split('/')]
+        except ValueError:
+            raise ValueError("Invalid shard {}. Expected index/count such as 0/4".format(spec))
+        return Shard(index, count)
+
+    def owns(self, key):
+        """
+        Check whether a file belongs to this shard.
+
+        The hash is stable between processes and hosts, unlike the builtin hash().
+
+        Args:
+            key (str): Object key or id of the file.
+        """
+        digest = hashlib.sha1(str(key).encode('utf-8')).digest()
+        return int.from_bytes(digest[:8], 'big') % self.count == self.index
+
+    def __str__(self):
+        """String print helper."""
+        return "{}/{}".format(self.index, self.count)
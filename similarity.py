@@ -0,0 +1,285 @@
+"""
+Cazador near-duplicate document detection module.
+
+Sensitive reference documents are fingerprinted as MinHash signatures of their
+word shingles and stored in a locality sensitive hashing (LSH) index. Each
+scanned file's text is fingerprinted the same way and only compared against
+the references sharing an LSH band with it, so the cost of a lookup doesn't
+grow with the number of references.
+
+Signatures use one permutation hashing: every shingle is hashed once and the
+hash picks the signature slot it competes for, keeping fingerprinting linear
+in the size of the text.
+
+Created: 10/19/2026
+"""
+
+import os
+import re
+import json
+import hashlib
+import logging
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+# Hashes are reduced into this many bits after selecting a signature slot
+_HASH_BITS = 64
+_MAX_HASH = (1 << _HASH_BITS) - 1
+
+
+def shingles(text, size=5):
+    """
+    Return the set of word shingles in a text.
+
+    Args:
+        text (str): Extracted document text.
+        size (int): <Optional> Number of words per shingle.
+
+    Returns:
+        Set of shingle strings.
+    """
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _hash(shingle):
+    # Stable between processes so saved signatures stay comparable
+    return int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def signature(shingle_set, num_perm=128):
+    """
+    Build a MinHash signature with one permutation hashing and rotation densification.
+
+    Args:
+        shingle_set (set): Shingles of the document.
+        num_perm (int): <Optional> Signature length.
+
+    Returns:
+        List of num_perm integers, or None for a document without shingles.
+    """
+    if not shingle_set:
+        return None
+
+    sig = [None] * num_perm
+    for s in shingle_set:
+        h = _hash(s)
+        slot = h % num_perm
+        value = h // num_perm
+        if sig[slot] is None or value < sig[slot]:
+            sig[slot] = value
+
+    # Fill empty slots from the next originally filled slot so short documents still compare
+    original = list(sig)
+    for i in range(num_perm):
+        if original[i] is None:
+            distance = 1
+            while original[(i + distance) % num_perm] is None:
+                distance += 1
+            sig[i] = (original[(i + distance) % num_perm] + distance * 0x9E3779B97F4A7C15) & _MAX_HASH
+    return sig
+
+
+def estimate_similarity(sig_a, sig_b):
+    """Estimate the Jaccard similarity of two documents from their signatures."""
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / float(len(sig_a))
+
+
+def lsh_bands(threshold, num_perm):
+    """
+    Choose the LSH band layout whose detection threshold is closest to the requested one.
+
+    Returns:
+        Tuple of (bands, rows per band).
+    """
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        # Similarity at which a pair becomes more likely than not to share a band
+        approx = (1.0 / bands) ** (1.0 / rows)
+        if best is None or abs(approx - threshold) < best[0]:
+            best = (abs(approx - threshold), bands, rows)
+    return best[1], best[2]
+
+
+class MinHashIndex:
+    """LSH index of reference document signatures."""
+
+    def __init__(self, threshold=0.5, num_perm=128, shingle_size=5):
+        """
+        Initialize an empty index.
+
+        Args:
+            threshold (float): <Optional> Lowest estimated similarity reported.
+            num_perm (int): <Optional> Signature length.
+            shingle_size (int): <Optional> Number of words per shingle.
+        """
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = lsh_bands(threshold, num_perm)
+        self.signatures = {}
+        self._buckets = [{} for _ in range(self.bands)]
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def _band_keys(self, sig):
+        for b in range(self.bands):
+            yield b, tuple(sig[b * self.rows:(b + 1) * self.rows])
+
+    def fingerprint(self, text):
+        """Return the signature of a text, or None if it has no words."""
+        return signature(shingles(text, self.shingle_size), self.num_perm)
+
+    def add(self, name, text):
+        """
+        Add a reference document.
+
+        Returns:
+            True if the document had content to fingerprint.
+        """
+        sig = self.fingerprint(text)
+        if sig is None:
+            return False
+        self.add_signature(name, sig)
+        return True
+
+    def add_signature(self, name, sig):
+        """Add a reference document by its signature."""
+        self.signatures[name] = sig
+        for b, key in self._band_keys(sig):
+            self._buckets[b].setdefault(key, set()).add(name)
+
+    def query(self, text):
+        """
+        Find the reference documents similar to a text.
+
+        Returns:
+            List of (reference name, estimated similarity) ordered by similarity.
+        """
+        if not self.signatures:
+            return []
+        sig = self.fingerprint(text)
+        if sig is None:
+            return []
+
+        candidates = set()
+        for b, key in self._band_keys(sig):
+            candidates.update(self._buckets[b].get(key, ()))
+
+        found = []
+        for name in candidates:
+            score = estimate_similarity(sig, self.signatures[name])
+            if score >= self.threshold:
+                found.append((name, score))
+        return sorted(found, key=lambda x: x[1], reverse=True)
+
+    def save(self, path, sources=None):
+        """
+        Save the reference signatures.
+
+        Args:
+            path (str): File to save to.
+            sources (dict): <Optional> Stamp of each reference document's file, see reference_files.
+        """
+        with open(path, 'w') as f:
+            json.dump({"num_perm": self.num_perm,
+                       "shingle_size": self.shingle_size,
+                       "signatures": self.signatures,
+                       "sources": sources or {}}, f)
+
+    def load(self, path, sources):
+        """
+        Add the reference signatures saved by an index with the same settings, for the
+        reference documents whose file is unchanged since it was saved.
+
+        Args:
+            path (str): File saved with save.
+            sources (dict): Current stamp of each reference document's file.
+
+        Returns:
+            Set of the unchanged reference documents, including any without text.
+        """
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("num_perm") != self.num_perm or data.get("shingle_size") != self.shingle_size:
+            return set()
+        saved = data.get("sources", {})
+        signatures = data.get("signatures", {})
+        loaded = set()
+        for name, stamp in sources.items():
+            if saved.get(name) == stamp:
+                loaded.add(name)
+                if name in signatures:
+                    self.add_signature(name, signatures[name])
+        return loaded
+
+
+def reference_files(reference_dir):
+    """
+    List the reference documents in a directory.
+
+    Returns:
+        Dictionary of reference name to (file path, [size, modification time]).
+    """
+    res = {}
+    for dir_path, dir_names, file_names in os.walk(reference_dir):
+        for name in sorted(file_names):
+            path = os.path.join(dir_path, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            res[os.path.relpath(path, reference_dir)] = (path, [st.st_size, st.st_mtime_ns])
+    return res
+
+
+def build_index(reference_dir, extract, threshold=0.5, shingle_size=5, index_path=None):
+    """
+    Fingerprint every reference document in a directory.
+
+    Args:
+        reference_dir (str): Directory of sensitive reference documents.
+        extract (func): Returns the extracted text of a file path.
+        threshold (float): <Optional> Lowest estimated similarity reported.
+        shingle_size (int): <Optional> Number of words per shingle.
+        index_path (str): <Optional> File the signatures are saved to and reused from.
+                          Only documents added or changed since it was saved are
+                          fingerprinted again.
+
+    Returns:
+        MinHashIndex
+    """
+    index = MinHashIndex(threshold=threshold, shingle_size=shingle_size)
+    files = reference_files(reference_dir)
+    sources = {k: v[1] for k, v in files.items()}
+    loaded = set()
+    if index_path and os.path.exists(index_path):
+        try:
+            loaded = index.load(index_path, sources)
+            logger.info("Loaded {} reference signatures from {}".format(len(loaded), index_path))
+        except Exception as ex:
+            logger.error("Unable to load reference signatures {}. {}".format(index_path, ex))
+
+    done = set(loaded)
+    for ref, (path, stamp) in sorted(files.items()):
+        if ref in loaded:
+            continue
+        try:
+            if not index.add(ref, extract(path)):
+                logger.warning("Reference document {} has no text".format(ref))
+            done.add(ref)
+        except Exception as ex:
+            logger.error("Unable to fingerprint reference document {}. {}".format(ref, ex))
+
+    logger.info("Fingerprinted {} reference documents".format(len(done) - len(loaded)))
+    if index_path:
+        # Documents that failed to extract are left unstamped so the next run retries them
+        index.save(index_path, {k: v for k, v in sources.items() if k in done})
+    return index
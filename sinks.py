@@ -0,0 +1,285 @@
+"""
+Cazador result output module.
+
+Find and scan results are written through buffered sinks instead of one print
+or log call per result. Records are serialized into a batch that is written
+once it is full, or by a background timer so slow scans still stream output.
+
+Supported formats are plain text (the console format), JSON lines and CSV,
+written to a file or stdout and optionally compressed.
+
+Created: 10/19/2026
+"""
+
+import io
+import csv
+import sys
+import bz2
+import gzip
+import json
+import lzma
+import threading
+import logging
+from cazobjects import CazFile, CazRegMatch, CazSimilarMatch, CazSkippedFile
+from summary import MatchSummary
+logger = logging.getLogger(__name__)
+
+FORMATS = ("text", "jsonl", "csv")
+
+COMPRESSION = {"gz": gzip.open, "bz2": bz2.open, "xz": lzma.open}
+
+# Columns written by the CSV sink. File and match records share a single layout.
+CSV_FIELDS = ("service", "type", "query", "file_id", "name", "parent", "path", "md5", "sha1",
+              "content_hash", "size", "mime_type", "modified", "expression_name", "file_path", "line_number", "start", "end",
+              "hash", "reference", "score", "reason")
+
+
+def to_record(service_type, item, query=None):
+    """
+    Convert a result object into a flat record dictionary.
+
+    Args:
+        service_type (str): Service the result came from.
+        item (CazFile|CazRegMatch|CazSimilarMatch|CazSkippedFile|MatchSummary): Result object.
+        query (str): <Optional> Search the file was found by (name, md5, sha1 or ioc).
+
+    Returns:
+        Record dictionary.
+    """
+    if isinstance(item, CazRegMatch):
+        rec = item.to_dict()
+        rec["start"], rec["end"] = rec.pop("location")
+        rec["type"] = "match"
+    elif isinstance(item, CazSimilarMatch):
+        rec = item.to_dict()
+        rec["type"] = "similar"
+    elif isinstance(item, CazSkippedFile):
+        rec = item.to_dict()
+        rec["type"] = "skipped"
+    elif isinstance(item, MatchSummary):
+        rec = {"type": "summary", "summary": item.results()}
+    elif isinstance(item, CazFile):
+        rec = item.to_dict()
+        rec["type"] = "file"
+        rec["query"] = query
+    else:
+        rec = {"type": "message", "message": str(item)}
+    rec["service"] = service_type
+    return rec
+
+
+class ResultSink:
+    """Buffered result writer.
+
+    Subclasses implement format_record to serialize a single result.
+    """
+
+    def __init__(self, stream, batch_size=1000, flush_interval=1.0, close_stream=False):
+        """
+        Initialize the sink.
+
+        Args:
+            stream (file): Text stream to write to.
+            batch_size (int): <Optional> Records buffered before they're written.
+            flush_interval (float): <Optional> Seconds before buffered records are written anyway.
+            close_stream (bool): <Optional> Close the stream when the sink is closed.
+        """
+        self.stream = stream
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.close_stream = close_stream
+        self.count = 0
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        if flush_interval:
+            self._thread = threading.Thread(target=self._run_timer, name="sink-flush", daemon=True)
+            self._thread.start()
+
+    def _run_timer(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def header(self):
+        """Return text written before the first record."""
+        return ""
+
+    def format_record(self, service_type, item, query=None):
+        """Serialize a single result into a line of output."""
+        raise NotImplementedError
+
+    def write(self, service_type, items, query=None):
+        """
+        Buffer a batch of results, writing them out once the batch size is reached.
+
+        Args:
+            service_type (str): Service the results came from.
+            items (object[]): CazFile, CazRegMatch or CazSimilarMatch results.
+            query (str): <Optional> Search the files were found by.
+        """
+        lines = [self.format_record(service_type, x, query) for x in items]
+        with self._lock:
+            if not self.count and lines:
+                self._buffer.append(self.header())
+            self._buffer.extend(lines)
+            self.count += len(lines)
+            if len(self._buffer) >= self.batch_size:
+                self._write_buffer()
+
+    def _write_buffer(self):
+        if self._buffer:
+            self.stream.write("".join(self._buffer))
+            self._buffer = []
+            self.stream.flush()
+
+    def flush(self):
+        """Write every buffered record."""
+        with self._lock:
+            self._write_buffer()
+
+    def close(self):
+        """Stop the flush timer and write any buffered records."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.flush()
+        if self.close_stream:
+            self.stream.close()
+
+
+class TextSink(ResultSink):
+    """Human readable output in the console format."""
+
+    def format_record(self, service_type, item, query=None):
+        return "[{}] {}\n".format(service_type, item)
+
+
+class JSONLinesSink(ResultSink):
+    """One JSON object per line."""
+
+    def format_record(self, service_type, item, query=None):
+        return json.dumps(to_record(service_type, item, query), default=str) + "\n"
+
+
+class CSVSink(ResultSink):
+    """Comma separated values with a header row."""
+
+    def __init__(self, *args, **kwargs):
+        self._row = io.StringIO()
+        self._writer = csv.DictWriter(self._row, CSV_FIELDS, extrasaction='ignore',
+                                      lineterminator="\n")
+        super(CSVSink, self).__init__(*args, **kwargs)
+
+    def header(self):
+        return ",".join(CSV_FIELDS) + "\n"
+
+    def format_record(self, service_type, item, query=None):
+        # Only the thread writing the results formats records, so the row buffer is reused
+        self._row.seek(0)
+        self._row.truncate()
+        self._writer.writerow(to_record(service_type, item, query))
+        return self._row.getvalue()
+
+
+SINKS = {"text": TextSink, "jsonl": JSONLinesSink, "csv": CSVSink}
+
+
+def _compression_for(path, compression=None):
+    """Return the requested compression or the one matching the file extension."""
+    if not compression and path and path != "-":
+        ext = path.rsplit('.', 1)[-1]
+        compression = ext if ext in COMPRESSION else None
+    if compression and compression not in COMPRESSION:
+        raise ValueError("Unknown compression {}. Expected one of {}".format(
+            compression, ", ".join(sorted(COMPRESSION))))
+    return compression
+
+
+def open_output(path=None, compression=None):
+    """
+    Open a text stream to write results to.
+
+    Args:
+        path (str): <Optional> File path to write to. Default: stdout
+        compression (str): <Optional> Compress the output (gz, bz2 or xz). Defaults to the
+                           compression matching the file extension.
+
+    Returns:
+        Tuple of (stream, flag set if the stream should be closed once written)
+    """
+    compression = _compression_for(path, compression)
+    to_stdout = not path or path == "-"
+    if compression:
+        target = sys.stdout.buffer if to_stdout else path
+        return COMPRESSION[compression](target, 'wt', encoding='utf-8', newline=''), True
+    elif to_stdout:
+        return sys.stdout, False
+    return open(path, 'w', encoding='utf-8', newline=''), True
+
+
+def merge_results(paths, output=None, compression=None):
+    """
+    Combine the result files written by several shards of a scan into one.
+
+    Files are streamed line by line in the order given, so any size can be merged.
+    Compressed inputs are read based on their file extension and only the first
+    CSV header row is kept.
+
+    Args:
+        paths (str[]): Result files to merge. They should share a single format.
+        output (str): <Optional> File path to write the merged results to. Default: stdout
+        compression (str): <Optional> Compress the merged results (gz, bz2 or xz).
+
+    Returns:
+        Number of result lines written.
+    """
+    header = ",".join(CSV_FIELDS) + "\n"
+    count = 0
+    wrote_header = False
+    stream, close_stream = open_output(output, compression)
+    try:
+        for path in paths:
+            comp = _compression_for(path)
+            opener = COMPRESSION[comp] if comp else open
+            with opener(path, 'rt', encoding='utf-8', newline='') as f:
+                for line in f:
+                    if line == header:
+                        if wrote_header:
+                            continue
+                        wrote_header = True
+                    else:
+                        count += 1
+                    stream.write(line)
+    finally:
+        if close_stream:
+            stream.close()
+        else:
+            stream.flush()
+    return count
+
+
+def open_sink(fmt="text", path=None, compression=None, batch_size=1000, flush_interval=1.0):
+    """
+    Create a result sink.
+
+    Args:
+        fmt (str): <Optional> Output format (text, jsonl or csv).
+        path (str): <Optional> File path to write to. Default: stdout
+        compression (str): <Optional> Compress the output (gz, bz2 or xz). Defaults to the
+                           compression matching the file extension.
+        batch_size (int): <Optional> Records buffered before they're written.
+        flush_interval (float): <Optional> Seconds before buffered records are written anyway.
+
+    Returns:
+        ResultSink
+    """
+    if fmt not in SINKS:
+        raise ValueError("Unknown output format {}. Expected one of {}".format(fmt,
+                                                                              ", ".join(FORMATS)))
+
+    stream, close_stream = open_output(path, compression)
+    return SINKS[fmt](stream,
+                      batch_size=batch_size,
+                      flush_interval=flush_interval,
+                      close_stream=close_stream)
@@ -0,0 +1,134 @@
+"""
+Cazador content sniffing module.
+
+Whether a file is worth downloading and extracting is decided from its first
+few kilobytes instead of its extension, which is often missing or misleading.
+The leading bytes are matched against the magic numbers of known formats, and
+content no format claims is checked for how likely it is to be text. Media,
+executables, disk images, encrypted containers and other binaries the
+extractor can't read are skipped before the full transfer.
+
+Created: 10/19/2026
+"""
+
+import codecs
+import archives
+
+# Bytes read from the start of each file
+DEFAULT_SNIFF_SIZE = 8 * 1024
+
+# Fraction of printable characters above which unknown content is treated as text
+TEXT_THRESHOLD = 0.95
+
+# (offset, magic bytes, label) of formats the extractor can read
+SCAN_SIGNATURES = (
+    (0, b"%PDF-", "application/pdf"),
+    (0, b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "application/x-ole-storage"),
+    (0, b"{\\rtf", "application/rtf"),
+    (0, b"SQLite format 3\x00", "application/x-sqlite3"),
+    (0, b"\xef\xbb\xbf", "text/plain; charset=utf-8"),
+    (0, b"\xff\xfe", "text/plain; charset=utf-16le"),
+    (0, b"\xfe\xff", "text/plain; charset=utf-16be"),
+)
+
+# (offset, magic bytes, label) of formats that hold no extractable text
+SKIP_SIGNATURES = (
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (0, b"II*\x00", "image/tiff"),
+    (0, b"MM\x00*", "image/tiff"),
+    (8, b"WEBP", "image/webp"),
+    (8, b"AVI ", "video/x-msvideo"),
+    (8, b"WAVE", "audio/wav"),
+    (4, b"ftyp", "video/mp4"),
+    (0, b"\x1aE\xdf\xa3", "video/x-matroska"),
+    (0, b"FLV\x01", "video/x-flv"),
+    (0, b"0&\xb2u\x8ef\xcf\x11", "video/x-ms-asf"),
+    (0, b"\x00\x00\x01\xba", "video/mpeg"),
+    (0, b"ID3", "audio/mpeg"),
+    (0, b"OggS", "audio/ogg"),
+    (0, b"fLaC", "audio/flac"),
+    (0, b"\x7fELF", "application/x-executable"),
+    (0, b"\xca\xfe\xba\xbe", "application/x-mach-binary"),
+    (0, b"\xcf\xfa\xed\xfe", "application/x-mach-binary"),
+    (0, b"\xce\xfa\xed\xfe", "application/x-mach-binary"),
+    (0, b"7z\xbc\xaf\x27\x1c", "application/x-7z-compressed"),
+    (0, b"Rar!\x1a\x07", "application/vnd.rar"),
+    (0, b"\x28\xb5\x2f\xfd", "application/zstd"),
+    (0, b"\x04\x22\x4d\x18", "application/x-lz4"),
+    (0, b"Salted__", "application/x-openssl-encrypted"),
+    (0, b"LUKS\xba\xbe", "application/x-luks"),
+    (0, b"KDMV", "application/x-vmdk"),
+    (0, b"QFI\xfb", "application/x-qemu-disk"),
+    (0, b"vhdxfile", "application/x-vhdx"),
+    (0, b"conectix", "application/x-vhd"),
+)
+
+_CONTROL = set(range(0, 32)) - {9, 10, 12, 13, 27} | {127}
+
+
+def _match(head, signatures):
+    for offset, magic, label in signatures:
+        if head[offset:offset + len(magic)] == magic:
+            return label
+    return None
+
+
+def text_likelihood(head):
+    """
+    Estimate how likely the leading bytes of a file are to be text.
+
+    Args:
+        head (bytes): Leading bytes of the file.
+
+    Returns:
+        Fraction of the characters that are printable text, from 0 to 1.
+    """
+    if not head:
+        return 1.0
+    if b"\x00" in head:
+        return 0.0
+
+    # Ignore a multibyte character cut off by the end of the read
+    text = codecs.getincrementaldecoder("utf-8")("replace").decode(head)
+    if "\ufffd" not in text:
+        printable = sum(1 for c in text if ord(c) >= 32 and ord(c) != 127 or c in "\t\n\f\r\x1b")
+        return printable / len(text) if text else 1.0
+
+    # Not UTF-8, count the control bytes as a single byte encoding
+    return 1.0 - sum(1 for b in head if b in _CONTROL) / len(head)
+
+
+def classify(head):
+    """
+    Decide whether a file is worth scanning from its leading bytes.
+
+    Args:
+        head (bytes): Leading bytes of the file, DEFAULT_SNIFF_SIZE or fewer for small files.
+
+    Returns:
+        Tuple of (scan, label). scan is False for content that holds no extractable text.
+    """
+    label = _match(head, SCAN_SIGNATURES)
+    if label:
+        return True, label
+
+    archive = archives.detect_archive(head)
+    if archive:
+        return True, "archive/{}".format(archive)
+
+    label = _match(head, SKIP_SIGNATURES)
+    if label:
+        return False, label
+
+    if head.startswith(b"MZ") and len(head) > 64:
+        # Windows executables point to their PE header from offset 60
+        pe = int.from_bytes(head[60:64], "little")
+        if head[pe:pe + 4] == b"PE\x00\x00":
+            return False, "application/vnd.microsoft.portable-executable"
+
+    if text_likelihood(head) >= TEXT_THRESHOLD:
+        return True, "text/plain"
+    return False, "application/octet-stream"
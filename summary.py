@@ -0,0 +1,326 @@
+"""
+Cazador match summary module.
+
+Sweeps of large services can find millions of matches, which are kept in memory
+until the scan ends and written one line each. In summary mode the matches of
+every scanned file are folded into fixed size aggregates instead and only a
+compact risk overview is reported:
+
+* Hits and distinct values per rule. Rules are few, so hits are counted exactly
+  and the distinct values are estimated with a HyperLogLog sketch over the
+  match hashes.
+* Hits per folder, estimated with the Space-Saving algorithm, which keeps a
+  fixed number of counters and only ever overestimates a folder by the count it
+  inherited when it replaced the smallest one.
+* The files with the most matches, kept in a min-heap of a fixed size.
+
+Created: 10/19/2026
+"""
+
+import json
+import math
+import heapq
+import base64
+import threading
+from archives import MEMBER_SEPARATOR
+from cazobjects import CazRegMatch, CazSimilarMatch, CazSkippedFile
+import logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRECISION = 12
+DEFAULT_TOP_FILES = 25
+DEFAULT_FOLDER_COUNTERS = 1000
+
+# Folders listed in the report
+REPORT_FOLDERS = 20
+
+
+class HyperLogLog:
+    """Approximate count of distinct hex digests in 2^precision bytes."""
+
+    def __init__(self, precision=DEFAULT_PRECISION, registers=None):
+        """
+        Initialize an empty sketch.
+
+        Args:
+            precision (int): <Optional> Index bits, from 4 to 16. The standard error is
+                             1.04 / sqrt(2^precision), 1.6% at the default of 12.
+            registers (bytes): <Optional> Registers saved with to_dict.
+        """
+        if not 4 <= precision <= 16:
+            raise ValueError("HyperLogLog precision must be between 4 and 16")
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers else bytearray(self.size)
+
+    def add(self, digest):
+        """
+        Add a value by its hex digest.
+
+        The match hashes are already SHA1 digests, so their leading 64 bits are used
+        directly instead of hashing them again.
+        """
+        x = int(digest[:16], 16)
+        index = x >> (64 - self.precision)
+        rest = x & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """Add every value counted by another sketch of the same precision."""
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def count(self):
+        """Return the estimated number of distinct values added."""
+        m = self.size
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate while most registers are empty
+            estimate = m * math.log(m / float(zeros))
+        return int(round(estimate))
+
+    def to_dict(self):
+        """Return the sketch as a JSON serializable dictionary."""
+        return {"precision": self.precision,
+                "registers": base64.b64encode(bytes(self.registers)).decode('ascii')}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a sketch saved with to_dict."""
+        return cls(data["precision"], base64.b64decode(data["registers"]))
+
+
+class SpaceSaving:
+    """Approximate counts of the most frequent keys using a fixed number of counters."""
+
+    def __init__(self, capacity=DEFAULT_FOLDER_COUNTERS):
+        """
+        Initialize the counters.
+
+        Args:
+            capacity (int): <Optional> Keys counted at once.
+        """
+        self.capacity = max(1, capacity)
+        # key: [count, overestimation]
+        self.counters = {}
+        # Lazily updated min-heap of (count, key). Entries older than the counter are skipped.
+        self._heap = []
+
+    def add(self, key, weight=1):
+        """Count a key, replacing the smallest counter when every counter is in use."""
+        entry = self.counters.get(key)
+        if entry is None:
+            if len(self.counters) < self.capacity:
+                entry = self.counters[key] = [0, 0]
+            else:
+                smallest = self._pop_smallest()
+                floor = self.counters.pop(smallest)[0]
+                # The new key may have been counted by the replaced counter
+                entry = self.counters[key] = [floor, floor]
+        entry[0] += weight
+        heapq.heappush(self._heap, (entry[0], key))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(v[0], k) for k, v in self.counters.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_smallest(self):
+        while True:
+            count, key = heapq.heappop(self._heap)
+            entry = self.counters.get(key)
+            if entry is not None and entry[0] == count:
+                return key
+
+    def top(self, n):
+        """Return the n largest (key, count, overestimation) entries."""
+        return [(k, v[0], v[1]) for k, v in
+                heapq.nlargest(n, self.counters.items(), key=lambda x: (x[1][0], x[0]))]
+
+    def to_dict(self):
+        """Return the counters as a JSON serializable dictionary."""
+        return {"capacity": self.capacity, "counters": self.counters}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild the counters saved with to_dict."""
+        res = cls(data["capacity"])
+        res.counters = {k: list(v) for k, v in data["counters"].items()}
+        res._heap = [(v[0], k) for k, v in res.counters.items()]
+        heapq.heapify(res._heap)
+        return res
+
+
+def _folder(path):
+    """Return the folder of a reported path, treating archive members as the archive itself."""
+    path = (path or "").split(MEMBER_SEPARATOR, 1)[0].replace('\\', '/')
+    return path.rpartition('/')[0] or "/"
+
+
+class MatchSummary:
+    """Fixed size aggregates of the matches found by a scan."""
+
+    def __init__(self, top_files=DEFAULT_TOP_FILES, folder_counters=DEFAULT_FOLDER_COUNTERS,
+                 precision=DEFAULT_PRECISION):
+        """
+        Initialize an empty summary.
+
+        Args:
+            top_files (int): <Optional> Files with the most matches kept.
+            folder_counters (int): <Optional> Folders counted at once. See SpaceSaving.
+            precision (int): <Optional> HyperLogLog precision of the distinct value counts.
+        """
+        self.top_files = max(1, top_files)
+        self.precision = precision
+        self.files = 0
+        self.files_with_matches = 0
+        self.matches = 0
+        self.skipped = 0
+        self.distinct = HyperLogLog(precision)
+        # rule name: [hits, files, HyperLogLog]
+        self.rules = {}
+        # reference document: similar files
+        self.references = {}
+        self.folders = SpaceSaving(folder_counters)
+        # Min-heap of (matches, path)
+        self._files = []
+        self._lock = threading.Lock()
+
+    def add(self, matches):
+        """
+        Fold the results of a single scanned file into the summary.
+
+        Args:
+            matches (object[]): CazRegMatch, CazSimilarMatch and CazSkippedFile results of the file.
+        """
+        per_file = {}
+        per_folder = {}
+        per_rule = {}
+        with self._lock:
+            self.files += 1
+            for x in matches:
+                if isinstance(x, CazSkippedFile):
+                    self.skipped += 1
+                    continue
+                if isinstance(x, CazSimilarMatch):
+                    self.references[x.reference] = self.references.get(x.reference, 0) + 1
+                elif isinstance(x, CazRegMatch):
+                    rule = self.rules.get(x.expression_name)
+                    if rule is None:
+                        rule = self.rules[x.expression_name] = [0, 0, HyperLogLog(self.precision)]
+                    rule[0] += 1
+                    rule[2].add(x.hash)
+                    self.distinct.add(x.hash)
+                    per_rule[x.expression_name] = True
+                else:
+                    continue
+                self.matches += 1
+                path = x.file_path.split(MEMBER_SEPARATOR, 1)[0]
+                per_file[path] = per_file.get(path, 0) + 1
+                folder = _folder(path)
+                per_folder[folder] = per_folder.get(folder, 0) + 1
+
+            for name in per_rule:
+                self.rules[name][1] += 1
+            for folder, count in per_folder.items():
+                self.folders.add(folder, count)
+            if per_file:
+                self.files_with_matches += 1
+            for path, count in per_file.items():
+                if len(self._files) < self.top_files:
+                    heapq.heappush(self._files, (count, path))
+                elif count > self._files[0][0]:
+                    heapq.heapreplace(self._files, (count, path))
+
+    def results(self):
+        """Return the summary report as a JSON serializable dictionary."""
+        with self._lock:
+            return {"files": self.files,
+                    "files_with_matches": self.files_with_matches,
+                    "matches": self.matches,
+                    "skipped": self.skipped,
+                    "distinct_values": self.distinct.count(),
+                    "rules": {k: {"hits": v[0], "files": v[1], "distinct_values": v[2].count()}
+                              for k, v in self.rules.items()},
+                    "similar": dict(self.references),
+                    "top_files": [{"path": p, "matches": c} for c, p in sorted(self._files, reverse=True)],
+                    "top_folders": [{"folder": k, "matches": c, "overestimate": e}
+                                    for k, c, e in self.folders.top(REPORT_FOLDERS)]}
+
+    def report(self):
+        """
+        Format the summary for the console.
+
+        Returns:
+            List of report lines.
+        """
+        res = self.results()
+        lines = ["Summary: {} matches (about {} distinct values) in {} of {} files scanned".format(
+            res["matches"], res["distinct_values"], res["files_with_matches"], res["files"])]
+        if res["skipped"]:
+            lines.append("  {} rules or files skipped".format(res["skipped"]))
+        if res["rules"]:
+            lines.append("  By rule:")
+            for name, rule in sorted(res["rules"].items(), key=lambda x: (-x[1]["hits"], x[0])):
+                lines.append("    {:<24} {:>10} hits {:>8} files {:>10} distinct".format(
+                    name, rule["hits"], rule["files"], rule["distinct_values"]))
+        if res["similar"]:
+            lines.append("  Similar to reference documents:")
+            for name, count in sorted(res["similar"].items(), key=lambda x: (-x[1], x[0])):
+                lines.append("    {:<24} {:>10} files".format(name, count))
+        if res["top_folders"]:
+            lines.append("  Top folders:")
+            for x in res["top_folders"]:
+                # Counts that may include hits of replaced folders are marked as estimates
+                lines.append("    {:>10}{} {}".format(x["matches"], "~" if x["overestimate"] else " ",
+                                                      x["folder"]))
+        if res["top_files"]:
+            lines.append("  Top files:")
+            for x in res["top_files"]:
+                lines.append("    {:>10}  {}".format(x["matches"], x["path"]))
+        return lines
+
+    def to_dict(self):
+        """Return the summary state as a JSON serializable dictionary, such as for a checkpoint."""
+        with self._lock:
+            return {"top_files": self.top_files,
+                    "precision": self.precision,
+                    "files": self.files,
+                    "files_with_matches": self.files_with_matches,
+                    "matches": self.matches,
+                    "skipped": self.skipped,
+                    "distinct": self.distinct.to_dict(),
+                    "rules": {k: [v[0], v[1], v[2].to_dict()] for k, v in self.rules.items()},
+                    "references": dict(self.references),
+                    "folders": self.folders.to_dict(),
+                    "file_heap": [list(x) for x in self._files]}
+
+    def restore(self, data):
+        """Replace the summary state with one saved with to_dict."""
+        with self._lock:
+            self.top_files = data["top_files"]
+            self.precision = data["precision"]
+            self.files = data["files"]
+            self.files_with_matches = data["files_with_matches"]
+            self.matches = data["matches"]
+            self.skipped = data["skipped"]
+            self.distinct = HyperLogLog.from_dict(data["distinct"])
+            self.rules = {k: [v[0], v[1], HyperLogLog.from_dict(v[2])]
+                          for k, v in data["rules"].items()}
+            self.references = dict(data["references"])
+            self.folders = SpaceSaving.from_dict(data["folders"])
+            self._files = [tuple(x) for x in data["file_heap"]]
+            heapq.heapify(self._files)
+
+
+def write_report(path, summaries):
+    """
+    Write the summary report of every service as JSON.
+
+    Args:
+        path (str): File to write the report to.
+        summaries (dict): MatchSummary of each service type.
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({k: v.results() for k, v in summaries.items()}, f, indent=2, sort_keys=True)
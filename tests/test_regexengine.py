@@ -0,0 +1,63 @@
+"""
+Tests of the rule engine selection and backtracking lint.
+
+Created: 10/19/2026
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from regexengine import compile_expression, lint_expression, RE2, REGEX, RE
+
+NESTED = "nested quantifiers such as (a+)+"
+ALTERNATION = "quantified alternation with overlapping branches such as (a|ab)*"
+ADJACENT = "adjacent quantifiers over overlapping characters such as .*.*"
+
+
+class LintTests(unittest.TestCase):
+
+    def test_nested_quantifiers(self):
+        self.assertIn(NESTED, lint_expression(r"(a+)+b"))
+        self.assertIn(NESTED, lint_expression(r"(\w+\s?)*$"))
+        self.assertNotIn(NESTED, lint_expression(r"(ab+c)+"))
+
+    def test_overlapping_alternation(self):
+        # sre_parse factors the shared prefix out of these alternations
+        for expression in (r"(a|ab)*c", r"(foo|fo)*x", r"(a|a)*b", r"(?:x|y|xz)+"):
+            self.assertIn(ALTERNATION, lint_expression(expression), expression)
+        self.assertIn(ALTERNATION, lint_expression(r"(xa|xb|y)*z"))
+        for expression in (r"(ab|cd)*", r"(xab|xcd)*", r"(a|b)*c"):
+            self.assertNotIn(ALTERNATION, lint_expression(expression), expression)
+
+    def test_adjacent_quantifiers(self):
+        self.assertIn(ADJACENT, lint_expression(r".*.*="))
+        self.assertIn(ADJACENT, lint_expression(r"\d+\w+"))
+        self.assertNotIn(ADJACENT, lint_expression(r"\d+[a-z]+"))
+
+    def test_plain_rules(self):
+        self.assertEqual(lint_expression(r"password=\w+"), [])
+        self.assertEqual(lint_expression(r"\b\d{3}-\d{2}-\d{4}\b"), [])
+
+
+class EngineTests(unittest.TestCase):
+
+    def test_default_matches_unicode_like_re(self):
+        engine, pattern = compile_expression(r"\w+")
+        self.assertIn(engine, (REGEX, RE))
+        self.assertEqual(pattern.findall("café naïve"), ["café", "naïve"])
+        self.assertEqual(compile_expression(r"\d+")[1].findall("١٢٣"), ["١٢٣"])
+
+    def test_re_is_forced(self):
+        self.assertEqual(compile_expression(r"\w+", RE)[0], RE)
+
+    def test_re2_falls_back_for_backreferences(self):
+        engine, pattern = compile_expression(r"(a)\1", RE2)
+        self.assertIn(engine, (REGEX, RE))
+        self.assertTrue(pattern.search("xaa"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+"""
+Cazador extracted text cache module.
+
+Text extracted from each file is stored on disk, compressed, and keyed by the
+file's content hash as reported by the service (ETag, sha1, md5Checksum or
+content_hash). Rescanning unchanged files, for example after a new [regex] rule
+is added, then only runs the matcher instead of downloading and extracting the
+file again.
+
+The cache is bounded by a size cap with least recently used eviction.
+
+Created: 10/19/2026
+"""
+
+import os
+import zlib
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+logger = logging.getLogger(__name__)
+
+
+def content_key(info):
+    """
+    Return the cache key for a file's content.
+
+    Args:
+        info (CazFile): Description of the file.
+
+    Returns:
+        Key string, or None if the service doesn't report a content hash for the file.
+    """
+    if info.sha1:
+        return "sha1:{}".format(info.sha1.lower())
+    if info.md5:
+        return "md5:{}".format(info.md5.lower())
+    if info.content_hash:
+        return "content:{}".format(info.content_hash.lower())
+    return None
+
+
+class TextCache:
+    """Size capped, least recently used on-disk cache of extracted text."""
+
+    def __init__(self, path, max_bytes=1024 * 1024 * 1024, level=6):
+        """
+        Initialize the cache, indexing any entries left by earlier runs.
+
+        Args:
+            path (str): Directory holding the cache entries.
+            max_bytes (int): <Optional> Maximum size of the compressed entries on disk.
+            level (int): <Optional> zlib compression level.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.level = level
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """Index the existing entries, least recently used first."""
+        found = []
+        for dir_path, dir_names, file_names in os.walk(self.path):
+            for name in file_names:
+                if not name.endswith(".z"):
+                    continue
+                try:
+                    st = os.stat(os.path.join(dir_path, name))
+                except OSError:
+                    continue
+                found.append((st.st_mtime, name[:-2], st.st_size))
+
+        for mtime, name, size in sorted(found):
+            self._entries[name] = size
+            self.size += size
+        self._evict()
+
+    def _entry_path(self, name):
+        return os.path.join(self.path, name[:2], name + ".z")
+
+    @staticmethod
+    def _name(key):
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        Look up the extracted text of a file.
+
+        Args:
+            key (str): Content key of the file.
+
+        Returns:
+            Extracted text, or None if not cached.
+        """
+        name = self._name(key)
+        with self._lock:
+            if name not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(name)
+
+        entry_path = self._entry_path(name)
+        try:
+            with open(entry_path, 'rb') as f:
+                text = zlib.decompress(f.read()).decode('utf-8')
+            # Keep the recency on disk so the order survives restarts
+            os.utime(entry_path, None)
+        except (OSError, zlib.error, UnicodeDecodeError) as ex:
+            logger.error("Unable to read cached text {}. {}".format(entry_path, ex))
+            with self._lock:
+                self.size -= self._entries.pop(name, 0)
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return text
+
+    def contains(self, key):
+        """Check whether the text of a file is cached without reading it or updating its recency."""
+        with self._lock:
+            return self._name(key) in self._entries
+
+    def put(self, key, text):
+        """
+        Store the extracted text of a file, evicting the least recently used entries.
+
+        Args:
+            key (str): Content key of the file.
+            text (str): Extracted text.
+        """
+        name = self._name(key)
+        data = zlib.compress((text or "").encode('utf-8'), self.level)
+        if len(data) > self.max_bytes:
+            return
+
+        entry_path = self._entry_path(name)
+        temp_path = "{}.{}.tmp".format(entry_path, threading.get_ident())
+        try:
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, entry_path)
+        except OSError as ex:
+            logger.error("Unable to cache text {}. {}".format(entry_path, ex))
+            return
+
+        with self._lock:
+            self.size -= self._entries.pop(name, 0)
+            self._entries[name] = len(data)
+            self.size += len(data)
+            self._evict()
+
+    def _evict(self):
+        """Remove the least recently used entries until the cache is within its cap."""
+        while self.size > self.max_bytes and self._entries:
+            name, size = self._entries.popitem(last=False)
+            self.size -= size
+            try:
+                os.remove(self._entry_path(name))
+            except OSError:
+                pass
+
+    def stats(self):
+        """Return a dictionary of the cache totals."""
+        with self._lock:
+            return {"entries": len(self._entries),
+                    "bytes": self.size,
+                    "hits": self.hits,
+                    "misses": self.misses}
@@ -0,0 +1,366 @@
+"""
+Cazador evidence download module.
+
+Copies of files found by get_file are downloaded with parallel ranged requests
+written straight into a preallocated partial file. Every completed range is
+recorded in a small state file next to it, so an interrupted download resumes
+with the ranges still missing instead of starting over. The content hash the
+service reports is computed over the file in order while the ranges arrive and
+the copy is only moved into place once it matches.
+
+Services without ranged downloads are streamed sequentially into the same
+partial file format.
+
+Created: 10/19/2026
+"""
+
+import os
+import json
+import hashlib
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+DEFAULT_WORKERS = 8
+
+# Suffixes of the file being downloaded and of its progress record
+PARTIAL_SUFFIX = ".part"
+STATE_SUFFIX = ".part.json"
+
+# Bytes streamed between progress records of sequential downloads
+STREAM_STATE_INTERVAL = 64 * 1024 * 1024
+
+# Attempts made for each range before the download is abandoned
+RANGE_ATTEMPTS = 3
+
+_READ_SIZE = 1024 * 1024
+
+
+class VerificationError(Exception):
+    """Raised when a downloaded copy doesn't match the hash reported by the service."""
+    pass
+
+
+class ContentHasher:
+    """Incrementally compute a service content hash from the file contents in order.
+
+    Whole file digests (md5, sha1) hash the bytes directly. Block digests such as
+    the S3 multipart ETag and the Dropbox content_hash hash each fixed size block,
+    then hash the concatenated block digests.
+    """
+
+    def __init__(self, algorithm="md5", block_size=None, combine=None, count_suffix=False):
+        """
+        Initialize the hasher.
+
+        Args:
+            algorithm (str): <Optional> hashlib algorithm of the file or of each block.
+            block_size (int): <Optional> Size of each block for block digests.
+            combine (str): <Optional> hashlib algorithm applied to the block digests.
+            count_suffix (bool): <Optional> Append -<block count> to the digest (S3 ETag).
+        """
+        self.algorithm = algorithm
+        self.block_size = block_size
+        self.combine = combine or algorithm
+        self.count_suffix = count_suffix
+        self.length = 0
+        self._hash = hashlib.new(algorithm)
+        self._block_used = 0
+        self._blocks = []
+
+    def update(self, data):
+        """Add the next bytes of the file."""
+        self.length += len(data)
+        if not self.block_size:
+            self._hash.update(data)
+            return
+
+        view = memoryview(data)
+        while view:
+            take = min(len(view), self.block_size - self._block_used)
+            self._hash.update(view[:take])
+            self._block_used += take
+            view = view[take:]
+            if self._block_used == self.block_size:
+                self._blocks.append(self._hash.digest())
+                self._hash = hashlib.new(self.algorithm)
+                self._block_used = 0
+
+    def hexdigest(self):
+        """Return the digest of the bytes added so far."""
+        if not self.block_size:
+            return self._hash.hexdigest()
+
+        blocks = list(self._blocks)
+        if self._block_used:
+            blocks.append(self._hash.digest())
+        res = hashlib.new(self.combine, b"".join(blocks)).hexdigest()
+        if self.count_suffix:
+            res = "{}-{}".format(res, len(blocks))
+        return res
+
+
+def s3_etag_hasher(part_size=None):
+    """Return a hasher for an S3 ETag. Multipart uploads need the size of their parts."""
+    if part_size:
+        return ContentHasher("md5", block_size=part_size, count_suffix=True)
+    return ContentHasher("md5")
+
+
+def dropbox_hasher():
+    """Return a hasher for a Dropbox content_hash."""
+    return ContentHasher("sha256", block_size=4 * 1024 * 1024)
+
+
+def evidence_path(dest_dir, info):
+    """
+    Return the local path a copy of a found file is saved to.
+
+    The name is prefixed with a key of the file id so files sharing a name don't
+    collide and an interrupted download is resumed into the same file.
+    """
+    key = hashlib.sha1(str(info.file_id).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(dest_dir, "{}_{}".format(key, os.path.basename(str(info.name))))
+
+
+def _preallocate(f, size):
+    """Reserve the full size of the file up front."""
+    if not size:
+        return
+    try:
+        os.posix_fallocate(f.fileno(), 0, size)
+    except (AttributeError, OSError):
+        f.truncate(size)
+
+
+class _PartialFile:
+    """Preallocated partial copy of a file and the record of the bytes already written."""
+
+    def __init__(self, f_path, size, identity, chunk_size):
+        self.f_path = f_path
+        self.part_path = f_path + PARTIAL_SUFFIX
+        self.state_path = f_path + STATE_SUFFIX
+        self.size = size
+        self.identity = identity
+        self.chunk_size = chunk_size
+        self.done = set()
+        self.offset = 0
+        self._lock = threading.Lock()
+
+    def open(self):
+        """Resume a matching partial copy or preallocate a new one."""
+        state = None
+        if os.path.exists(self.part_path):
+            try:
+                with open(self.state_path) as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                state = None
+
+        if (state and state.get("size") == self.size and state.get("identity") == self.identity and
+                state.get("chunk_size") == self.chunk_size):
+            self.done = set(state.get("done", []))
+            self.offset = state.get("offset", 0)
+            logger.info("Resuming download of {} with {} of {} bytes written".format(
+                self.f_path, self.written(), self.size))
+            return
+
+        with open(self.part_path, 'wb') as f:
+            _preallocate(f, self.size)
+        self.done = set()
+        self.offset = 0
+        self.save()
+
+    def written(self):
+        """Return the number of bytes recorded as written."""
+        if self.chunk_size:
+            return sum(min(self.chunk_size, self.size - i * self.chunk_size) for i in self.done)
+        return self.offset
+
+    def save(self):
+        """Atomically record the progress."""
+        with self._lock:
+            state = {"size": self.size,
+                     "identity": self.identity,
+                     "chunk_size": self.chunk_size,
+                     "done": sorted(self.done),
+                     "offset": self.offset}
+            temp_path = self.state_path + ".tmp"
+            with open(temp_path, 'w') as f:
+                json.dump(state, f)
+            os.replace(temp_path, self.state_path)
+
+    def hash_range(self, hasher, start, end):
+        """Feed a written range of the partial copy to a hasher."""
+        if hasher is None or start >= end:
+            return
+        with open(self.part_path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start
+            while remaining:
+                data = f.read(min(_READ_SIZE, remaining))
+                if not data:
+                    raise IOError("Partial copy {} is shorter than recorded".format(self.part_path))
+                hasher.update(data)
+                remaining -= len(data)
+
+    def discard(self):
+        """Remove the partial copy and its progress record."""
+        for path in (self.part_path, self.state_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def complete(self, hasher=None, expected=None):
+        """Verify the copy and move it into place."""
+        if hasher is not None and expected:
+            actual = hasher.hexdigest()
+            if actual.lower() != expected.strip('"').lower():
+                self.discard()
+                raise VerificationError("Downloaded copy of {} has hash {} instead of {}".format(
+                    self.f_path, actual, expected))
+        os.replace(self.part_path, self.f_path)
+        try:
+            os.remove(self.state_path)
+        except OSError:
+            pass
+
+
+def download_ranges(f_path, size, fetch_range, hasher=None, expected=None, identity=None,
+                    chunk_size=DEFAULT_CHUNK_SIZE, workers=DEFAULT_WORKERS):
+    """
+    Download a file with parallel ranged requests, resuming any partial copy.
+
+    Args:
+        f_path (str): Local path of the finished copy.
+        size (int): Size of the file in bytes.
+        fetch_range (func): Called with (start, end) returning an iterable of the bytes
+                            within the range. end is exclusive.
+        hasher (ContentHasher): <Optional> Hasher for the hash reported by the service.
+        expected (str): <Optional> Hash reported by the service. The copy isn't verified without it.
+        identity (str): <Optional> Version of the file, such as its hash. A partial copy of
+                        another version is discarded.
+        chunk_size (int): <Optional> Bytes requested per range.
+        workers (int): <Optional> Ranges downloaded at once.
+
+    Returns:
+        Local path of the finished copy.
+
+    Raises:
+        VerificationError: The copy doesn't match the expected hash.
+    """
+    chunk_size = max(1, int(chunk_size))
+    partial = _PartialFile(f_path, size, identity, chunk_size)
+    partial.open()
+
+    count = (size + chunk_size - 1) // chunk_size
+    todo = [i for i in range(count) if i not in partial.done]
+
+    def fetch(index):
+        start = index * chunk_size
+        end = min(size, start + chunk_size)
+        for attempt in range(RANGE_ATTEMPTS):
+            try:
+                offset = start
+                with open(partial.part_path, 'r+b') as f:
+                    f.seek(start)
+                    for data in fetch_range(start, end):
+                        f.write(data)
+                        offset += len(data)
+                if offset != end:
+                    raise IOError("Range {}-{} returned {} bytes".format(start, end, offset - start))
+                return index
+            except Exception as ex:
+                if attempt + 1 == RANGE_ATTEMPTS:
+                    raise
+                logger.warning("Retrying range {}-{} of {}. {}".format(start, end, f_path, ex))
+
+    # Hash the file in order as the ranges ahead of the hashing frontier complete
+    frontier = 0
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            pending = set(pool.submit(fetch, i) for i in todo)
+            while True:
+                while frontier < count and frontier in partial.done:
+                    partial.hash_range(hasher, frontier * chunk_size,
+                                       min(size, (frontier + 1) * chunk_size))
+                    frontier += 1
+                if not pending:
+                    break
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                failed = None
+                for fut in finished:
+                    if fut.exception() is None:
+                        partial.done.add(fut.result())
+                    else:
+                        failed = fut
+                partial.save()
+                if failed is not None:
+                    for fut in pending:
+                        fut.cancel()
+                    failed.result()
+    except BaseException:
+        partial.save()
+        raise
+
+    partial.complete(hasher, expected)
+    return f_path
+
+
+def download_stream(f_path, size, fetch_stream, hasher=None, expected=None, identity=None):
+    """
+    Download a file as a single sequential stream, resuming any partial copy.
+
+    Args:
+        f_path (str): Local path of the finished copy.
+        size (int): Size of the file in bytes.
+        fetch_stream (func): Called with the offset to start from, returning an iterable of
+                             the remaining bytes of the file.
+        hasher (ContentHasher): <Optional> Hasher for the hash reported by the service.
+        expected (str): <Optional> Hash reported by the service. The copy isn't verified without it.
+        identity (str): <Optional> Version of the file. A partial copy of another version is discarded.
+
+    Returns:
+        Local path of the finished copy.
+
+    Raises:
+        VerificationError: The copy doesn't match the expected hash.
+    """
+    partial = _PartialFile(f_path, size, identity, None)
+    partial.open()
+    # The bytes already written are hashed before the rest of the stream
+    partial.hash_range(hasher, 0, partial.offset)
+
+    attempt = 0
+    while partial.offset < size:
+        saved = partial.offset
+        try:
+            with open(partial.part_path, 'r+b') as f:
+                f.seek(partial.offset)
+                for data in fetch_stream(partial.offset):
+                    data = data[:size - partial.offset]
+                    f.write(data)
+                    if hasher is not None:
+                        hasher.update(data)
+                    partial.offset += len(data)
+                    if partial.offset - saved >= STREAM_STATE_INTERVAL:
+                        f.flush()
+                        partial.save()
+                        saved = partial.offset
+                    if partial.offset >= size:
+                        break
+            if partial.offset < size:
+                raise IOError("Stream ended after {} of {} bytes".format(partial.offset, size))
+        except Exception as ex:
+            partial.save()
+            attempt += 1
+            if attempt >= RANGE_ATTEMPTS:
+                raise
+            # The hasher has seen exactly the bytes written, so the stream picks up from there
+            logger.warning("Resuming stream of {} at {} bytes. {}".format(f_path, partial.offset, ex))
+
+    partial.complete(hasher, expected)
+    return f_path